@@ -1,11 +1,13 @@
 #define PY_SSIZE_T_CLEAN  // Fix for 'y#' format in PyArg_ParseTuple
 #include <Python.h>
+#include <vector>
 #include "source/jpgwrapper.h"  // your JPEG conversion functions
 
 // Example wrapper for ConvertToJpg (you should adjust parameters as needed)
 static PyObject* py_compress_bgra_to_jpeg(PyObject* self, PyObject* args) {
     const char* inputBuffer;
-    int inputLength, width, height, quality;
+    Py_ssize_t inputLength;  // y# writes a Py_ssize_t under PY_SSIZE_T_CLEAN
+    int width, height, quality;
     int bottomUp = 0;  // Default value (False = top-down)
     int progressive = 0;  // Default: sequential JPEG
     int optimize_coding = 0;  // Default: use default Huffman tables
@@ -129,11 +131,103 @@ static PyObject* py_compress_bgra_to_jpeg(PyObject* self, PyObject* args) {
     return result;
 }
 
+// Batched wrapper around ConvertPyramidToJpg: encodes every mip level of a pyramid with one compressor.
+static PyObject* py_compress_bgra_pyramid_to_jpeg(PyObject* self, PyObject* args) {
+    PyObject* levelsObj;
+    int quality;
+    int progressive = 0;  // Default: sequential JPEG
+    int optimize_coding = 0;  // Default: use default Huffman tables
+    int relocate_sof = 1;  // Default: move SOF before SOS as BLP1 expects
+
+    if (!PyArg_ParseTuple(args, "Oi|ppp", &levelsObj, &quality, &progressive, &optimize_coding, &relocate_sof)) {
+        return NULL;
+    }
+
+    PyObject* levelsSeq = PySequence_Fast(levelsObj, "levels must be a sequence of (buffer, width, height) tuples");
+    if (levelsSeq == NULL) {
+        return NULL;
+    }
+    Py_ssize_t numLevels = PySequence_Fast_GET_SIZE(levelsSeq);
+
+    // Acquire every level buffer up front; the buffers stay pinned while the GIL is released.
+    std::vector<Py_buffer> views(numLevels);
+    std::vector<Buffer> sources(numLevels);
+    std::vector<Buffer> targets(numLevels);
+    std::vector<int> widths(numLevels);
+    std::vector<int> heights(numLevels);
+    Py_ssize_t acquired = 0;
+    bool valid = true;
+    for (Py_ssize_t i = 0; i < numLevels; i++) {
+        PyObject* item = PySequence_Fast_GET_ITEM(levelsSeq, i);
+        if (!PyArg_ParseTuple(item, "y*ii", &views[i], &widths[i], &heights[i])) {
+            valid = false;
+            break;
+        }
+        acquired++;
+        if (widths[i] <= 0 || heights[i] <= 0 || views[i].len < (Py_ssize_t)widths[i] * heights[i] * 4) {
+            PyErr_Format(PyExc_ValueError,
+                "Level %zd buffer is too small for a %dx%d BGRA8 image", i, widths[i], heights[i]);
+            valid = false;
+            break;
+        }
+        sources[i].buf = static_cast<char*>(views[i].buf);
+        sources[i].length = (unsigned long)views[i].len;
+    }
+
+    bool success = false;
+    if (valid && numLevels > 0) {
+        Py_BEGIN_ALLOW_THREADS
+        success = ConvertPyramidToJpg(sources.data(), targets.data(), widths.data(), heights.data(), (int)numLevels,
+            4, quality, progressive, optimize_coding, relocate_sof);
+        Py_END_ALLOW_THREADS
+    }
+    for (Py_ssize_t i = 0; i < acquired; i++) {
+        PyBuffer_Release(&views[i]);
+    }
+    Py_DECREF(levelsSeq);
+
+    if (!valid) {
+        return NULL;
+    }
+    PyObject* result = PyList_New(numLevels);
+    if (result == NULL) {
+        for (Py_ssize_t i = 0; i < numLevels; i++) {
+            delete[] targets[i].buf;
+        }
+        return NULL;
+    }
+    if (numLevels > 0 && !success) {
+        Py_DECREF(result);
+        PyErr_SetString(PyExc_RuntimeError, "JPEG compression failed.");
+        return NULL;
+    }
+
+    // Convert to Python bytes objects and free allocated memory
+    for (Py_ssize_t i = 0; i < numLevels; i++) {
+        PyObject* levelBytes = PyBytes_FromStringAndSize(targets[i].buf, targets[i].length);
+        delete[] targets[i].buf;
+        targets[i].buf = 0;
+        if (levelBytes == NULL) {
+            for (Py_ssize_t j = i + 1; j < numLevels; j++) {
+                delete[] targets[j].buf;
+            }
+            Py_DECREF(result);
+            return NULL;
+        }
+        PyList_SET_ITEM(result, i, levelBytes);
+    }
+    return result;
+}
+
 // Define the methods exported by this module.
 static PyMethodDef jpgwrapperMethods[] = {
     {"compress_bgra_to_jpeg", py_compress_bgra_to_jpeg, METH_VARARGS,
      "Compress a BGRA8 image into JPEG bytes.\n"
      "Arguments: image_buffer (bytes), buffer_length, width, height, quality, progressive, optimize_coding, customDCObj (bytes), customACObj (bytes)"},
+    {"compress_bgra_pyramid_to_jpeg", py_compress_bgra_pyramid_to_jpeg, METH_VARARGS,
+     "Compress every level of a BGRA8 mip pyramid into JPEG bytes with one compressor, without holding the GIL.\n"
+     "Arguments: levels (sequence of (buffer, width, height)), quality, progressive, optimize_coding, relocate_sof (default True)\n"
+     "Returns: list of JPEG bytes, one per level, with SOF moved before SOS when relocate_sof is set"},
     {NULL, NULL, 0, NULL}  // Sentinel
 };
 
@@ -94,6 +94,8 @@ typedef struct {
 
 typedef returnctrl_error_mgr* return_error_ptr;
 
+#define NUM_SOF_SEGMENTS_MAX 16
+
 METHODDEF(void) return_error_exit(j_common_ptr cinfo)
 {
   return_error_ptr myerr = (return_error_ptr)cinfo->err;
@@ -203,6 +205,169 @@ GLOBAL(bool)ConvertToJpg(Buffer &source, Buffer &target, int width, int height,
 	return true;
 }
 
+GLOBAL(bool)MoveSofBeforeSos(Buffer &jpeg)
+{
+	// Same layout change as move_sof_before_sos in blp1_JPEG_encoder.py:
+	// SOF0/SOF2 segments are held back and written right before the first SOS.
+	unsigned char *src = (unsigned char*)jpeg.buf;
+	unsigned long len = jpeg.length;
+	if (len < 2 || src[0] != 0xFF || src[1] != 0xD8) {
+		return false;
+	}
+	char *out = new char[len];
+	unsigned long outLen = 0;
+	unsigned long sofStart[NUM_SOF_SEGMENTS_MAX];
+	unsigned long sofLength[NUM_SOF_SEGMENTS_MAX];
+	int numSof = 0;
+	out[outLen++] = (char)src[0];
+	out[outLen++] = (char)src[1];
+	unsigned long pos = 2;
+	while (pos < len) {
+		if (src[pos] != 0xFF) {
+			pos += 1;
+			continue;
+		}
+		if (pos + 2 > len) {
+			break;
+		}
+		unsigned long markerStart = pos;
+		unsigned char marker = src[pos + 1];
+		pos += 2;
+		// End-of-Image (EOI) marker: append and stop.
+		if (marker == 0xD9) {
+			out[outLen++] = (char)0xFF;
+			out[outLen++] = (char)marker;
+			break;
+		}
+		// Markers without a length field (TEM, RST0-RST7).
+		if (marker == 0x01 || (marker >= 0xD0 && marker <= 0xD7)) {
+			out[outLen++] = (char)0xFF;
+			out[outLen++] = (char)marker;
+			continue;
+		}
+		if (pos + 2 > len) {
+			break;
+		}
+		unsigned long segLength = ((unsigned long)src[pos] << 8) | src[pos + 1];
+		unsigned long segmentEnd = pos + segLength;
+		if (segmentEnd > len) {
+			segmentEnd = len;
+		}
+		if (marker == 0xDA) {
+			for (int i = 0; i < numSof; i++) {
+				memcpy(&out[outLen], &src[sofStart[i]], sofLength[i]);
+				outLen += sofLength[i];
+			}
+			numSof = 0;
+			// SOS header plus the remaining scan data as is.
+			memcpy(&out[outLen], &src[markerStart], len - markerStart);
+			outLen += len - markerStart;
+			break;
+		}
+		if ((marker == 0xC0 || marker == 0xC2) && numSof < NUM_SOF_SEGMENTS_MAX) {
+			sofStart[numSof] = markerStart;
+			sofLength[numSof] = segmentEnd - markerStart;
+			numSof++;
+		} else {
+			memcpy(&out[outLen], &src[markerStart], segmentEnd - markerStart);
+			outLen += segmentEnd - markerStart;
+		}
+		pos = segmentEnd;
+	}
+	delete[] jpeg.buf;
+	jpeg.buf = out;
+	jpeg.length = outLen;
+	return true;
+}
+
+GLOBAL(bool)ConvertPyramidToJpg(const Buffer* sources, Buffer* targets,
+	const int* widths, const int* heights, int numLevels,
+	int bytespp, int quality, bool progressive, bool optimize_coding,
+	bool relocateSof)
+{
+	// One compressor and one scratch buffer (sized for the largest level) serve the whole pyramid.
+	// Nothing here touches Python objects, so the caller may run it without the GIL.
+	int numBytes = 0;
+	unsigned long dummySize = 10000;
+	for (int i = 0; i < numLevels; i++) {
+		unsigned long levelSize = ((unsigned long)widths[i] * heights[i] * 4) * 2 + 10000;
+		if (levelSize > dummySize) {
+			dummySize = levelSize;
+		}
+		targets[i].buf = 0;
+		targets[i].length = 0;
+	}
+	char *storage = new char[dummySize];
+	struct jpeg_compress_struct cinfo;
+	returnctrl_error_mgr jerr;
+	JSAMPROW row_pointer[1];
+	volatile int level = 0;
+	cinfo.err = jpeg_std_error(&jerr.pub);
+	jerr.pub.error_exit = return_error_exit;
+	if (setjmp(jerr.setjmp_buffer)) { // return_error_exit returns here
+		jpeg_destroy_compress(&cinfo); // cleanup
+		delete[] storage;
+		for (int i = 0; i < numLevels; i++) {
+			delete[] targets[i].buf;
+			targets[i].buf = 0;
+			targets[i].length = 0;
+		}
+		return false;
+	}
+
+	jpeg_create_compress(&cinfo);
+	for (level = 0; level < numLevels; level++) {
+		const Buffer &source = sources[level];
+		int width = widths[level];
+		int height = heights[level];
+		int stride = width * bytespp;
+		numBytes = 0;
+		jpeg_memory_dest(&cinfo, (JOCTET*)storage, (int)dummySize, &numBytes);
+		cinfo.image_width = width;
+		cinfo.image_height = height;
+		cinfo.input_components = bytespp;
+		cinfo.in_color_space = JCS_UNKNOWN;
+		jpeg_set_defaults(&cinfo);
+		jpeg_set_quality(&cinfo, quality, TRUE);
+		if (progressive) {
+			jpeg_simple_progression(&cinfo);  // Enable progressive JPEG mode
+		}
+		if (optimize_coding) {
+			cinfo.optimize_coding = TRUE;
+		}
+		jpeg_start_compress(&cinfo, TRUE);
+		while (cinfo.next_scanline < cinfo.image_height) {
+			row_pointer[0] = (JSAMPLE*)&source.buf[cinfo.next_scanline * stride];
+			(void)jpeg_write_scanlines(&cinfo, row_pointer, 1);
+		}
+		jpeg_finish_compress(&cinfo);
+
+		if (numBytes <= 0) {
+			break;
+		}
+		Buffer &target = targets[level];
+		target.buf = new char[numBytes];
+		target.length = numBytes;
+		memcpy(target.buf, storage, numBytes);
+		if (relocateSof) {
+			MoveSofBeforeSos(target);
+		}
+	}
+	jpeg_destroy_compress(&cinfo); // cleanup
+	delete[] storage;
+
+	if (level < numLevels) {
+		fprintf(stderr, "Conversion to jpg failed ...");
+		for (int i = 0; i < numLevels; i++) {
+			delete[] targets[i].buf;
+			targets[i].buf = 0;
+			targets[i].length = 0;
+		}
+		return false;
+	}
+	return true;
+}
+
 GLOBAL(bool)DecompressJpg(Buffer &source, Buffer &target, int &width, int &height, int &bytespp)
 {
 	struct jpeg_decompress_struct cinfo;
@@ -14,6 +14,13 @@
 		const JHUFF_TBL* customDcTables, int numDcTables,
 		const JHUFF_TBL* customAcTables, int numAcTables);
 	
+	GLOBAL(bool) ConvertPyramidToJpg(const Buffer* sources, Buffer* targets,
+		const int* widths, const int* heights, int numLevels,
+		int bytespp, int quality, bool progressive, bool optimize_coding,
+		bool relocateSof);
+
+	GLOBAL(bool) MoveSofBeforeSos(Buffer &jpeg);
+	
 	GLOBAL(bool) DecompressJpg(Buffer &source, Buffer &target,
 		int &width, int &height, int &bytespp);
 #endif
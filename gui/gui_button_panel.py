@@ -6,7 +6,9 @@ import vars.sizes as cs
 from gui.gui_tooltip import HoverOverlay
 from gui.gui_browse_output import gui_browse_output
 
-from src.generator import generate_images
+from src.generator import generate_profiles
+from src.async_generator import run_generation_async
+from src.profiles import build_profile_selections
 from src.localisation import get_local_text
 from src.localisation import get_tooltip_text
 
@@ -20,10 +22,30 @@ class ButtonClass:
 
     def run_generation(self,input_data):
         # Run your long-running process in the background
-        generate_images(input_data,self.parent)
+        run_generation_async(input_data,self.parent)
         # Optionally, use wx.CallAfter to update GUI when done:
         wx.CallAfter(self.after_generation)
 
+    def run_profiles_generation(self,runs):
+        generate_profiles(runs,self.parent,control=self.parent.current_selection)
+        wx.CallAfter(self.after_generation)
+
+    def on_generate_profiles(self, profiles):
+        """Generates the current inputs once for each of the profiles (see src/profiles.py)."""
+        if not self.parent.current_selection.paths:
+            wx.MessageBox(get_local_text("message_window_generate_warning_no_image"), get_local_text("message_window_generate_warning_no_image_title"), wx.OK | wx.ICON_WARNING)
+            self.parent.log_ctrl.log("output_no_image_warning")
+            return
+        try:
+            runs = build_profile_selections(self.parent.current_selection, profiles)
+        except ValueError as e:
+            wx.MessageBox(str(e), get_local_text("dialog_run_profiles_title"), wx.OK | wx.ICON_WARNING)
+            return
+        self.parent.generation_start=True
+        self.button_list['btn_stop'].Enable(True)
+        self.parent.update_generation_state()
+        threading.Thread(target=self.run_profiles_generation, args=(runs,), daemon=True).start()
+
     def on_save_image(self, event):
         if not self.parent.current_selection.paths:
             wx.MessageBox(get_local_text("message_window_generate_warning_no_image"), get_local_text("message_window_generate_warning_no_image_title"), wx.OK | wx.ICON_WARNING)
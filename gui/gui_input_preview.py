@@ -1,14 +1,17 @@
 import wx
 import os
 import math
+import threading
 from PIL import Image
 
 import vars.global_var as gv
 import vars.sizes as cs
 
 from src.localisation import get_local_text
-from gui.gui_file_systems import load_pil_image_wxmessagebox
+from src.converter import load_pil_thumbnail
 from gui.gui_file_systems import pil_image_to_wx
+from src.preview_cache import CELL_CACHE, input_identity
+from src.disk_cache import read_thumbnail, write_thumbnail
 
 def get_folder_text_lines(dc, folder_path, max_width):
     """
@@ -162,7 +165,13 @@ class PreviewDropTarget(wx.FileDropTarget):
         return True
 
 class InputImagePanel(wx.Panel):
-    """Custom panel that acts as an image preview area with drag-and-drop support."""
+    """
+    Custom panel that acts as an image preview area with drag-and-drop support.
+
+    Thumbnails are decoded at reduced size by a background worker and painted as
+    they arrive; placeholders are shown until then. Each selection gets a new
+    generation number, so a change of selection abandons the thumbnails of the old one.
+    """
     def __init__(self, parent, size, *args, **kwargs):
         super().__init__(parent, size=size, *args, **kwargs)
         self.SetMinSize(size)
@@ -177,6 +186,11 @@ class InputImagePanel(wx.Panel):
         # Image preview variables
         self.preview_bitmap = None
         self.default_text = get_local_text("images_input_click_to_open")
+        # Background thumbnail loader
+        self.thumbnail_generation = 0
+        self.thumbnail_request = None
+        self.thumbnail_wakeup = threading.Condition()
+        self.thumbnail_worker = None
         
         # Bind painting and click events to the main panel
         self.Bind(wx.EVT_PAINT, self.on_paint)
@@ -237,28 +251,87 @@ class InputImagePanel(wx.Panel):
         num_folders = len(folders)
         num_images = len(images)
         num_items = num_folders+num_images
-        # Try load pictures from 'images' list
+        # Any thumbnails still loading belong to the previous selection.
+        self.thumbnail_generation += 1
+        # Thumbnails of the 'images' list are loaded in the background; None marks a placeholder.
         if images:
-            success = True
             num_show_images = max(gv.INPUT_IMAGES_MAXNUM - num_folders, 0)
-            loaded_images_pil = []
-            for path in images[:num_show_images]:
-                pil_image = load_pil_image_wxmessagebox(path=path)
-                success = bool(pil_image)
-                if success:
-                    loaded_images_pil.append(pil_image)
-                else:
-                    failed_image_pil=path
-                    break
-            if not(success):
-                raise ValueError(failed_image_pil)
-            self.current_selection.loaded_images_pillow = loaded_images_pil
+            paths = images[:num_show_images]
+            self.current_selection.loaded_images_pillow = [None] * len(paths)
+            self.request_thumbnails(paths, self.get_grid_cell_size(num_items))
 
         if num_items <= gv.INPUT_IMAGES_MAXNUM:
             self.show_images_grid_preview()
         else:
             self.show_images_text_preview()
 
+    def get_grid_cell_size(self, num_items: int) -> tuple:
+        """Size of one cell of the N x N preview grid for num_items items."""
+        max_items = max(1, min(num_items, gv.INPUT_IMAGES_MAXNUM))
+        grid_size = math.ceil(math.sqrt(max_items))
+        preview_w, preview_h = cs.IMAGE_PREVIEW_SIZE
+        return (preview_w // grid_size, preview_h // grid_size)
+
+    def request_thumbnails(self, paths: list, cell_size: tuple):
+        """Hands the thumbnails of the current selection to the worker thread."""
+        with self.thumbnail_wakeup:
+            self.thumbnail_request = (self.thumbnail_generation, list(paths), cell_size)
+            self.thumbnail_wakeup.notify()
+        if self.thumbnail_worker is None:
+            self.thumbnail_worker = threading.Thread(target=self.thumbnail_worker_loop, daemon=True)
+            self.thumbnail_worker.start()
+
+    def thumbnail_worker_loop(self):
+        """Runs on the worker thread: loads the thumbnails of the latest request one by one."""
+        while True:
+            with self.thumbnail_wakeup:
+                while self.thumbnail_request is None:
+                    self.thumbnail_wakeup.wait()
+                generation, paths, cell_size = self.thumbnail_request
+                self.thumbnail_request = None
+            for index, path in enumerate(paths):
+                if generation != self.thumbnail_generation:
+                    break
+                try:
+                    thumbnail = self.get_thumbnail(path, cell_size)
+                except Exception as e:
+                    wx.CallAfter(self.on_thumbnail_failed, generation, path, e)
+                    break
+                wx.CallAfter(self.on_thumbnail_loaded, generation, index, thumbnail)
+
+    def get_thumbnail(self, path: str, cell_size: tuple) -> Image.Image:
+        """
+        Cell-sized RGBA thumbnail of path, shared via CELL_CACHE and kept in the disk cache
+        between runs; the file is only decoded (at reduced size) if neither has it.
+        """
+        sub_w, sub_h = cell_size
+        identity = input_identity(path)
+        thumbnail_key = ("thumbnail", identity, sub_w, sub_h)
+        thumbnail = CELL_CACHE.get(thumbnail_key)
+        if thumbnail is None:
+            thumbnail = read_thumbnail(identity, cell_size)
+            if thumbnail is None:
+                thumbnail = self.fit_center_transparent(load_pil_thumbnail(path, cell_size), sub_w, sub_h)
+                write_thumbnail(identity, cell_size, thumbnail)
+            CELL_CACHE.put(thumbnail_key, thumbnail)
+        return thumbnail
+
+    def on_thumbnail_loaded(self, generation: int, index: int, thumbnail: Image.Image):
+        """Main thread: fills in one placeholder, unless the selection has changed meanwhile."""
+        if generation != self.thumbnail_generation:
+            return
+        self.current_selection.loaded_images_pillow[index] = thumbnail
+        if len(self.current_selection.paths_items) <= gv.INPUT_IMAGES_MAXNUM:
+            self.show_images_grid_preview()
+
+    def on_thumbnail_failed(self, generation: int, path: str, error: Exception):
+        """Main thread: an image of the current selection cannot be loaded, so the selection is dropped."""
+        if generation != self.thumbnail_generation:
+            return
+        wx.MessageBox( get_local_text("message_window_load_error").format(path,str(error)), get_local_text("message_window_load_error_title"), wx.OK | wx.ICON_ERROR)
+        self.close_image_folder()
+        self.logstream("input_image_error",path)
+
     def on_resize(self, event):
         """Ensure the overlay panel always covers the entire main panel."""
         self.overlay_panel.SetSize(self.GetSize())
@@ -326,6 +399,7 @@ class InputImagePanel(wx.Panel):
             self.user_input_init(images=paths)
 
     def close_image_folder(self):
+        self.thumbnail_generation += 1
         current_selection = self.top_parent.current_selection
         current_selection.clearinputs()
         self.preview_bitmap = None
@@ -364,6 +438,18 @@ class InputImagePanel(wx.Panel):
 
 
 
+    def create_placeholder_bitmap(self, width: int, height: int):
+        """Grey frame drawn in a grid cell while its thumbnail is still loading."""
+        bmp = wx.Bitmap(width, height)
+        mem_dc = wx.MemoryDC(bmp)
+        mem_dc.SetBackground(wx.Brush(self.GetBackgroundColour()))
+        mem_dc.Clear()
+        mem_dc.SetPen(wx.Pen(wx.Colour(192, 192, 192)))
+        mem_dc.SetBrush(wx.Brush(wx.Colour(232, 232, 232)))
+        mem_dc.DrawRectangle(2, 2, width - 4, height - 4)
+        mem_dc.SelectObject(wx.NullBitmap)
+        return bmp
+
     # Updated show_images_grid_preview.
     def show_images_grid_preview(self):
         """
@@ -399,10 +485,13 @@ class InputImagePanel(wx.Panel):
             if os.path.isdir(path) and path in folders:
                 bmp_img = generate_folder_icon(path, sub_w, sub_h)
             elif os.path.isfile(path) and path in images:
-                image = images_pillow[j]
-                img_scaled =  self.fit_center_transparent(image, sub_w, sub_h)
-                wx_image = pil_image_to_wx(img_scaled)
-                bmp_img = wx.Bitmap(wx_image)
+                image = images_pillow[j] if j < len(images_pillow) else None
+                if image is None:
+                    bmp_img = self.create_placeholder_bitmap(sub_w, sub_h)
+                else:
+                    # Thumbnails are already fitted to the cell by the loader.
+                    wx_image = pil_image_to_wx(image)
+                    bmp_img = wx.Bitmap(wx_image)
                 j += 1
             else:
                 self.logstream("input_preview_error",path, "")
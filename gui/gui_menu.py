@@ -4,6 +4,7 @@ import src.config_manager as config_manager
 from gui.gui_about import AboutDialog
 from gui.gui_menu_customframes import CustomFramesMenu
 from src.localisation import update_localisation,get_local_text
+from src.profiles import list_profiles
 from src.system import get_data_subdir
 import vars.global_var as gv
 
@@ -18,6 +19,8 @@ class TopMenu:
         enabled=bool(self.parent.button_list['btn_convert'].IsEnabled())
         self.update_menu_file_item(wx.ID_SAVE,enabled)
 
+        self.update_menu_file_item(self.run_profiles_item_id,enabled)
+
         # Abort Processing menu option synched with Abort Button
         enabled=bool(self.parent.button_list['btn_stop'].IsEnabled())
         self.update_menu_file_item(wx.ID_ABORT,enabled)
@@ -38,6 +41,18 @@ class TopMenu:
     def on_file_run_processing_item(self,event):
         self.parent.btn_pannel.on_save_image(event)
 
+    def on_file_run_profiles_item(self,event):
+        profile_codes = list_profiles()
+        dialog = wx.MultiChoiceDialog(self.parent,
+                                      get_local_text("dialog_run_profiles_message").replace('\\n', '\n'),
+                                      get_local_text("dialog_run_profiles_title"),
+                                      [get_local_text(code) for code in profile_codes])
+        if dialog.ShowModal() == wx.ID_OK:
+            profiles = [profile_codes[index] for index in dialog.GetSelections()]
+            if profiles:
+                self.parent.btn_pannel.on_generate_profiles(profiles)
+        dialog.Destroy()
+
     def on_file_abort_processing_item(self,event):
         self.parent.btn_pannel.on_abort_generation(event)
 
@@ -220,6 +235,12 @@ class TopMenu:
         self.menu_bar.Bind(wx.EVT_MENU, self.on_file_run_processing_item, run_processing_item)
         run_processing_item.Enable(False)
 
+        # Run Processing with Profiles
+        run_profiles_item = file_menu.Append(wx.NewId(), get_local_text("menu_run_profiles"))
+        self.run_profiles_item_id = run_profiles_item.GetId()
+        self.menu_bar.Bind(wx.EVT_MENU, self.on_file_run_profiles_item, run_profiles_item)
+        run_profiles_item.Enable(False)
+
         # Abort Processing
         abort_processing_item = file_menu.Append(wx.ID_ABORT, get_local_text("menu_abort_processing"))
         self.menu_bar.Bind(wx.EVT_MENU, self.on_file_abort_processing_item, abort_processing_item)
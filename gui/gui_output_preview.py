@@ -6,14 +6,18 @@ from PIL import Image
 import vars.global_var as gv
 import vars.sizes as cs
 
-from src.converter import load_pil_image
 from src.converter import apply_frame
-from src.converter import apply_format
-from src.converter import bufferbytedata_to_pilimage
+from src.converter import apply_format_preview
+from src.budget_options import get_budget
+from src.preview_cache import CELL_CACHE, get_source_image, get_reduced_source_image, input_identity, freeze_options, preview_format_options
 from gui.gui_file_systems import pil_image_to_wx
 from src.localisation import get_local_text
 
 
+class PreviewCancelled(Exception):
+    """Raised inside the preview worker when a newer request supersedes the one in progress."""
+
+
 class OutputPreviewImage(wx.Panel):
     """
     A panel to display the output preview images.
@@ -27,6 +31,12 @@ class OutputPreviewImage(wx.Panel):
          c) If more than gv.INPUT_IMAGES_MAXNUM+1 images are selected, the first gv.INPUT_IMAGES_MAXNUM
             lines show the options and the final line shows "and M more".
     3) The panel is cleared/updated as input changes.
+
+    Grid previews are rendered by one persistent worker thread. Every request gets a
+    generation number; the worker only keeps the latest request, stops at the next
+    stage boundary once its generation is outdated, and results are shown only if
+    they are still current. Bursts of option changes are debounced by
+    gv.PREVIEW_DEBOUNCE_MS before a request is made.
     """
     def __init__(self, parent, size, *args, **kwargs):
         super().__init__(parent, size=size, *args, **kwargs)
@@ -36,6 +46,11 @@ class OutputPreviewImage(wx.Panel):
         self.SetMaxSize(size)
         self.preview_bitmap = None
         self.default_text = get_local_text("images_output_no_preview_text")
+        self.preview_generation = 0
+        self.preview_request = None
+        self.preview_wakeup = threading.Condition()
+        self.preview_worker = None
+        self.preview_debounce_timer = None
         self.Bind(wx.EVT_PAINT, self.on_paint)
 
     def on_paint(self, event):
@@ -60,13 +75,27 @@ class OutputPreviewImage(wx.Panel):
     def update_preview(self):
         """
         Master function to update the output preview.
+        Requests are debounced: only the last one of a burst is processed by submit_preview.
+        """
+
+        if not(self.top_parent.state_updating_is_allowed):
+            return
+
+        if self.preview_debounce_timer is not None:
+            self.preview_debounce_timer.Stop()
+        self.preview_debounce_timer = wx.CallLater(gv.PREVIEW_DEBOUNCE_MS, self.submit_preview)
+
+    def submit_preview(self):
+        """
         If no images are selected or a folder is loaded, the preview is cleared.
         Otherwise, if the number of images is less than or equal to gv.INPUT_IMAGES_MAXNUM,
-        it displays a grid preview; otherwise, it displays a text preview.
+        it hands a grid preview request to the worker; otherwise, it displays a text preview.
+        Any render still in progress becomes outdated.
         """
-
+        self.preview_debounce_timer = None
         if not(self.top_parent.state_updating_is_allowed):
             return
+        self.preview_generation += 1
 
         current_selection = self.top_parent.current_selection
         # Clear preview if no images
@@ -81,14 +110,40 @@ class OutputPreviewImage(wx.Panel):
             return
 
         if total <= gv.OUTPUT_IMAGES_MAXNUM:
-            #self.show_output_images_grid_preview()
-            thread = threading.Thread(target=self.calculate_output_images_grid_preview)
+            # The options are read here, on the main thread; the worker only gets the snapshot.
+            request = self.gather_grid_preview_request()
+            with self.preview_wakeup:
+                self.preview_request = (self.preview_generation, request)
+                self.preview_wakeup.notify()
+            if self.preview_worker is None:
+                self.preview_worker = threading.Thread(target=self.preview_worker_loop, daemon=True)
+                self.preview_worker.start()
         else:
-            #self.show_output_images_text_preview()
-            thread = threading.Thread(target=self.show_output_images_text_preview)
-        thread.setDaemon(True)
-        thread.start()
+            self.show_output_images_text_preview()
 
+    def preview_worker_loop(self):
+        """Runs on the worker thread: renders the latest request, forever."""
+        while True:
+            with self.preview_wakeup:
+                while self.preview_request is None:
+                    self.preview_wakeup.wait()
+                generation, request = self.preview_request
+                self.preview_request = None
+            try:
+                images_finish = self.calculate_output_images_grid_preview(generation, request)
+            except PreviewCancelled:
+                continue
+            except Exception as e:
+                # Keep the worker alive, e.g. when an input cannot be decoded.
+                wx.CallAfter(self.logstream,"output_preview_error",", ".join(request["paths"]),e)
+                continue
+            # Update the preview on the main thread.
+            wx.CallAfter(self.update_images_grid_preview, images_finish, generation)
+
+    def check_preview_generation(self, generation: int):
+        """Stage boundary of the worker: gives up if a newer request was made."""
+        if generation != self.preview_generation:
+            raise PreviewCancelled()
 
     def fit_center_transparent(self, img: Image.Image, box_w: int, box_h: int) -> Image.Image:
         w, h = img.size
@@ -109,65 +164,105 @@ class OutputPreviewImage(wx.Panel):
         canvas.paste(resized, (x, y), resized)
         return canvas
 
-    def calculate_output_images_grid_preview(self):
+    def gather_grid_preview_request(self) -> dict:
+        """Snapshot of everything the grid preview needs from the current selection."""
+        current_selection = self.top_parent.current_selection
+        images_number = min(len(current_selection.paths), gv.OUTPUT_IMAGES_MAXNUM)
+        true_size_options, true_style_options, true_border_options, true_format_options = current_selection.recieve_true_variations()
+        # Get custom background option
+        custom_background_name = current_selection.get_value("CUSTOM_SECTION", "custom_background")
+        if custom_background_name is None:
+            custom_background_name = "None"
+        return {
+            "paths": list(current_selection.paths[:images_number]),
+            "max_images": min(images_number * current_selection.calculate_number_of_variations(), gv.OUTPUT_IMAGES_MAXNUM),
+            "true_size_options": true_size_options,
+            "true_style_options": true_style_options,
+            "true_border_options": true_border_options,
+            "true_format_options": true_format_options,
+            "format_suboption_dict": current_selection.recieve_suboptions([gv.DDS_SETTINGS, gv.BLP_SETTINGS,gv.TGA_SETTINGS]),
+            "extras_suboption_dict": current_selection.recieve_suboptions([gv.OPTIONS_EXTRAS]),
+            "misc_suboption_dict": current_selection.recieve_suboptions([gv.OPTIONS_MISC, gv.OPTIONS_CUSTOM_SIZE]),
+            "custom_background_name": custom_background_name,
+        }
+
+    def calculate_output_images_grid_preview(self, generation: int, request: dict) -> list:
         """
         Performs the heavy grid preview computation.
-        Runs on a background thread.
+        Runs on the worker thread; raises PreviewCancelled once the request is outdated.
         """
-        current_selection = self.top_parent.current_selection
-        if not current_selection.paths:
-            return
-
-        images_number = len(current_selection.paths)
-        images_number = min(images_number, gv.OUTPUT_IMAGES_MAXNUM)
-        paths = current_selection.paths[:images_number]
-        images_to_process = []
-        for path in paths:
-            image = load_pil_image(path=path)
-            images_to_process.append(image)
-            
+        paths = request["paths"]
         images_finish = []
-        # Determine the actual number of images and limit by gv.INPUT_IMAGES_MAXNUM.
-        max_images = images_number * current_selection.calculate_number_of_variations()
-        max_images = min(max_images, gv.OUTPUT_IMAGES_MAXNUM)
         # Compute the minimal grid dimension (N x N) to fully contain max_images.
-        grid_size = math.ceil(math.sqrt(max_images))
+        grid_size = math.ceil(math.sqrt(request["max_images"]))
         preview_w, preview_h = cs.IMAGE_PREVIEW_SIZE
         sub_w = preview_w // grid_size
         sub_h = preview_h // grid_size
 
         # Fixed placeholder options.
-        true_size_options, true_style_options, true_border_options, true_format_options = current_selection.recieve_true_variations()
-        format_suboption_dict = current_selection.recieve_suboptions([gv.DDS_SETTINGS, gv.BLP_SETTINGS,gv.TGA_SETTINGS])
-        extras_suboption_dict = current_selection.recieve_suboptions([gv.OPTIONS_EXTRAS])
-        misc_suboption_dict   = current_selection.recieve_suboptions([gv.OPTIONS_MISC, gv.OPTIONS_CUSTOM_SIZE])
-        # Get custom background option
-        custom_background_name = current_selection.get_value("CUSTOM_SECTION", "custom_background")
-        if custom_background_name is None:
-            custom_background_name = "None"
+        true_size_options = request["true_size_options"]
+        true_style_options = request["true_style_options"]
+        true_border_options = request["true_border_options"]
+        true_format_options = request["true_format_options"]
+        format_suboption_dict = request["format_suboption_dict"]
+        extras_suboption_dict = request["extras_suboption_dict"]
+        misc_suboption_dict   = request["misc_suboption_dict"]
+        custom_background_name = request["custom_background_name"]
+        # Frames are composited directly at cell resolution, unless a BLP size budget
+        # is set: its quality search only makes sense on the full-size output.
+        if get_budget(format_suboption_dict, "blp_size_budget") > 0 and "format_blp" in true_format_options:
+            fit_size = None
+        else:
+            fit_size = (sub_w, sub_h)
+
+        # Options shared by every cell of this request, in hashable form for the cache keys.
+        frame_options_key = (freeze_options(extras_suboption_dict), freeze_options(misc_suboption_dict), custom_background_name, fit_size, (sub_w, sub_h))
 
         j=0
 
         # Iterate over each image (up to max_images).
-        for i, image in enumerate(images_to_process):
-            path = paths[i]
+        for path in paths:
+            try:
+                identity = input_identity(path)
+            except Exception as e:
+                wx.CallAfter(self.logstream,"output_preview_error",path,e)
+                continue
+            # Decoded only if one of its cells is not cached yet.
+            image = None
+            source_size = None
             # Iterate over all True variants for apply_frame options.
             for size_option in true_size_options:
                 for style_option in true_style_options:
                     for border_option in true_border_options:
                         try:
-                            # Apply frame transformation with custom background.
-                            processed_img = apply_frame(image, size_option, style_option, border_option,extras_suboption_dict,misc_suboption_dict, custom_background_name)
+                            processed_img = None
                             # Now, for each available format option, further process the image.
                             for format_option in true_format_options:
-                                final_img = apply_format(processed_img, format_option,format_suboption_dict,True)
-                                final_img = bufferbytedata_to_pilimage(final_img,gv.OUTPUT_FILE_FORMATS[format_option])
-                                if size_option == gv.OPTION_SIZE_ORIGINAL or size_option == gv.OPTION_SIZE_CUSTOM:
-                                    # Вписываем в ячейку предпросмотра без искажения пропорций
-                                    final_img = self.fit_center_transparent(final_img, sub_w, sub_h)
-                                else:
-                                    # Старое поведение — растянуть в квадрат ячейки
-                                    final_img = final_img.resize((sub_w, sub_h), Image.LANCZOS)
+                                cell_key = (identity, size_option, style_option, border_option, format_option,
+                                            preview_format_options(format_option, format_suboption_dict), frame_options_key)
+                                final_img = CELL_CACHE.get(cell_key)
+                                if final_img is None:
+                                    if processed_img is None:
+                                        if image is None:
+                                            if fit_size:
+                                                # Reduced decode; the probed original size keeps size_original layouts exact.
+                                                cover_size = (sub_w * gv.PREVIEW_SOURCE_OVERSAMPLE, sub_h * gv.PREVIEW_SOURCE_OVERSAMPLE)
+                                                image, source_size = get_reduced_source_image(path, cover_size)
+                                            else:
+                                                image = get_source_image(path)
+                                            self.check_preview_generation(generation)
+                                        # Apply frame transformation with custom background.
+                                        processed_img = apply_frame(image, size_option, style_option, border_option,extras_suboption_dict,misc_suboption_dict, custom_background_name, fit_size, source_size)
+                                        self.check_preview_generation(generation)
+                                    final_img = apply_format_preview(processed_img, format_option,format_suboption_dict)
+                                    self.check_preview_generation(generation)
+                                    if size_option == gv.OPTION_SIZE_ORIGINAL or size_option == gv.OPTION_SIZE_CUSTOM:
+                                        # Вписываем в ячейку предпросмотра без искажения пропорций
+                                        final_img = self.fit_center_transparent(final_img, sub_w, sub_h)
+                                    else:
+                                        # Старое поведение — растянуть в квадрат ячейки
+                                        final_img = final_img.resize((sub_w, sub_h), Image.LANCZOS)
+                                    CELL_CACHE.put(cell_key, final_img)
                                 # Compute grid cell coordinates.
                                 row = j // grid_size
                                 col = j % grid_size
@@ -175,13 +270,16 @@ class OutputPreviewImage(wx.Panel):
                                 x = col * sub_w
                                 y = row * sub_h
                                 images_finish.append((final_img, (x, y)))
+                        except PreviewCancelled:
+                            raise
                         except Exception as e:
-                            wx.CallAfter(self.logstream("output_preview_error",path,e))
-        # Update the preview on the main thread.
-        wx.CallAfter(self.update_images_grid_preview, images_finish)
+                            wx.CallAfter(self.logstream,"output_preview_error",path,e)
+        return images_finish
 
-    def update_images_grid_preview(self, images_finish):
-        """Called on the main thread to update the preview after computation."""
+    def update_images_grid_preview(self, images_finish, generation):
+        """Called on the main thread to update the preview after computation, unless it is outdated."""
+        if generation != self.preview_generation:
+            return
         preview_w, preview_h = cs.IMAGE_PREVIEW_SIZE
         bmp = wx.Bitmap(preview_w, preview_h)
         mem_dc = wx.MemoryDC(bmp)
@@ -228,11 +326,10 @@ class OutputPreviewImage(wx.Panel):
             mem_dc.DrawText(line, x, y)
             y += line_height
         mem_dc.SelectObject(wx.NullBitmap)
-        # Update the preview on the main thread.
-        wx.CallAfter(self.update_text_grid_preview,bmp)
+        self.update_text_grid_preview(bmp)
 
     def update_text_grid_preview(self,bmp):
-        """Called on the main thread to update the preview after computation."""
+        """Called on the main thread to show the text preview."""
         self.preview_bitmap = bmp
         self.Refresh()
 
@@ -1,39 +1,19 @@
-import wx
-import os
 import sys
-from gui.gui_logic import IconConverterGUI
 from src.cli import parse_arguments
 from src.cli import cli_mode
-import vars.global_var as gv
 
-class MyApp(wx.App):
+# wx and the GUI modules are imported only when the GUI is started,
+# so CLI runs start fast and work on machines without wxPython.
 
-    def OnInit(self):
-        # Create and show the main frame
-        self.frame = IconConverterGUI(None, gv.PROGRAM_FULLNAME)
-        self.frame.Show()
-        return True
-
-    def restart(self):
-        """
-        Restart the current program using os.execl,
-        which replaces the current process with a new one.
-        """
-        # The warning comes from PyInstaller’s bootloader for one‐file executables.
-        # When your app is restarted (via os.execl), the bootloader creates a temporary “_MEI…” folder to unpack its files. 
-        # Normally that folder is removed when the process ends,
-        # but in some cases—especially on Windows with splash screens or when DLLs remain in use—the folder isn’t deleted, 
-        # and you see a warning. This is a known issue in some PyInstaller versions. 
-        # Updating to a version that has addressed the problem (for example, v5.3 or later) 
-        # or setting the environment variable PYINSTALLER_RESET_ENVIRONMENT to "1" before restarting can help. 
-        # If the warning doesn’t affect your application’s functionality, it can also be safely ignored
-        os.environ["PYINSTALLER_RESET_ENVIRONMENT"] = "1" 
-        python = sys.executable
-        os.execl(python, *sys.argv)
-        
 def main():
     args = parse_arguments()
-    if args.cli:
+    if args.serve:
+        from src.cli_server import serve
+        serve(args.socket)
+    elif args.client:
+        from src.cli_server import run_client
+        sys.exit(run_client(sys.argv[1:], args.socket))
+    elif args.cli or args.cache_stats or args.cache_clear or args.merge_shards or args.spool or args.worker or args.pipe:
         run_cli_mode(args)
     else:
         run_gui_mode()
@@ -42,6 +22,7 @@ def run_cli_mode(args):
     cli_mode(args)
 
 def run_gui_mode(): 
+    from gui.gui_app import MyApp
     app = MyApp(False)
     app.MainLoop()
 
@@ -0,0 +1,192 @@
+import io
+import hashlib
+from dataclasses import dataclass, field, fields
+from typing import Iterable, Iterator, Union
+from PIL import Image
+import vars.global_var as gv
+import vars.var_for_init as iv
+from src.converter import apply_frame, apply_format
+from src.preview_cache import SOURCE_CACHE, LRUCache
+from src.budget_options import get_budget
+
+# In-memory library API for build scripts that embed the renderer:
+#   outputs = render(png_bytes, RenderOptions(formats=("format_blp",)))
+#   outputs[("size_256x256", "style_hd", "border_button", "format_blp")] -> encoded bytes
+# Options are explicit dataclasses (defaults as in data/config/Default.cfg) instead of
+# config sections; RenderOptions.from_selection converts a CurrentSelection for scripts
+# that start from a config file. Nothing is read or written besides the frame assets.
+# Decoded inputs go through SOURCE_CACHE and frame assets through FRAME_CACHE, the
+# caches the generator and the previews use. Custom frames (iv.CUSTOM_FRAMES_DICT) and
+# custom backgrounds must be loaded by the caller, as for generate_images.
+
+VariantKey = tuple  # (size, style, border, format), e.g. ("size_64x64", "style_sd", "border_button", "format_blp")
+
+@dataclass(frozen=True)
+class FrameOptions:
+    """Options of apply_frame (OPTIONS_EXTRAS, OPTIONS_MISC, OPTIONS_CUSTOM_SIZE, custom background)."""
+    extras_alpha: bool = False
+    extras_blackframe: bool = False
+    extras_heroframe: bool = False
+    extras_crop: bool = False
+    reforged_hd_disabled_saturation: float = 0.5
+    reforged_hd_disabled_contrast: float = 0.82
+    size_custom_x: int = gv.CUSTOM_SIZE_DEFAULT_X
+    size_custom_y: int = gv.CUSTOM_SIZE_DEFAULT_Y
+    custom_background: str = gv.DEFAULT_OPTION_PLACEHOLDER
+
+    def extras(self) -> dict:
+        return {option: getattr(self, option) for option in gv.OPTIONS_EXTRAS["options"]}
+
+    def misc(self) -> dict:
+        return {option: getattr(self, option) for option in gv.OPTIONS_MISC["options"] + gv.OPTIONS_CUSTOM_SIZE["options"]}
+
+@dataclass(frozen=True)
+class FormatOptions:
+    """Options of apply_format (DDS and BLP sections). Budgets over several files are not available here."""
+    dds_mipmap: str = "Auto"
+    dds_type: str = "DXT1"
+    blp_compression: int = 85
+    blp_progressive: bool = False
+    blp_mipmap: str = "Auto"
+    blp_size_budget: float = 0.0
+
+    def suboptions(self) -> dict:
+        return {item.name: getattr(self, item.name) for item in fields(self)}
+
+@dataclass(frozen=True)
+class RenderOptions:
+    """The variants to render (option codes of gv.OPTIONS_*) and their frame and format options."""
+    sizes: tuple = ("size_256x256",)
+    styles: tuple = ("style_hd",)
+    borders: tuple = ("border_button", "border_disabled")
+    formats: tuple = ("format_dds",)
+    frame: FrameOptions = field(default_factory=FrameOptions)
+    format: FormatOptions = field(default_factory=FormatOptions)
+
+    def validate(self):
+        """Raises ValueError for unknown option codes."""
+        allowed = (
+            ("size", self.sizes, gv.OPTIONS_SIZE_EXTENDED["options"] + [gv.OPTION_SIZE_CUSTOM]),
+            ("style", self.styles, gv.OPTIONS_STYLE["options"]),
+            ("border", self.borders, gv.OPTIONS_BORDER["options"] + list(iv.CUSTOM_FRAMES_DICT)),
+            ("format", self.formats, gv.OPTIONS_FORMAT["options"]),
+        )
+        for name, values, options in allowed:
+            if not values:
+                raise ValueError(f"No {name} option given")
+            unknown = [value for value in values if value not in options]
+            if unknown:
+                raise ValueError(f"Unknown {name} options: {', '.join(unknown)}")
+
+    def variants(self) -> Iterator[VariantKey]:
+        """All (size, style, border, format) keys, in the order of the generator."""
+        for size_option in self.sizes:
+            for style_option in self.styles:
+                for border_option in self.borders:
+                    for format_option in self.formats:
+                        yield size_option, style_option, border_option, format_option
+
+    @classmethod
+    def from_selection(cls, selection) -> "RenderOptions":
+        """Options of a CurrentSelection (e.g. read from a config or profile file)."""
+        sizes, styles, borders, formats = selection.recieve_true_variations()
+        frame_values = selection.recieve_suboptions([gv.OPTIONS_EXTRAS, gv.OPTIONS_MISC, gv.OPTIONS_CUSTOM_SIZE])
+        custom_background = selection.get_value("CUSTOM_SECTION", "custom_background")
+        if custom_background is not None:
+            frame_values["custom_background"] = custom_background
+        format_values = selection.recieve_suboptions([gv.DDS_SETTINGS, gv.BLP_SETTINGS])
+        format_values["blp_size_budget"] = get_budget(format_values, "blp_size_budget")
+        return cls(
+            sizes=tuple(sizes), styles=tuple(styles), borders=tuple(borders), formats=tuple(formats),
+            frame=FrameOptions(**coerce_fields(FrameOptions, frame_values)),
+            format=FormatOptions(**coerce_fields(FormatOptions, format_values)),
+        )
+
+def coerce_fields(cls, values: dict) -> dict:
+    """Config values (strings and booleans) as the field types of the dataclass cls; unknown keys are dropped."""
+    result = {}
+    for item in fields(cls):
+        if item.name not in values or isinstance(item.default, str):
+            if item.name in values:
+                result[item.name] = str(values[item.name])
+            continue
+        value = values[item.name]
+        if isinstance(item.default, bool):
+            result[item.name] = value if isinstance(value, bool) else str(value).lower() == "true"
+        else:
+            result[item.name] = type(item.default)(float(value))
+    return result
+
+PSD_SIGNATURE = b"8BPS"
+
+def decode_image(data: bytes) -> Image.Image:
+    """Decodes an encoded input (any format Pillow reads, PSD layers and BLP1 JPEG) like load_pil_image."""
+    if data[:4] == PSD_SIGNATURE:
+        # Merged with pytoshop like .psd input files, not flattened by Pillow.
+        from src.psd_decoder import psd_bytes_to_pil
+        return psd_bytes_to_pil(data)
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+        return image
+    except Exception as open_error:
+        if data[:4] not in (b"BLP1", b"BLP2"):
+            raise open_error
+    from src.blp_decoder import blp_to_pil
+    return blp_to_pil(data)
+
+def get_input_image(image: Union[Image.Image, bytes, bytearray, memoryview]) -> Image.Image:
+    """The decoded input; encoded bytes are decoded once and kept in SOURCE_CACHE by their content hash."""
+    if isinstance(image, Image.Image):
+        return image
+    data = bytes(image)
+    key = ("bytes", hashlib.sha1(data).hexdigest())
+    decoded = SOURCE_CACHE.get(key)
+    if decoded is None:
+        decoded = decode_image(data)
+        SOURCE_CACHE.put(key, decoded)
+    return decoded
+
+def render(image: Union[Image.Image, bytes, bytearray, memoryview], options: RenderOptions = None) -> dict:
+    """
+    Renders all variants of options for one input.
+    image: a Pillow image or the bytes of an encoded input file.
+    Returns:
+        dict: {(size, style, border, format): encoded bytes}, in the order of options.variants()
+    Raises ValueError for unknown option codes and the decoder and encoder errors otherwise.
+    """
+    options = options or RenderOptions()
+    options.validate()
+    source = get_input_image(image)
+    extras = options.frame.extras()
+    misc = options.frame.misc()
+    format_suboptions = options.format.suboptions()
+    outputs = {}
+    framed = {}
+    for variant in options.variants():
+        frame_variant = variant[:3]
+        if frame_variant not in framed:
+            # One frame per (size, style, border), encoded in every format.
+            framed[frame_variant] = apply_frame(source, *frame_variant, extras, misc, options.frame.custom_background)
+        outputs[variant] = apply_format(framed[frame_variant], variant[3], format_suboptions).getvalue()
+    return outputs
+
+def render_many(images: Iterable, options: RenderOptions = None) -> Iterator[dict]:
+    """
+    Lazily renders a batch: yields the render result of each input in order.
+    Inputs given as bytes with the content of one of the last gv.RENDER_RESULT_CACHE_MAXNUM
+    distinct inputs are not rendered again; memory does not grow with the batch.
+    """
+    options = options or RenderOptions()
+    options.validate()
+    results = LRUCache(gv.RENDER_RESULT_CACHE_MAXNUM)
+    for image in images:
+        if isinstance(image, Image.Image):
+            yield render(image, options)
+            continue
+        key = hashlib.sha1(bytes(image)).hexdigest()
+        result = results.get(key)
+        if result is None:
+            result = render(image, options)
+            results.put(key, result)
+        yield dict(result)
@@ -0,0 +1,277 @@
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional
+import vars.global_var as gv
+from src.preview_cache import get_source_image
+from src.converter import apply_frame, apply_format
+from src.output_sink import FolderSink
+from src.dedup import OutputDedup
+from src.budget_options import get_budget, find_invalid_budgets
+from src.generator import set_output_folder, build_output_path, generate_images, dispatch_event, BlpBudget
+from src.stored_var import CurrentSelection
+from src.log import LogOutputStream
+from src.events import Planned, Started, OutputWritten, Notice, Error, Finished, RunClock, LogReporter
+
+# Asyncio generation API.
+# agenerate_images runs the stages of every work unit (one input with one size, style
+# and border): decode, composite (apply_frame), then encode and write for each format,
+# each stage in a thread pool behind a semaphore that bounds how many run at once.
+# Units are taken in the order of generate_images, so output names are the same; the
+# progress is an async iterator of the events of src/events.py, as iter_generate_images
+# yields them. Cancelling the consuming task, or setting input_data.stop_requested,
+# stops the run before the next stage of any unit.
+# Map and total BLP budgets decide over all outputs at once and stay with generate_images.
+
+class GenerationStopped(Exception):
+    """Ends the units of a run that was stopped or failed."""
+
+def supports_async(input_data: CurrentSelection) -> bool:
+    """False for map and total BLP budgets, which only generate_images applies."""
+    blp = input_data.recieve_suboptions([gv.BLP_SETTINGS])
+    return not (get_budget(blp, "map_size_budget") or get_budget(blp, "blp_total_budget"))
+
+def get_max_concurrency(max_concurrency: int = None) -> int:
+    return max_concurrency or gv.GENERATION_MAX_CONCURRENCY or os.cpu_count() or 1
+
+async def agenerate_images(input_data: CurrentSelection, output_sink: Optional[Any] = None,
+                           max_concurrency: int = None, executor: Optional[Any] = None):
+    """
+    Async iterator over the events of a generation run of input_data (src/events.py):
+    Planned, Started when the first unit of an input is taken, OutputWritten, Notice,
+    Error and, always last, Finished. Units run concurrently, so an output may be written
+    before the Started event of its input reaches the consumer.
+    Raises ValueError for map and total BLP budgets.
+    max_concurrency: stages running at once (default gv.GENERATION_MAX_CONCURRENCY).
+    executor: thread pool for the stages; by default one is created for the run.
+    """
+    if not supports_async(input_data):
+        raise ValueError("Map and total BLP size budgets are only supported by generate_images")
+    clock = RunClock()
+    loop = asyncio.get_running_loop()
+    input_data.gather_paths()
+    file_items = input_data.paths_rel
+    if not file_items:
+        yield clock.stamp(Notice("output_no_image_warning"))
+        yield clock.stamp(Finished("no_input"))
+        return
+
+    true_size_options, true_style_options, true_border_options, true_format_options = input_data.recieve_true_variations()
+    format_suboption_dict = input_data.recieve_suboptions([gv.DDS_SETTINGS, gv.BLP_SETTINGS, gv.TGA_SETTINGS])
+    output_suboption_dict = input_data.recieve_suboptions([gv.OPTIONS_OUTPUT, gv.OPTIONS_OUTPUT_PATH, gv.OPTIONS_BASENAME])
+    extras_suboption_dict = input_data.recieve_suboptions([gv.OPTIONS_EXTRAS])
+    misc_suboption_dict = input_data.recieve_suboptions([gv.OPTIONS_MISC, gv.OPTIONS_CUSTOM_SIZE])
+    custom_background_name = input_data.get_value("CUSTOM_SECTION", "custom_background") or "None"
+    sink = output_sink if output_sink is not None else FolderSink()
+    output_samedir = output_suboption_dict.get("outputset_samedir", False) and not sink.is_archive
+    output_folder = None
+    if not output_samedir:
+        try:
+            output_folder = set_output_folder(output_suboption_dict, create_new_folder = not sink.is_archive)
+        except Exception as e:
+            yield clock.stamp(Error("output_folder_error", (e,)))
+            yield clock.stamp(Finished("failed"))
+            return
+    sink.begin_run(output_folder)
+    if max(len(file_items), input_data.num_paths_total) > 1:
+        output_suboption_dict["output_basename"] = None
+
+    # Plan every unit in order: the output names depend on the names used before them.
+    dedup = OutputDedup([path for path, _ in file_items])
+    used_output_paths = set()
+    units = []
+    units_left = {}  # input index -> units still to composite, to release its decoded image
+    for file_index, (path, rel_path) in enumerate(file_items):
+        for size_option in true_size_options:
+            for style_option in true_style_options:
+                for border_option in true_border_options:
+                    output_paths = [build_output_path(
+                                        original_path=path,
+                                        output_folder=os.path.dirname(path) if output_samedir else output_folder,
+                                        size_option=size_option,
+                                        style_option=style_option,
+                                        border_option=border_option,
+                                        format_option=format_option,
+                                        output_suboption_dict=output_suboption_dict,
+                                        true_style_options=true_style_options,
+                                        true_format_options=true_format_options,
+                                        true_border_options=true_border_options,
+                                        used_output_paths=used_output_paths,
+                                        relative_subfolder="" if output_samedir else rel_path,
+                                        create_folders=False,
+                                    ) for format_option in true_format_options]
+                    units.append((file_index, path, (size_option, style_option, border_option), output_paths))
+                    if not dedup.is_duplicate(file_index):
+                        units_left[file_index] = units_left.get(file_index, 0) + 1
+    total = len(units) * len(true_format_options)
+    blp_budget = BlpBudget(format_suboption_dict, 0)  # per-file budgets only: reported, not shared
+
+    workers = get_max_concurrency(max_concurrency)
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=workers)
+    semaphore = asyncio.Semaphore(workers)
+    events = asyncio.Queue(maxsize=workers * 4)  # producers wait for a slow consumer
+    decoded = {}  # input index -> future of the decoded image
+    source_units = {}  # (input index, frame variant) -> future of {format: (output path, data, report)}
+    source_uses_left = {}  # (input index, frame variant) -> copies that have not taken the outputs yet
+    started = set()  # input indexes with a Started event
+    state = {"current": 0, "nbytes": 0, "failed": False}
+
+    async def stage(func, *args):
+        if input_data.stop_requested or state["failed"]:
+            raise GenerationStopped()
+        async with semaphore:
+            return await loop.run_in_executor(executor, func, *args)
+
+    def encode(image, format_option):
+        report = {}
+        data = apply_format(image, format_option, format_suboption_dict, format_report = report).getvalue()
+        return data, report
+
+    async def written(path, output_path, variant, data, report, seconds):
+        state["current"] += 1
+        state["nbytes"] += len(data)
+        await events.put(clock.stamp(OutputWritten(input=path, output=output_path, variant=variant, nbytes=len(data),
+                                                   seconds=round(seconds, 6), current=state["current"], total=total,
+                                                   report=report)))
+        if blp_budget.record(output_path, report):
+            await events.put(clock.stamp(Notice("output_blp_budget_exceeded",
+                                                (os.path.basename(output_path),
+                                                 round(report["blp_budget"] / gv.BLP_BUDGET_UNIT_BYTES, 1),
+                                                 report["blp_quality"],
+                                                 round(report["blp_size"] / gv.BLP_BUDGET_UNIT_BYTES, 1)))))
+
+    async def run_unit(unit):
+        file_index, path, frame_variant, output_paths = unit
+        if file_index not in started:
+            started.add(file_index)
+            await events.put(clock.stamp(Started(path, file_index)))
+        mark = loop.time()
+        key = (file_index, frame_variant)
+        if dedup.is_duplicate(file_index):
+            # The first identical input was taken earlier, so its unit is running or done.
+            source_key = (dedup.source_of[file_index], frame_variant)
+            source_outputs = await source_units[source_key]
+            source_uses_left[source_key] -= 1
+            if not source_uses_left[source_key]:
+                # The last copy has them: the encoded outputs are not kept any longer.
+                del source_units[source_key]
+            dedup.skipped_renders += 1
+            mark = loop.time()
+            for format_option, output_path in zip(true_format_options, output_paths):
+                source_path, data, report = source_outputs[format_option]
+                await stage(sink.write_duplicate, output_path, source_path, data)
+                dedup.skipped_encodes += 1
+                now = loop.time()
+                await written(path, output_path, (*frame_variant, format_option), data, report, now - mark)
+                mark = now
+            return
+        if file_index in dedup.sources:
+            source_units[key] = loop.create_future()
+            source_uses_left[key] = dedup.copies[file_index]
+        if file_index not in decoded:
+            decoded[file_index] = asyncio.ensure_future(stage(get_source_image, path))
+        image = await decoded[file_index]
+        units_left[file_index] -= 1
+        if not units_left[file_index]:
+            del decoded[file_index]
+        framed = await stage(apply_frame, image, *frame_variant, extras_suboption_dict, misc_suboption_dict, custom_background_name)
+        outputs = {}
+        for format_option, output_path in zip(true_format_options, output_paths):
+            data, report = await stage(encode, framed, format_option)
+            await stage(sink.write, output_path, data)
+            outputs[format_option] = (output_path, data, report)
+            now = loop.time()
+            await written(path, output_path, (*frame_variant, format_option), data, report, now - mark)
+            mark = now
+        if key in source_units:
+            source_units[key].set_result(outputs)
+
+    async def worker(unit_iterator):
+        for unit in unit_iterator:
+            try:
+                await run_unit(unit)
+            except (GenerationStopped, asyncio.CancelledError):
+                raise
+            except Exception as e:
+                if not state["failed"]:
+                    state["failed"] = True
+                    await events.put(clock.stamp(Error("output_processing_option_error",
+                                                       (os.path.basename(unit[1]), *unit[2], e))))
+                raise GenerationStopped()
+
+    async def drive():
+        unit_iterator = iter(units)  # shared: each worker takes the next unit in order
+        async with asyncio.TaskGroup() as group:
+            for _ in range(min(workers * 2, len(units))):
+                group.create_task(worker(unit_iterator))
+
+    yield clock.stamp(Planned(inputs=len(file_items),
+                              total=total,
+                              first_input=os.path.basename(file_items[0][0]),
+                              output_folder=output_folder,
+                              archive_path=sink.archive_path if sink.is_archive else None,
+                              samedir=output_samedir))
+    for option, value in find_invalid_budgets(format_suboption_dict):
+        yield clock.stamp(Notice("output_budget_invalid", (option, value)))
+    if custom_background_name != "None":
+        from src.custom_backgrounds import get_background_path
+        bg_path = get_background_path(custom_background_name)
+        if not bg_path or not os.path.exists(bg_path):
+            yield clock.stamp(Notice("custom_background_not_found", (custom_background_name,)))
+    driver = asyncio.ensure_future(drive())
+    try:
+        while True:
+            next_event = asyncio.ensure_future(events.get())
+            await asyncio.wait({next_event, driver}, return_when=asyncio.FIRST_COMPLETED)
+            if next_event.done():
+                yield next_event.result()
+                continue
+            next_event.cancel()
+            while not events.empty():
+                yield events.get_nowait()
+            break
+        error = driver.exception()
+        if isinstance(error, BaseExceptionGroup):
+            # Stopped units are the expected end of a stopped or failed run; anything else is a bug.
+            _, unexpected = error.split(GenerationStopped)
+            if unexpected is not None:
+                raise unexpected
+        elif error is not None:
+            raise error
+        if state["failed"]:
+            status = "failed"
+        elif error is not None:
+            status = "aborted"
+        else:
+            status = "success"
+        summary = []
+        if blp_budget.results:
+            summary.append(("output_blp_budget_summary", blp_budget.summary()))
+        if dedup.source_of:
+            summary.append(("output_dedup_summary", dedup.summary(len(file_items))))
+        yield clock.stamp(Finished(status, state["current"], total, state["nbytes"], summary))
+    finally:
+        if not driver.done():
+            driver.cancel()
+            await asyncio.gather(driver, return_exceptions=True)
+        if own_executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+async def report_generation(input_data: CurrentSelection, info_stream: Optional[Any] = None, output_sink: Optional[Any] = None,
+                            max_concurrency: int = None, reporters: Optional[list] = None):
+    """Consumes agenerate_images and reports its events like generate_images."""
+    reporters = [LogReporter(LogOutputStream(info_stream), info_stream), *(reporters or [])]
+    async for event in agenerate_images(input_data, output_sink, max_concurrency):
+        dispatch_event(event, reporters, input_data)
+
+def run_generation_async(input_data: CurrentSelection, info_stream: Optional[Any] = None, max_concurrency: int = None):
+    """
+    Runs a generation in an event loop of the calling (worker) thread, reported like generate_images.
+    Runs with map or total BLP budgets are handed to generate_images.
+    """
+    if not supports_async(input_data):
+        generate_images(input_data, info_stream)
+        return
+    asyncio.run(report_generation(input_data, info_stream, max_concurrency=max_concurrency))
@@ -3,38 +3,14 @@ from typing import IO
 from PIL import Image
 import external.jpgwrapper as jpgw
 import numpy as np
+from src.channel_swizzle import has_transparency, rgba_to_bgra, rgb_to_ymcx
 
+BLP1_NUM_MIPS_MAX = 16
+BLP1_NUM_MIPS_PADDED = 8
+BLP1_MAX_COMMON_HEADER = 624
+# Fixed 156-byte BLP1 header followed by the DWORD holding the JPEG header size.
+BLP1_JPEG_HEADER_STRUCT = struct.Struct(f"<4s6I{BLP1_NUM_MIPS_MAX}I{BLP1_NUM_MIPS_MAX}II")
 
-def has_transparency(im: Image.Image):
-        # If the image mode is not RGBA, it has no transparency
-    if im.mode != "RGBA":
-        return False
-    alpha_channel = np.array(im)[:, :, 3]  # Extract alpha channel
-    if np.any(alpha_channel < 255):  # Check if any pixel is non-opaque
-        return True
-    return False
-
-def RGBA_to_BGRA(im: Image.Image):
-    # Ensure we have an RGBA image
-    im = im.convert("RGBA") 
-    r, g, b, a = im.split()  # Ignore alpha channel
-    return Image.merge("RGBA", (b, g, r, a))
-
-def RGB_to_YMCX(im: Image.Image):
-    """Convert an RGB(A) image to CMYX, where K is trivial (all zero)."""
-    # Ensure we have an RGB image
-    im = im.convert("RGB") 
-    r, g, b = im.split()  # Ignore alpha channel
-    # Swap red and blue channels (i.e., invert R and B)
-    r, b = b, r
-    # Manually compute the CMY channels:
-    c = r.point(lambda i: 255 - i)
-    m = g.point(lambda i: 255 - i)
-    y = b.point(lambda i: 255 - i)
-    # Make K a trivial channel (all black component is removed)
-    k = Image.new("L", im.size, 0)  # K is all zeros (trivial black)
-    # Merge the manually computed CMY channels with the trivial K channel
-    return Image.merge("CMYK", (c, m, y, k))
 
 def create_mipmaps(im: Image.Image, num_mips: int = 16) -> list[Image.Image]:
     """
@@ -57,23 +33,27 @@ def create_mipmaps(im: Image.Image, num_mips: int = 16) -> list[Image.Image]:
 def scan_common_header(jpeg_datas: list[bytes], max_header: int = 624) -> bytes:
     """
     Find the common prefix among all JPEG-encoded byte strings.
-    If there's only one entity, no common header is declared (returns b"").
+    If there's only one entity, its first max_header bytes are returned.
     The result is truncated to max_header bytes.
+
+    Only the first max_header bytes of each candidate can contribute to the result,
+    so the comparison is done on that window with NumPy instead of byte by byte.
     """
     if not jpeg_datas:
         return b""
-    common = jpeg_datas[0]
+    first = jpeg_datas[0]
+    common_len = min(max_header, min(len(data) for data in jpeg_datas))
+    if common_len <= 0:
+        return b""
+    reference = np.frombuffer(first, dtype=np.uint8, count=common_len)
     for data in jpeg_datas[1:]:
-        new_common = bytearray()
-        for a, b in zip(common, data):
-            if a == b:
-                new_common.append(a)
-            else:
-                break
-        common = bytes(new_common)
-        if not common:
-            break
-    return common[:max_header]
+        candidate = np.frombuffer(data, dtype=np.uint8, count=common_len)
+        mismatches = np.flatnonzero(reference[:common_len] != candidate)
+        if mismatches.size:
+            common_len = int(mismatches[0])
+            if not common_len:
+                return b""
+    return bytes(memoryview(first)[:common_len])
 
 def move_sof_before_sos(jpeg_bytes: bytes) -> bytes:
     """
@@ -347,6 +327,137 @@ def extract_huff_tables(jpeg_bytes: bytes, table_id: int = 0) -> tuple[bytes, by
     ac_table = extract_huff_table(jpeg_bytes, table_class=1, table_id=table_id)
     return dc_table, ac_table
 
+def compute_blp1_mip_table(block_sizes: list[int], mips_sizes: list[tuple], data_start_offset: int) -> tuple[list[int], list[int]]:
+    """
+    Compute the 16-entry MipMapOffset and MipMapSize arrays of a BLP1 header.
+
+    Missing levels below BLP1_NUM_MIPS_PADDED reuse the last stored block
+    (as long as the virtual mip is larger than 1x1); the rest are zeroed.
+    """
+    offsets = []
+    sizes = []
+    current_offset = data_start_offset
+    old_offset = current_offset
+    size = 0
+    mip_width = mip_height = 0
+    for i in range(BLP1_NUM_MIPS_MAX):
+        if i < len(block_sizes):
+            mip_width, mip_height = mips_sizes[i]
+            size = block_sizes[i]
+            offsets.append(current_offset)
+            sizes.append(size)
+            old_offset = current_offset
+            current_offset += size
+        elif i < BLP1_NUM_MIPS_PADDED and (mip_width > 1) and (mip_height > 1):
+            mip_width = mip_width / 2
+            mip_height = mip_height / 2
+            offsets.append(old_offset)
+            sizes.append(size)
+        else:
+            offsets.append(0)
+            sizes.append(0)
+    return offsets, sizes
+
+def write_blp1_jpeg_container(fp: IO[bytes], width: int, height: int, flags: int, jpeg_datas: list[bytes], mips_sizes: list[tuple]) -> None:
+    """
+    Write a BLP1 CONTENT_JPEG container for already encoded mip levels.
+
+    The common JPEG header is shared by all levels; each level is emitted as a
+    memoryview past that header, so no per-mip copies are made. The header is
+    packed in one call and the whole file is handed to fp.writelines at once.
+    """
+    common_header = scan_common_header(jpeg_datas, BLP1_MAX_COMMON_HEADER)
+    common_len = len(common_header)
+    jpeg_blocks = [memoryview(data)[common_len:] for data in jpeg_datas]
+
+    # Mip data starts after the fixed header and the JPEG header block.
+    data_start_offset = BLP1_JPEG_HEADER_STRUCT.size + common_len
+    offsets, sizes = compute_blp1_mip_table([block.nbytes for block in jpeg_blocks], mips_sizes, data_start_offset)
+
+    compression = 0  # CONTENT_JPEG
+    extra_field = 5  # For JPEG content
+    has_mipmaps = 1  # The hasMipmaps field is a boolean for if mipmaps are present for the image. If 0 then no mipmaps exist and the image will be present at full resolution at mipmap level 0.
+    header = BLP1_JPEG_HEADER_STRUCT.pack(
+        b"BLP1", compression, flags, width, height, extra_field, has_mipmaps,
+        *offsets, *sizes, common_len,
+    )
+    fp.writelines([header, common_header, *jpeg_blocks])
+
+def encode_mips_bgra(mips: list[Image.Image], quality: int, progressive: bool, optimize_coding: bool) -> list[bytes]:
+    """
+    Encode BGRA mip levels with libjpeg (4-channel JPEG), SOF moved before SOS.
+    The whole pyramid goes through one batched call when the compiled jpgwrapper provides it.
+    """
+    if hasattr(jpgw, "compress_bgra_pyramid_to_jpeg"):
+        # Each level is passed through the buffer protocol: a single tobytes() copy per mip.
+        levels = [(mip.tobytes(), mip.width, mip.height) for mip in mips]
+        return jpgw.compress_bgra_pyramid_to_jpeg(levels, quality, progressive, optimize_coding)
+
+    # Fallback for jpgwrapper builds without the batched entry point.
+    jpeg_datas = []
+    for mip in mips:
+        width, height = mip.size
+        data = jpgw.compress_bgra_to_jpeg(mip.tobytes(), width, height, quality, progressive, optimize_coding, None, None)
+        jpeg_datas.append(move_sof_before_sos(data))
+    return jpeg_datas
+
+def encode_mips_ymcx(mips: list[Image.Image], quality: int, progressive: bool, optimize_coding: bool) -> list[bytes]:
+    """Encode YMCX (CMYK mode) mip levels with Pillow's JPEG encoder, APP14 removed."""
+    jpeg_datas = []
+    for mip in mips:
+        buf = io.BytesIO()
+        mip.save(buf, format="JPEG", quality=quality,progressive=progressive, keep_rgb=True, optimize=optimize_coding)
+        data = buf.getvalue()
+        data = remove_app14(data)
+        if not(progressive):
+            data = move_sof_before_sos(data)
+        jpeg_datas.append(data)
+    return jpeg_datas
+
+def prepare_blp1_mips(im: Image.Image, num_mips: int = None, force_bgra: bool = True) -> tuple[list[Image.Image], list[tuple], int, bool]:
+    """
+    Swizzle the input image for BLP1 JPEG storage and build its mipmap chain.
+
+    Images with transparency are always stored as BGRA; otherwise force_bgra selects
+    between BGRA and YMCX (CMYK-style treatment for 4-canal JPEG).
+
+    Returns:
+        tuple: (mips, mips_sizes, flags, force_bgra), where flags is the BLP1 alpha flag
+        and force_bgra the colour layout actually used.
+    """
+    flags = 0
+    if has_transparency(im):
+        flags = 8
+        force_bgra = True
+    if force_bgra:
+        # Ensure we have an RGBA image
+        im_bgra = rgba_to_bgra(im)
+    else:
+        im_bgra = rgb_to_ymcx(im)
+
+    if num_mips is None:
+        num_mips = BLP1_NUM_MIPS_MAX
+    num_mips = min(BLP1_NUM_MIPS_MAX, num_mips)
+    num_mips = max(1, num_mips)
+
+    # Generate the full mipmap chain
+    mips, mips_sizes = create_mipmaps(im_bgra, num_mips)
+    return mips, mips_sizes, flags, force_bgra
+
+def encode_blp1_mips(mips: list[Image.Image], quality: int, progressive: bool, optimize_coding: bool, force_bgra: bool) -> list[bytes]:
+    """Encode each mipmap level to JPEG (in memory) in the layout chosen by prepare_blp1_mips."""
+    if force_bgra:
+        return encode_mips_bgra(mips, quality, progressive, optimize_coding)
+    return encode_mips_ymcx(mips, quality, progressive, optimize_coding)
+
+def encode_blp1_jpeg_bytes(mips: list[Image.Image], mips_sizes: list[tuple], flags: int, quality: int, progressive: bool, optimize_coding: bool, force_bgra: bool) -> bytes:
+    """Encode a prepared mipmap chain at the given quality and return the complete BLP1 file."""
+    jpeg_datas = encode_blp1_mips(mips, quality, progressive, optimize_coding, force_bgra)
+    width, height = mips_sizes[0]
+    buffer = io.BytesIO()
+    write_blp1_jpeg_container(buffer, width, height, flags, jpeg_datas, mips_sizes)
+    return buffer.getvalue()
+
 def export_blp1_jpeg(im: Image.Image, fp: IO[bytes], quality: int = 95, num_mips: int = None, progressive: bool = False, optimize_coding: bool = False, force_bgra: bool = True) -> None:
     """
     Export a Pillow image (in any mode) as a BLP1 file using CONTENT_JPEG,
@@ -379,118 +490,85 @@ def export_blp1_jpeg(im: Image.Image, fp: IO[bytes], quality: int = 95, num_mips
       
     Then each mipmap's JPEG data (with common header removed) is written.
     """
-    num_mips_max=16
-    num_mips_false=8
-    transp_flag=0
-    # Convert input image to BGRA (using CMYK-style treatment for 4-canal JPEG)
-    transparency = has_transparency(im)
-    if transparency:
-        transp_flag=8
-        force_bgra = True
-    if force_bgra:
-        # Ensure we have an RGBA image
-        im_bgra = RGBA_to_BGRA(im)
+    mips, mips_sizes, flags, force_bgra = prepare_blp1_mips(im, num_mips, force_bgra)
+    jpeg_datas = encode_blp1_mips(mips, quality, progressive, optimize_coding, force_bgra)
+    # Assemble the BLP1 container around the encoded mip levels.
+    width, height = mips_sizes[0]
+    write_blp1_jpeg_container(fp, width, height, flags, jpeg_datas, mips_sizes)
+
+def prepare_blp1_variants(im: Image.Image, num_mips: int = None, progressive: bool = False, optimize_coding: bool = False, force_bgra: bool = True, best_compression: bool = False) -> list[tuple]:
+    """
+    The encoder settings the budget searches try at each quality, with their prepared
+    mipmap chains: [((mips, mips_sizes, flags, force_bgra), progressive, optimize_coding)].
+    Without best_compression this is the single given setting; with it, all 8
+    combinations of progressive, optimize_coding and force_bgra (4 for images with
+    transparency, which are always BGRA).
+    """
+    if not best_compression:
+        return [(prepare_blp1_mips(im, num_mips, force_bgra), progressive, optimize_coding)]
+    chains = [prepare_blp1_mips(im, num_mips, True)]
+    ymcx_chain = prepare_blp1_mips(im, num_mips, False)
+    if not ymcx_chain[3]:
+        chains.append(ymcx_chain)
+    return [(chain, prog, opt) for chain in chains for prog in (True, False) for opt in (True, False)]
+
+def encode_smallest_blp1_variant(variants: list[tuple], quality: int) -> bytes:
+    """Encodes every variant of prepare_blp1_variants at quality and returns the smallest BLP1 file."""
+    return min((encode_blp1_jpeg_bytes(mips, mips_sizes, flags, quality, prog, opt, chain_bgra)
+                for (mips, mips_sizes, flags, chain_bgra), prog, opt in variants), key=len)
+
+def export_blp1_jpeg_within_budget(im: Image.Image, fp: IO[bytes], max_size: int, max_quality: int = 95, min_quality: int = 0, num_mips: int = None, progressive: bool = False, optimize_coding: bool = False, force_bgra: bool = True, best_compression: bool = False) -> tuple[int, int]:
+    """
+    Export a Pillow image as a BLP1 file using the highest JPEG quality
+    (between min_quality and max_quality) whose file size fits into max_size bytes.
+
+    The mipmap chain is built once and shared by every trial encode; trial results
+    are cached per quality, so the chosen variant is written without re-encoding.
+    With best_compression, every trial quality is encoded in all 8 variants
+    (progressive, optimize_coding, force_bgra) and the smallest file is kept, so
+    higher qualities fit; progressive, optimize_coding and force_bgra are then ignored.
+    If even min_quality does not fit, the min_quality file is written anyway.
+
+    Returns:
+        tuple: (quality, size) of the written file.
+    """
+    variants = prepare_blp1_variants(im, num_mips, progressive, optimize_coding, force_bgra, best_compression)
+    trial_encodes = {}
+
+    def encode_at(quality: int) -> bytes:
+        if quality not in trial_encodes:
+            trial_encodes[quality] = encode_smallest_blp1_variant(variants, quality)
+        return trial_encodes[quality]
+
+    min_quality = min(min_quality, max_quality)
+    best_quality = None
+    if len(encode_at(max_quality)) <= max_size:
+        best_quality = max_quality
     else:
-        im_bgra=RGB_to_YMCX(im)
-        
-    if num_mips is None:
-        num_mips=num_mips_max
-    
-    num_mips=min(num_mips_max,num_mips)
-    num_mips=max(1,num_mips)
+        # File size grows with quality, so bisect for the last quality that still fits.
+        low, high = min_quality, max_quality - 1
+        while low <= high:
+            middle = (low + high) // 2
+            if len(encode_at(middle)) <= max_size:
+                best_quality = middle
+                low = middle + 1
+            else:
+                high = middle - 1
+    if best_quality is None:
+        best_quality = min_quality
 
-    # Generate the full mipmap chain
-    mips , mips_sizes = create_mipmaps(im_bgra,num_mips)
-    num_mips = len(mips)
-    
-    # Encode each mipmap level to JPEG (in memory)
-    jpeg_datas = []
-    count_mip_level = 0
-    dct = None
-    act = None
-    for mip in mips:
-        if force_bgra:
-            width, height = mip.size
-            #Convert image to NumPy array (shape: height x width x 4)
-            bgra_bytes = np.array(mip).tobytes()
-            data = jpgw.compress_bgra_to_jpeg(bgra_bytes, width, height, quality, progressive, optimize_coding, dct, act)
-            if False:
-                dct, act = extract_huff_tables(data, table_id=0)
-            data = move_sof_before_sos(data)
-        else:
-            buf = io.BytesIO()
-            mip.save(buf, format="JPEG", quality=quality,progressive=progressive, keep_rgb=True, optimize=optimize_coding)
-            data = buf.getvalue()
-            data = remove_app14(data)
-            if not(progressive):
-                data = move_sof_before_sos(data)
-        jpeg_datas.append(data)
-        count_mip_level +=1
-    # Compute common JPEG header (up to 624 bytes)
-    max_common_header=624 
-    common_header = scan_common_header(jpeg_datas, max_common_header)
-    
-    # Remove the common header from each JPEG block
-    jpeg_blocks = [data[len(common_header):] for data in jpeg_datas]
-    
-    # BLP1 header fields
-    magic = b"BLP1"
-    compression = 0  # CONTENT_JPEG
-    flags = transp_flag      # Set flags as needed (e.g. 8 for alpha)
-    width, height = im_bgra.size
-    extra_field = 5     # For JPEG content
-    has_mipmaps = 1  # The hasMipmaps field is a boolean for if mipmaps are present for the image. If 0 then no mipmaps exist and the image will be present at full resolution at mipmap level 0.
-    
-    # Fixed header size: 4+4+4+4+4+4+4 + (16*4)+(16*4) = 156 bytes.
-    header_size = 156
-    # JPEG header block: 4 bytes for header size + len(common_header)
-    jpeg_header_block_size = 4 + len(common_header)
-    data_start_offset = header_size + jpeg_header_block_size
-    
-    # Compute offsets and sizes for each of the 16 mipmap levels.
-    num_levels = num_mips_max
-    offsets = []
-    sizes = []
-    current_offset = data_start_offset
-    old_offset = current_offset
-    for i in range(num_levels):
-        if i < len(jpeg_blocks):
-            block = jpeg_blocks[i]
-            mip_width=mips_sizes[i][0]
-            mip_height=mips_sizes[i][1]
-            offsets.append(current_offset)
-            size=len(block)
-            sizes.append(size)
-            old_offset = current_offset
-            current_offset += size
-        elif i >= len(jpeg_blocks) and i<num_mips_false and (mip_width>1) and (mip_height>1):
-            mip_width=mip_width / 2
-            mip_height=mip_height /2
-            offsets.append(old_offset)
-            sizes.append(size)
-        else:
-            offsets.append(0)
-            sizes.append(0)
-    
-    # Begin writing the BLP file.
-    fp.write(magic)
-    fp.write(struct.pack("<I", compression))
-    fp.write(struct.pack("<I", flags))
-    fp.write(struct.pack("<I", width))
-    fp.write(struct.pack("<I", height))
-    fp.write(struct.pack("<I", extra_field))
-    fp.write(struct.pack("<I", has_mipmaps))
-    # Write 16 mipmap offsets.
-    for off in offsets:
-        fp.write(struct.pack("<I", off))
-    # Write 16 mipmap sizes.
-    for sz in sizes:
-        fp.write(struct.pack("<I", sz))
-    
-    # Write JPEG header block: first the DWORD with header length, then the header itself.
-    fp.write(struct.pack("<I", len(common_header)))
-    fp.write(common_header)
-    
-    # Write each mipmap JPEG data block.
-    for block in jpeg_blocks:
-        fp.write(block)
+    data = encode_at(best_quality)
+    fp.write(data)
+    return best_quality, len(data)
+
+def encode_blp1_jpeg_variants(im: Image.Image, qualities: list[int], num_mips: int = None, progressive: bool = False, optimize_coding: bool = False, force_bgra: bool = True, best_compression: bool = False) -> dict[int, bytes]:
+    """
+    Encode a Pillow image as complete BLP1 files at several JPEG qualities.
+    The mipmap chain is built once and shared by all of them; with best_compression
+    the smallest of the 8 variants is kept at each quality (see prepare_blp1_variants).
+
+    Returns:
+        dict: {quality: BLP1 file bytes}
+    """
+    variants = prepare_blp1_variants(im, num_mips, progressive, optimize_coding, force_bgra, best_compression)
+    return {quality: encode_smallest_blp1_variant(variants, quality) for quality in sorted(set(qualities))}
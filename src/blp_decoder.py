@@ -1,13 +1,30 @@
 import struct
 import io
 from PIL import Image
+from src.channel_swizzle import ymck_to_rgba
 
-def blp_path_to_pil(path):
+def blp_path_to_pil(path, min_size: tuple = None):
     with open(path, "rb") as f:
         data = f.read()
-    return blp_to_pil(data)
+    return blp_to_pil(data, min_size)
 
-def blp_to_pil(data):
+def pick_blp_mip_level(width: int, height: int, mip_offsets: tuple, mip_sizes: tuple, min_size: tuple = None) -> int:
+    """
+    Returns the smallest stored mip level that is still at least min_size (width, height);
+    level 0 if min_size is None.
+    """
+    level = 0
+    if min_size is None:
+        return level
+    for i in range(1, len(mip_offsets)):
+        if mip_offsets[i] == 0 or mip_sizes[i] == 0:
+            break
+        if max(1, width >> i) < min_size[0] or max(1, height >> i) < min_size[1]:
+            break
+        level = i
+    return level
+
+def blp_to_pil(data, min_size: tuple = None):
     """
     Reads a BLP bytes data (assumed to use CONTENT_JPEG) and restores the original JPEG data
     by combining the common JPEG header and the first mipmap's JPEG data block.
@@ -30,6 +47,8 @@ def blp_to_pil(data):
     extracts the first mipmap's JPEG data (using the first element of the
     MipMapOffsets and MipMapSizes arrays) and writes their concatenation to output_jpeg.
     In case of discrepancies (e.g. file too short), an exception is raised.
+    If min_size (width, height) is given, the smallest mipmap that still covers it
+    is decoded instead of the first one (for thumbnails).
     """
     file_len = len(data)
     if file_len < 156:
@@ -45,8 +64,12 @@ def blp_to_pil(data):
         raise ValueError(f"BLP compression is {compression}, expected 0 (CONTENT_JPEG).")
     
     # Read first mipmap offset and size:
-    first_mipmap_offset = struct.unpack_from("<I", data, 28)[0]  # first DWORD in MipMapOffsets array
-    first_mipmap_size   = struct.unpack_from("<I", data, 92)[0]  # first DWORD in MipMapSizes array
+    width, height = struct.unpack_from("<II", data, 12)
+    mip_offsets = struct.unpack_from("<16I", data, 28)  # MipMapOffsets array
+    mip_sizes   = struct.unpack_from("<16I", data, 92)  # MipMapSizes array
+    mip_level = pick_blp_mip_level(width, height, mip_offsets, mip_sizes, min_size)
+    first_mipmap_offset = mip_offsets[mip_level]
+    first_mipmap_size   = mip_sizes[mip_level]
 
     # After the fixed header (156 bytes) comes the JPEG header block.
     offset = 156
@@ -75,21 +98,6 @@ def blp_to_pil(data):
     img = Image.open(io.BytesIO(restored_jpeg))
 
     if img.mode=="CMYK":
-        img=YMCK_to_RGBA(img)
+        img=ymck_to_rgba(img)
 
     return img
-
-def YMCK_to_RGBA(im: Image.Image):
-    """Convert        an RGB(A) image to CMYX, where K is trivial (all zero)."""
-    # Ensure we have an RGB image
-    im = im.convert("CMYK") 
-    c, m, y, k = im.split()
-    # Swap red and blue channels (i.e., invert R and B)
-    c, y = y, c
-    # Manually compute the CMYK channels:
-    r = c.point(lambda i: 255 - i)
-    g = m.point(lambda i: 255 - i)
-    b = y.point(lambda i: 255 - i)
-    a = k.point(lambda i: 255 - i)
-    # Merge the manually computed CMY channels with the trivial K channel
-    return Image.merge("RGBA", (r, g, b, a))
\ No newline at end of file
@@ -0,0 +1,34 @@
+import math
+
+# Size budget options of the BLP section, in KB (gv.BLP_BUDGET_UNIT_BYTES).
+# Config files are edited by hand: a value that is not a number is treated as
+# "no budget" everywhere, and the generators report it once per run
+# (find_invalid_budgets) instead of failing.
+
+BUDGET_OPTIONS = ("blp_size_budget", "blp_total_budget", "map_size_budget")
+
+def parse_budget(value) -> float:
+    """Budget in KB, 0 for none. Raises ValueError for anything but an empty value or a finite number >= 0."""
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return 0.0
+    budget = float(value)
+    if not math.isfinite(budget) or budget < 0:
+        raise ValueError(f"Invalid budget: {value}")
+    return budget
+
+def get_budget(suboption_dict: dict, option: str) -> float:
+    """Budget option of a suboption dict in KB; 0 if it is not set or not valid."""
+    try:
+        return parse_budget(suboption_dict.get(option))
+    except (TypeError, ValueError):
+        return 0.0
+
+def find_invalid_budgets(suboption_dict: dict) -> list:
+    """[(option, value)] of the budget options that get_budget ignores."""
+    invalid = []
+    for option in BUDGET_OPTIONS:
+        try:
+            parse_budget(suboption_dict.get(option))
+        except (TypeError, ValueError):
+            invalid.append((option, suboption_dict.get(option)))
+    return invalid
@@ -0,0 +1,61 @@
+import numpy as np
+from PIL import Image
+
+# Channel kernels shared by the BLP encoder and decoder.
+# Every *_inplace kernel takes an H x W x 4 uint8 array and rewrites it in a single pass,
+# so a whole mip pyramid can be swizzled without intermediate band images.
+
+OPACITY_MAX = 255
+
+def has_transparency(im: Image.Image) -> bool:
+    """Returns True if an RGBA image has at least one non-opaque pixel."""
+    # If the image mode is not RGBA, it has no transparency
+    if im.mode != "RGBA":
+        return False
+    alpha_min, _ = im.getchannel("A").getextrema()
+    return alpha_min < OPACITY_MAX
+
+def swap_red_blue_inplace(arr: np.ndarray) -> np.ndarray:
+    """RGBA <-> BGRA: exchanges channels 0 and 2, alpha is kept."""
+    arr[..., [0, 2]] = arr[..., [2, 0]]
+    return arr
+
+def rgbx_to_ymcx_inplace(arr: np.ndarray) -> np.ndarray:
+    """
+    RGBX -> YMCX: inverts the colour channels in reversed order, i.e.
+    (255-B, 255-G, 255-R) as CMY, and clears the fourth (K) channel.
+    """
+    np.subtract(OPACITY_MAX, arr[..., 2::-1], out=arr[..., :3])
+    arr[..., 3] = 0
+    return arr
+
+def ymck_to_rgba_inplace(arr: np.ndarray) -> np.ndarray:
+    """YMCK -> RGBA: reverse of rgbx_to_ymcx_inplace, K is decoded as inverted alpha."""
+    swap_red_blue_inplace(arr)
+    np.subtract(OPACITY_MAX, arr, out=arr)
+    return arr
+
+def image_to_array(im: Image.Image, mode: str) -> np.ndarray:
+    """Returns a writable H x W x 4 uint8 copy of the image converted to mode."""
+    if im.mode != mode:
+        im = im.convert(mode)
+    return np.array(im)
+
+def array_to_image(arr: np.ndarray, mode: str) -> Image.Image:
+    """Wraps an H x W x 4 uint8 array as a Pillow image of the given 4-channel mode."""
+    height, width = arr.shape[:2]
+    return Image.frombuffer(mode, (width, height), np.ascontiguousarray(arr), "raw", mode, 0, 1)
+
+def rgba_to_bgra(im: Image.Image) -> Image.Image:
+    arr = swap_red_blue_inplace(image_to_array(im, "RGBA"))
+    return array_to_image(arr, "RGBA")
+
+def rgb_to_ymcx(im: Image.Image) -> Image.Image:
+    """Convert an RGB(A) image to CMYX, where K is trivial (all zero). Alpha is dropped."""
+    arr = rgbx_to_ymcx_inplace(image_to_array(im, "RGBX"))
+    return array_to_image(arr, "CMYK")
+
+def ymck_to_rgba(im: Image.Image) -> Image.Image:
+    """Convert a CMYK image written by rgb_to_ymcx (or a 4-channel BLP JPEG) back to RGBA."""
+    arr = ymck_to_rgba_inplace(image_to_array(im, "CMYK"))
+    return array_to_image(arr, "RGBA")
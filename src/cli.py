@@ -1,17 +1,19 @@
 import argparse
+import csv
+import json
 import sys
 import os
 import vars.global_var as gv
 import vars.var_for_init as iv
 import src.config_manager as config_manager
 import src.localisation as localisation
-from src.generator import generate_images
 from src.stored_var import CurrentSelection
 from src.cli_logger import TerminalLogger
 from src.custom_frames import init_CUSTOM_FRAMES_DICT_from_string
-def parse_arguments():
+def parse_arguments(argv: list = None):
     """
     Parses command-line arguments for CLI mode.
+    argv defaults to the arguments of the current process.
     """
     parser = argparse.ArgumentParser(description=f"{gv.PROGRAM_FULLNAME} - GUI & CLI Mode")
     
@@ -41,22 +43,399 @@ def parse_arguments():
               "Any options not provided will be taken from the default configuration.")
     )
 
-    # If sys.argv only contains the script name, return empty parsed arguments
-    if len(sys.argv) == 1:
-        return parser.parse_args([])
+    parser.add_argument(
+        "--jobs-file",
+        type=str,
+        help=("Process a JSON or CSV list of jobs in one run instead of -i/-d. Each job names its inputs "
+              "and may override options of the base config (default + -c), e.g. another border or BLP quality.")
+    )
+
+    parser.add_argument(
+        "--output-archive",
+        type=str,
+        help=("Write all outputs into one archive (.zip, .tar, .tar.gz or .tgz) instead of loose files. "
+              "Members keep the folder layout they would have in the output folder.")
+    )
+
+    parser.add_argument(
+        "--archive-compression",
+        choices=list(gv.OUTPUT_ARCHIVE_COMPRESSIONS),
+        default=gv.OUTPUT_ARCHIVE_COMPRESSIONS[0],
+        help="Compression of ZIP members for --output-archive: deflate (default) or stored."
+    )
+
+    parser.add_argument(
+        "--dedup-links",
+        choices=list(gv.DEDUP_LINK_MODES),
+        default=gv.DEDUP_LINK_MODES[0],
+        help=("Inputs with identical content are rendered once; this sets how the outputs of the copies are "
+              "stored: copy (default), hardlink or reflink (copy-on-write clone; falls back to copy where unsupported). "
+              "In tar archives, hardlink stores link members.")
+    )
+
+    parser.add_argument(
+        "--output-cache",
+        action="store_true",
+        help=("Keep encoded outputs in a persistent cache and reuse them in later runs when the input content, "
+              "the options and the frame files are unchanged (also across output folders and configs).")
+    )
+
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        help="Folder of the --output-cache. Default: a folder in the user config folder."
+    )
+
+    parser.add_argument(
+        "--cache-stats",
+        action="store_true",
+        help="Print the size and hit rate of the --output-cache and exit (unless inputs are given too)."
+    )
+
+    parser.add_argument(
+        "--cache-clear",
+        action="store_true",
+        help="Delete every entry of the --output-cache and exit (unless inputs are given too)."
+    )
+
+    parser.add_argument(
+        "--shard",
+        type=str,
+        help=("Generate only shard K of N (e.g. --shard 2/4) to split a batch across processes or machines. "
+              "Output names match an unsharded run; each shard writes a manifest of its outputs.")
+    )
+
+    parser.add_argument(
+        "--shard-manifest",
+        type=str,
+        help=("Manifest file written by --shard (default: shard-K-of-N.json in the output folder) "
+              "or by --merge-shards (default: manifest.json next to the first shard manifest).")
+    )
+
+    parser.add_argument(
+        "--merge-shards",
+        type=str,
+        help=("Validate the manifests of all shards of a run (comma-separated) and combine them into one manifest. "
+              "Fails if a shard is missing, repeated, or belongs to another run.")
+    )
+
+    parser.add_argument(
+        "--spool",
+        type=str,
+        help=("Queue the -i/-d job as work-unit tickets in this shared folder instead of generating it. "
+              "Any number of --worker processes, on any machine mounting the folder, then process the tickets.")
+    )
+
+    parser.add_argument(
+        "--worker",
+        type=str,
+        help="Process tickets of the spool folder given here until the queue is empty."
+    )
+
+    parser.add_argument(
+        "--lease",
+        type=float,
+        default=gv.SPOOL_LEASE_S,
+        help=f"Seconds after which a ticket claimed by a --worker that did not finish it is queued again (default: {gv.SPOOL_LEASE_S})."
+    )
+
+    parser.add_argument(
+        "--profiles",
+        type=str,
+        help=("Generate the inputs once for each of these profiles (comma-separated names from data/profiles, "
+              "e.g. classicsd,reforged, or .cfg files) in a single pass, each into its own subfolder of the output folder.")
+    )
+
+    parser.add_argument(
+        "--pipe",
+        action="store_true",
+        help=("Read one image, or a tar stream of images, from stdin and write to stdout: the encoded file if the "
+              "options select a single output for a single image, otherwise a tar stream of all outputs. "
+              "Messages go to stderr.")
+    )
+
+    parser.add_argument(
+        "--pipe-name",
+        type=str,
+        default="icon.png",
+        help="File name of the single image read by --pipe, used to name its outputs (default: icon.png)."
+    )
+
+    parser.add_argument(
+        "--events-file",
+        type=str,
+        help=("Also write the generation events (planned, started, output_written, notice, error, finished) "
+              "to this file, one JSON object per line, for build tools and dashboards.")
+    )
+
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help=("After processing the inputs, keep watching them and regenerate the outputs of every "
+              "input file that changes. Press CTRL+C to stop.")
+    )
+
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help=("Run as a resident job server on a local socket (see --socket). "
+              "The process stays loaded with warm caches and runs the jobs sent with --client one after another.")
+    )
+
+    parser.add_argument(
+        "--client",
+        action="store_true",
+        help=("Send this job (the other arguments: -i, -d, -c, ...) to a running --serve process "
+              "and print its output here.")
+    )
+
+    parser.add_argument(
+        "--socket",
+        type=str,
+        help="Socket file used by --serve and --client. Default: a file in the user config folder."
+    )
 
-    return parser.parse_args()
+    if argv is None:
+        argv = sys.argv[1:]
+    return parser.parse_args(argv)
 
-def cli_mode(args):
+def cli_mode(args, on_job_start = None):
     """
     Runs the program in command-line mode, processing images based on arguments.
+    on_job_start: passed on to run_cli_jobs (the --serve process uses it to cancel jobs).
     """
+    if args.cache_clear or args.cache_stats:
+        run_cache_commands(args)
+        if not args.image and not args.directory and not args.jobs_file:
+            return
+    if args.merge_shards:
+        run_merge_shards(args)
+        return
+    if args.pipe:
+        run_pipe_mode(args)
+        return
+    if args.worker:
+        from src.spool import run_worker
+        run_worker(args.worker, args.lease, create_cli_output_cache(args))
+        return
+    if args.spool:
+        run_spool_job(args)
+        return
+    if args.shard:
+        from src.shard import parse_shard
+        try:
+            parse_shard(args.shard)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        if args.watch or args.jobs_file:
+            print("Error: --shard splits one -i/-d job; it cannot be combined with --watch or --jobs-file.")
+            sys.exit(1)
+    if args.profiles and (args.output_archive or args.shard or args.watch):
+        print("Error: --profiles writes into one output folder per profile; it cannot be combined with "
+              "--output-archive, --shard or --watch.")
+        sys.exit(1)
+    if args.watch:
+        if args.jobs_file or args.output_archive:
+            print("Error: --watch works with -i/-d inputs written to the output folder, not with --jobs-file or --output-archive.")
+            sys.exit(1)
+        from src.generator import generate_images
+        from src.watch import watch_inputs
+        output_cache = create_cli_output_cache(args)
+        reporters = create_cli_reporters(args)
+        watch_inputs(prepare_cli_job(args), lambda input_data: generate_images(input_data,TerminalLogger(),output_cache=output_cache,reporters=reporters))
+        return
+    run_cli_jobs(args, on_job_start)
+
+def run_pipe_mode(args):
+    """--pipe: exits with status 1 if an input could not be processed."""
+    if args.image or args.directory or args.jobs_file or args.output_archive or args.shard or args.profiles or args.watch:
+        print("Error: --pipe reads its input from stdin and writes to stdout; it cannot be combined with "
+              "-i, -d, --jobs-file, --output-archive, --shard, --profiles or --watch.", file=sys.stderr)
+        sys.exit(1)
+    if sys.stdin.isatty():
+        print("Error: --pipe expects an image or a tar stream on stdin.", file=sys.stderr)
+        sys.exit(1)
+    import contextlib
+    from src.pipe import run_pipe
+    # stdout carries the output data: messages of the configuration loading go to stderr.
+    with contextlib.redirect_stdout(sys.stderr):
+        input_data = load_cli_selection(load_cli_configuration(args.config))
+    try:
+        failed = run_pipe(input_data, args.pipe_name, sys.stdin.buffer, sys.stdout.buffer, args.dedup_links)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    except BrokenPipeError:
+        # The reader stopped early (e.g. "| head"): end quietly, like other filters.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
+    if failed:
+        sys.exit(1)
+
+def create_cli_output_cache(args):
+    """The OutputCache of --output-cache, or None."""
+    if not args.output_cache:
+        return None
+    from src.output_cache import OutputCache
+    return OutputCache(args.cache_dir)
+
+def create_cli_reporters(args) -> list:
+    """Event reporters of --events-file (empty without it). Exits with status 1 if the file cannot be opened."""
+    if not args.events_file:
+        return []
+    from src.events import JsonLinesReporter
+    try:
+        stream = open(args.events_file, "w", encoding="utf-8")
+    except OSError as e:
+        print(f"Error: Unable to open the events file '{args.events_file}': {e}")
+        sys.exit(1)
+    return [JsonLinesReporter(stream)]
+
+def create_cli_shard(args):
+    """The ShardPlan of --shard, or None."""
+    if not args.shard:
+        return None
+    from src.shard import ShardPlan, parse_shard
+    return ShardPlan(*parse_shard(args.shard))
+
+def run_spool_job(args):
+    """--spool: queues the -i/-d job as tickets for --worker processes."""
+    if args.watch or args.jobs_file or args.output_archive or args.shard:
+        print("Error: --spool queues one -i/-d job for folder output; it cannot be combined with "
+              "--watch, --jobs-file, --output-archive or --shard.")
+        sys.exit(1)
     if not args.image and not args.directory:
-        print("Error: You must specify either an input image (-i) or an input directory (-d).")
+        print("Error: You must specify an input image (-i) or an input directory (-d) to queue.")
+        sys.exit(1)
+    config = load_cli_configuration(args.config)
+    images = [file.strip() for file in args.image.split(",")] if args.image else []
+    directories = [dir.strip() for dir in args.directory.split(",")] if args.directory else []
+    input_data = build_cli_selection(config, images, directories)
+    if input_data is None:
+        sys.exit(1)
+    from src.watch import needs_full_rebuild
+    if needs_full_rebuild(input_data):
+        print("Error: A map or total BLP size budget covers all outputs and cannot be split into tickets.")
         sys.exit(1)
+    from src.spool import queue_job
+    try:
+        job_id, num_tickets = queue_job(args.spool, config, input_data)
+    except OSError as e:
+        print(f"Error: Unable to queue the job in '{args.spool}': {e}")
+        sys.exit(1)
+    print(f"Queued job {job_id}: {num_tickets} tickets in {args.spool}. Start workers with --worker {args.spool}")
+
+def run_merge_shards(args):
+    """--merge-shards: exits with status 1 if the manifests do not form one complete run."""
+    from src.shard import merge_manifests
+    manifest_paths = [path.strip() for path in args.merge_shards.split(",") if path.strip()]
+    merged, problems = merge_manifests(manifest_paths)
+    if problems:
+        for problem in problems:
+            print(f"Error: {problem}")
+        sys.exit(1)
+    output_path = args.shard_manifest or os.path.join(os.path.dirname(os.path.abspath(manifest_paths[0])), "manifest.json")
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(merged, f, indent=1)
+    print(f"Merged {merged['shards']} shards: {merged['units']} units, {len(merged['files'])} files. Manifest: {output_path}")
+
+def run_cache_commands(args):
+    """--cache-clear, then --cache-stats."""
+    from src.output_cache import OutputCache
+    output_cache = OutputCache(args.cache_dir)
+    if args.cache_clear:
+        output_cache.clear()
+        print(f"Output cache cleared: {output_cache.disk_cache.get_dir()}")
+    if args.cache_stats:
+        stats = output_cache.stats()
+        lookups = stats["hits"] + stats["misses"]
+        hit_rate = f"{100 * stats['hits'] / lookups:.1f}%" if lookups else "-"
+        print(f"Output cache: {stats['dir']}")
+        print(f"  Entries: {stats['entries']}")
+        print(f"  Size: {stats['bytes'] / (1024 * 1024):.1f} MB of {stats['max_bytes'] / (1024 * 1024):.0f} MB")
+        print(f"  Hits: {stats['hits']}, misses: {stats['misses']}, hit rate: {hit_rate}")
+
+def run_cli_jobs(args, on_job_start = None):
+    """
+    Generates every job of a CLI run into one output sink (the output folders,
+    or the --output-archive shared by all jobs).
+    on_job_start(input_data) is called before each job is generated.
+    """
+    from src.output_sink import create_output_sink
+    try:
+        sink = create_output_sink(args.output_archive, args.archive_compression, args.dedup_links)
+    except (OSError, ValueError) as e:
+        print(f"Error: Unable to create the output archive: {e}")
+        sys.exit(1)
+    output_cache = create_cli_output_cache(args)
+    shard = create_cli_shard(args)
+    reporters = create_cli_reporters(args)
+    try:
+        for input_data in iter_cli_jobs(args):
+            if on_job_start:
+                on_job_start(input_data)
+            if shard is not None:
+                from src.watch import needs_full_rebuild
+                if needs_full_rebuild(input_data):
+                    print("Error: A map or total BLP size budget covers all outputs and cannot be split with --shard.")
+                    sys.exit(1)
+            # Imported here: the generator pulls in numpy and Pillow,
+            # which argument errors and --help do not need.
+            if args.profiles:
+                from src.generator import generate_profiles
+                from src.events import JsonLinesReporter
+                runs = build_cli_profiles(args, input_data)
+                run_reporters = {label: [JsonLinesReporter(reporter.stream, run=label) for reporter in reporters] for label, _ in runs}
+                generate_profiles(runs,TerminalLogger(),output_sink=sink,output_cache=output_cache,control=input_data,reporters=run_reporters)
+            else:
+                from src.generator import generate_images
+                generate_images(input_data,TerminalLogger(),output_sink=sink,output_cache=output_cache,shard=shard,reporters=reporters)
+            if input_data.stop_requested:
+                break
+            if shard is not None:
+                write_shard_manifest(args, shard, sink)
+    finally:
+        sink.close()
+        for reporter in reporters:
+            reporter.stream.close()
+
+def build_cli_profiles(args, input_data: CurrentSelection) -> list:
+    """The (label, CurrentSelection) runs of --profiles on top of a job. Exits with status 1 on an unknown profile."""
+    from src.profiles import build_profile_selections
+    profiles = [name.strip() for name in args.profiles.split(",") if name.strip()]
+    try:
+        runs = build_profile_selections(input_data, profiles)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print(f"Using profiles: {', '.join(label for label, _ in runs)}")
+    return runs
 
+def write_shard_manifest(args, shard, sink):
+    manifest_path = args.shard_manifest or shard.default_manifest_path(sink.archive_path if sink.is_archive else None)
+    try:
+        shard.write_manifest(manifest_path)
+    except OSError as e:
+        print(f"Error: Unable to write the shard manifest '{manifest_path}': {e}")
+        sys.exit(1)
+    print(f"Shard {shard.index}/{shard.count}: {len(shard.owned_units)} of {shard.num_units} units, "
+          f"{len(shard.files)} files. Manifest: {manifest_path}")
+
+def iter_cli_jobs(args):
+    """
+    Yields the prepared CurrentSelection of every job of a CLI run:
+    the -i/-d job, or one per entry of the --jobs-file.
+    """
+    if args.jobs_file:
+        yield from iter_jobs_file(args)
+    else:
+        yield prepare_cli_job(args)
+
+def load_cli_configuration(config_path: str = None):
+    """Default configuration with the options of config_path (if given) applied on top."""
     def_config_file_path = config_manager.DEFAULT_CFG
-    user_config_file_path = args.config if args.config else def_config_file_path
+    user_config_file_path = config_path if config_path else def_config_file_path
 
     main_config=config_manager.init_configuration(def_config_file_path)
     user_config=config_manager.init_configuration(user_config_file_path)
@@ -66,43 +445,83 @@ def cli_mode(args):
         sys.exit(1)
 
     config_manager.apply_subconfig_on_configuration(user_config,main_config)
+    return main_config
+
+def prepare_cli_job(args) -> CurrentSelection:
+    """
+    Loads the configuration, custom frames, localisation and input list of a CLI job.
+    Exits with status 1 if the job has no valid input.
+    """
+    if not args.image and not args.directory:
+        print("Error: You must specify either an input image (-i), an input directory (-d) or a jobs file (--jobs-file).")
+        sys.exit(1)
+
+    main_config = load_cli_configuration(args.config)
 
     print(f"Running in CLI mode. *Press CTRL+C to stop processing.")
-    print(f"Using config: {user_config_file_path}")
+    print(f"Using config: {args.config if args.config else config_manager.DEFAULT_CFG}")
 
-    input_data=CurrentSelection(None)
-    input_data.read_config_file(main_config)
+    images = [file.strip() for file in args.image.split(",")] if args.image else []
+    directories = [dir.strip() for dir in args.directory.split(",")] if args.directory else []
+    input_data = build_cli_selection(main_config, images, directories)
+    if input_data is None:
+        sys.exit(1)
+    return input_data
 
-    # load custom frames
-    custom_frame_list = input_data.get_value("CUSTOM_SECTION","custom_frames")
-    if custom_frame_list and custom_frame_list!=gv.DEFAULT_OPTION_PLACEHOLDER:
-        init_CUSTOM_FRAMES_DICT_from_string(custom_frame_list)
-        for key in iv.CUSTOM_FRAMES_DICT.keys():
-            input_data.add_option(gv.OPTIONS_BORDER['section'],key,True)
-    
-    # load custom backgrounds
-    from src.custom_backgrounds import init_CUSTOM_BACKGROUNDS_DICT
-    init_CUSTOM_BACKGROUNDS_DICT()
+def iter_jobs_file(args):
+    """
+    Yields one CurrentSelection per entry of args.jobs_file. Each entry starts from the
+    base configuration (default + -c), then its own config file and option overrides
+    are applied with apply_subconfig_on_configuration. Entries without valid input are skipped.
+    """
+    from src.jobs_file import read_jobs_file, build_override_config
+    try:
+        jobs = read_jobs_file(args.jobs_file)
+    except (OSError, ValueError, csv.Error) as e:
+        print(f"Error: Unable to read the jobs file '{args.jobs_file}': {e}")
+        sys.exit(1)
+    if args.image or args.directory:
+        print("Warning: -i and -d are ignored when a jobs file is given.")
+
+    print(f"Running in CLI mode. *Press CTRL+C to stop processing.")
+    print(f"Using config: {args.config if args.config else config_manager.DEFAULT_CFG}")
+    print(f"Using jobs file: {args.jobs_file} ({len(jobs)} jobs)")
+
+    for job in jobs:
+        print(f"Job {job['number']}/{len(jobs)}")
+        config = load_cli_configuration(args.config)
+        if job["config"]:
+            if os.path.isfile(job["config"]):
+                config_manager.apply_subconfig_on_configuration(config_manager.init_configuration(job["config"]), config)
+            else:
+                print(f"Warning: Job {job['number']}: config file '{job['config']}' not found, using the base config.")
+        override, unknown = build_override_config(config, job["options"])
+        if unknown:
+            print(f"Warning: Job {job['number']}: unknown options are ignored: {', '.join(unknown)}")
+        config_manager.apply_subconfig_on_configuration(override, config)
+
+        input_data = build_cli_selection(config, job["images"], job["directories"])
+        if input_data is None:
+            print(f"Skipping job {job['number']}.")
+            continue
+        yield input_data
+
+def build_cli_selection(main_config, images: list, directories: list):
+    """
+    Creates the CurrentSelection of a job from its configuration and input paths.
+    Prints the problems found in the inputs; returns None if no valid input remains.
+    """
+    input_data = load_cli_selection(main_config)
 
     # Supported extensions
     extensions_raw = input_data.get_value("OPTIONS_INPUT","input_process_filetypes")
     extensions = set(extensions_raw.split(","))
 
-    # load localisation
-    language_code = input_data.get_value("LANG","program_lang")
-    isatty = False
-    if hasattr(sys,"stdout"): 
-        if hasattr(sys.stdout,"isatty"):
-            isatty = sys.stdout.isatty()
-    if not(isatty):
-        language_code="eng"
-    localisation.update_localisation(language_code)
-
     valid_files=None
     valid_dirs=None
     # Process input files
-    if args.image:
-        input_paths = [file.strip() for file in args.image.split(",")]
+    if images:
+        input_paths = images
         valid_files = [file for file in input_paths if os.path.splitext(file)[1][1:].lower() in extensions]
         excluded_files = [file for file in input_paths if file not in valid_files]
         
@@ -110,8 +529,7 @@ def cli_mode(args):
             print(f"Warning: The following files have unsupported extensions and will be excluded: {', '.join(excluded_files)}")
         
     # Process input directory
-    if args.directory:
-        directories = [dir.strip() for dir in args.directory.split(",")]
+    if directories:
         valid_dirs = [dir for dir in directories if os.path.isdir(dir)]
 
         excluded_dirs = [dir for dir in directories if dir not in valid_dirs]
@@ -121,8 +539,37 @@ def cli_mode(args):
     # Ensure at least one valid input source is provided
     if not valid_dirs  and not valid_files:
         print("Error: No valid input files or directories provided. Please specify at least one input source.")
-        sys.exit(1)
+        return None
 
     input_data.init_input_items(folders=valid_dirs,images=valid_files)
+    return input_data
+
+def load_cli_selection(main_config) -> CurrentSelection:
+    """
+    Creates a CurrentSelection without inputs from a configuration and loads what it
+    refers to: custom frames (as borders), custom backgrounds and the localisation.
+    """
+    input_data=CurrentSelection(None)
+    input_data.read_config_file(main_config)
 
-    generate_images(input_data,TerminalLogger())
\ No newline at end of file
+    # load custom frames
+    custom_frame_list = input_data.get_value("CUSTOM_SECTION","custom_frames")
+    if custom_frame_list and custom_frame_list!=gv.DEFAULT_OPTION_PLACEHOLDER:
+        init_CUSTOM_FRAMES_DICT_from_string(custom_frame_list)
+        for key in iv.CUSTOM_FRAMES_DICT.keys():
+            input_data.add_option(gv.OPTIONS_BORDER['section'],key,True)
+    
+    # load custom backgrounds
+    from src.custom_backgrounds import init_CUSTOM_BACKGROUNDS_DICT
+    init_CUSTOM_BACKGROUNDS_DICT()
+
+    # load localisation
+    language_code = input_data.get_value("LANG","program_lang")
+    isatty = False
+    if hasattr(sys,"stdout"): 
+        if hasattr(sys.stdout,"isatty"):
+            isatty = sys.stdout.isatty()
+    if not(isatty):
+        language_code="eng"
+    localisation.update_localisation(language_code)
+    return input_data
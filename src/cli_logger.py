@@ -72,7 +72,7 @@ class TerminalLogger:
         else:
             filled_char = "#"
             empty_char  =  "_" 
-        filled = int((current / total) * bar_length)
+        filled = int((current / total) * bar_length) if total else bar_length
         gauge = "|" + filled_char * filled + empty_char * (bar_length - filled) + "|"
         return gauge
 
@@ -0,0 +1,209 @@
+import os
+import sys
+import json
+import socket
+import threading
+import traceback
+import contextlib
+import vars.global_var as gv
+from src.system import get_special_config_dir
+
+# Resident job server (--serve) and its thin client (--client).
+# The server is one warm process: modules, frame/background images and the preview
+# and disk caches stay loaded between jobs. Jobs run one at a time; further clients
+# wait in the socket backlog.
+#
+# Protocol: one JSON object per line, UTF-8, in both directions.
+#   client -> server: {"argv": [...], "cwd": "...", "isatty": bool}, later {"cancel": true}
+#   server -> client: {"out": "..."} for every piece of terminal output, then {"exit": status}
+
+def get_socket_path(socket_path: str = None) -> str:
+    if socket_path:
+        return os.path.abspath(socket_path)
+    return os.path.join(get_special_config_dir(), gv.SERVE_SOCKET_FILENAME)
+
+def send_message(conn, message: dict):
+    conn.sendall((json.dumps(message) + "\n").encode("utf-8"))
+
+class JobOutput:
+    """
+    Stands in for sys.stdout while a job runs: everything the CLI prints is forwarded
+    to the client. isatty reports the client terminal, so the live gauge and the
+    localisation behave as in a local run.
+    """
+    def __init__(self, conn, isatty: bool, on_disconnect):
+        self.conn = conn
+        self.client_isatty = isatty
+        self.on_disconnect = on_disconnect
+        self.connected = True
+        self.lock = threading.Lock()
+
+    def write(self, text: str):
+        if not text:
+            return 0
+        with self.lock:
+            if self.connected:
+                try:
+                    send_message(self.conn, {"out": text})
+                except OSError:
+                    self.connected = False
+                    self.on_disconnect()
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self) -> bool:
+        return self.client_isatty
+
+class ServerJob:
+    """State of the running job shared with the thread that listens for a cancel."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.input_data = None
+        self.cancelled = False
+
+    def set_input_data(self, input_data):
+        with self.lock:
+            self.input_data = input_data
+            if self.cancelled:
+                input_data.stop_requested = True
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            if self.input_data is not None:
+                self.input_data.stop_requested = True
+
+def listen_for_cancel(reader, job: ServerJob):
+    """Stops the job when the client asks for it or goes away (Ctrl+C, closed terminal)."""
+    try:
+        for line in reader:
+            if json.loads(line).get("cancel"):
+                break
+    except (OSError, ValueError):
+        pass
+    job.cancel()
+
+def get_unsupported_modes(args) -> list:
+    """Options of a client job that the server cannot run: they outlive the job or need the client's terminal."""
+    modes = (("--watch", args.watch), ("--pipe", args.pipe), ("--worker", args.worker),
+             ("--serve", args.serve), ("--client", args.client))
+    return [option for option, enabled in modes if enabled]
+
+def run_server_job(conn):
+    """Runs one client job in this process (as cli_mode would) and reports its exit status."""
+    from src.cli import parse_arguments, cli_mode
+
+    reader = conn.makefile("r", encoding="utf-8")
+    request = json.loads(reader.readline())
+    job = ServerJob()
+    output = JobOutput(conn, bool(request.get("isatty")), job.cancel)
+    threading.Thread(target=listen_for_cancel, args=(reader, job), daemon=True).start()
+
+    status = 0
+    previous_cwd = os.getcwd()
+    try:
+        os.chdir(request.get("cwd") or previous_cwd)
+        with contextlib.redirect_stdout(output):
+            try:
+                args = parse_arguments(request.get("argv", []))
+                unsupported = get_unsupported_modes(args)
+                if unsupported:
+                    print(f"Error: {', '.join(unsupported)} cannot run as a --client job; run it without --client.")
+                    status = 1
+                else:
+                    cli_mode(args, on_job_start = job.set_input_data)
+            except SystemExit as e:
+                status = e.code if isinstance(e.code, int) else 1
+            except Exception:
+                print(traceback.format_exc())
+                status = 1
+    finally:
+        os.chdir(previous_cwd)
+    if output.connected:
+        try:
+            send_message(conn, {"exit": status})
+        except OSError:
+            pass
+    return status
+
+def serve(socket_path: str = None):
+    """Accepts --client jobs on a Unix domain socket until interrupted."""
+    if not hasattr(socket, "AF_UNIX"):
+        print("Error: --serve needs Unix domain sockets, which this system does not provide.")
+        sys.exit(1)
+    socket_path = get_socket_path(socket_path)
+    if os.path.exists(socket_path):
+        # A socket file left by a server that did not shut down cleanly is reused.
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(socket_path)
+            print(f"Error: A server is already listening on {socket_path}")
+            sys.exit(1)
+        except OSError:
+            os.remove(socket_path)
+        finally:
+            probe.close()
+
+    # Warm up: importing the generator loads numpy, Pillow and the converter up front.
+    import src.generator
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen(gv.SERVE_SOCKET_BACKLOG)
+    print(f"Serving jobs on {socket_path}. *Press CTRL+C to stop the server.")
+    try:
+        while True:
+            conn, _ = server.accept()
+            with conn:
+                try:
+                    status = run_server_job(conn)
+                    print(f"Job finished with status {status}.")
+                except (OSError, ValueError) as e:
+                    print(f"Job failed: {e}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+def run_client(argv: list, socket_path: str = None) -> int:
+    """
+    Sends a job to the --serve process and prints its output as it arrives.
+    CTRL+C asks the server to stop the job; its abort message is still shown.
+    Returns the exit status of the job.
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        print("Error: --client needs Unix domain sockets, which this system does not provide.")
+        return 1
+    socket_path = get_socket_path(socket_path)
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(socket_path)
+    except OSError as e:
+        print(f"Error: No server is listening on {socket_path} ({e}). Start one with --serve.")
+        return 1
+
+    isatty = hasattr(sys.stdout, "isatty") and sys.stdout.isatty()
+    job_argv = [arg for arg in argv if arg not in ("--client", "--serve")]
+    with conn:
+        send_message(conn, {"argv": job_argv, "cwd": os.getcwd(), "isatty": isatty})
+        reader = conn.makefile("r", encoding="utf-8")
+        while True:
+            try:
+                line = reader.readline()
+                if not line:
+                    print("Error: The server closed the connection.")
+                    return 1
+                message = json.loads(line)
+                if "exit" in message:
+                    return message["exit"]
+                sys.stdout.write(message.get("out", ""))
+                sys.stdout.flush()
+            except KeyboardInterrupt:
+                try:
+                    send_message(conn, {"cancel": True})
+                except OSError:
+                    return 1
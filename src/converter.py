@@ -2,15 +2,14 @@ from PIL import Image, ImageEnhance
 import numpy as np
 import io
 import os
+import struct
 import math
 import zlib
 import vars.global_var as gv
-from src.blp1_JPEG_encoder import export_blp1_jpeg
-from src.dds_dxt_encoder import export_dds_dxt
 from src.system import get_data_subdir
-from src.psd_decoder import psd_path_to_pil
 from src.blp_decoder import blp_path_to_pil, blp_to_pil
 from src.custom_frames import get_custom_frame_section
+from src.budget_options import get_budget
 
 # Global cache for loaded frame images
 FRAME_CACHE = {}
@@ -60,6 +59,8 @@ def load_pil_image(path):
     extension = os.path.splitext(path)[1].lower()
     
     if extension == ".psd":
+        # pytoshop is imported only when a PSD is actually opened.
+        from src.psd_decoder import psd_path_to_pil
         try:
             return psd_path_to_pil(path)
         except Exception:
@@ -90,6 +91,58 @@ def load_pil_image(path):
     
     return img
 
+def probe_image_file(path) -> dict:
+    """
+    Reads image metadata from the file header without decoding pixels:
+    {"width", "height", "mode", "has_alpha", "layers"}.
+    has_alpha reflects the pixel format, not whether any pixel is transparent.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    try:
+        with Image.open(path) as img:
+            width, height = img.size
+            mode = img.mode
+            has_alpha = mode in ("RGBA", "LA", "PA", "RGBa", "La") or "transparency" in img.info
+            layers = getattr(img, "n_frames", 1)
+    except Exception:
+        if extension != ".blp":
+            raise
+        # BLP files Pillow cannot open: the dimensions and alpha flag are in the fixed header.
+        with open(path, "rb") as f:
+            header = f.read(20)
+        if header[:4] not in (b"BLP1", b"BLP2"):
+            raise ValueError(f"Invalid magic: {header[:4]}. Not a valid BLP file.")
+        flags, width, height = struct.unpack_from("<III", header, 8)
+        mode = "RGBA"
+        has_alpha = flags != 0
+        layers = 1
+    return {"width": width, "height": height, "mode": mode, "has_alpha": has_alpha, "layers": layers}
+
+def load_pil_thumbnail(path, size: tuple) -> Image.Image:
+    """
+    Loads a reduced copy of the image at path that covers size (width, height), for previews.
+    Full-resolution decoding is avoided where the format allows it:
+      - JPEG is decoded at a reduced DCT scale (draft mode),
+      - BLP decodes the smallest stored mipmap that still covers size,
+      - PSD reads the flattened composite instead of merging the layers.
+    Anything else (or a failed fast path) falls back to load_pil_image.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    img = None
+    try:
+        if extension == ".blp":
+            img = blp_path_to_pil(path, min_size=size)
+        elif extension == ".psd":
+            img = Image.open(path)
+            img.load()
+    except Exception:
+        img = None
+    if img is None:
+        img = load_pil_image(path)
+    # Image.thumbnail applies JPEG draft mode before decoding and keeps the aspect ratio.
+    img.thumbnail(size, Image.LANCZOS)
+    return img
+
 def clear_alpha(input_image: Image.Image) -> Image.Image:
     size=input_image.size
     input_image = input_image.convert("RGBA")
@@ -177,7 +230,7 @@ def crop_image(input_image: Image.Image, crop_percent:float = 0.1) -> Image.Imag
     # Crop and return the image
     return input_image.crop((left, top, right, bottom))
 
-def apply_frame(input_image: Image.Image, size_option: str = "size_256x256", style_option: str = "style_hd", border_option:str ="border_button", extras:dict = None, misc:dict = None, custom_background_name: str = "None") -> Image.Image:
+def apply_frame(input_image: Image.Image, size_option: str = "size_256x256", style_option: str = "style_hd", border_option:str ="border_button", extras:dict = None, misc:dict = None, custom_background_name: str = "None", fit_size: tuple = None, source_size: tuple = None) -> Image.Image:
     """
     Applies a frame border to the input_image based on the provided options.
     
@@ -187,6 +240,11 @@ def apply_frame(input_image: Image.Image, size_option: str = "size_256x256", sty
         style_option (str): One of OPTIONS_STYLE ("style_sd", "style_hd").
         border_option (str): One of OPTIONS_BORDER ("border_button", "border_disabled",
                             "border_passive", "border_autocast", "border_none").
+        fit_size (tuple): Optional (width, height) box. If the output canvas is larger,
+                          the whole composition is rendered at the reduced scale that fits
+                          into the box (input and frame assets are downscaled first).
+        source_size (tuple): Original (width, height) of the input if input_image is a
+                             reduced copy of it; used for size_original and frame picking.
                             
     Returns:
         PIL.Image: The updated image after resizing and (if applicable) combining with the frame border.
@@ -213,7 +271,7 @@ def apply_frame(input_image: Image.Image, size_option: str = "size_256x256", sty
         crop = False
 
     # Determine canvas / frame sizing mode
-    orig_w, orig_h = input_image.size
+    orig_w, orig_h = source_size if source_size else input_image.size
     is_size_original = (size_option == gv.OPTION_SIZE_ORIGINAL)
     is_size_custom = (size_option == gv.OPTION_SIZE_CUSTOM)
 
@@ -291,6 +349,19 @@ def apply_frame(input_image: Image.Image, size_option: str = "size_256x256", sty
 
     if target_size is None:
         raise ValueError(f"Invalid size option: {size_option}")
+
+    # Reduced-scale rendering (preview cells): scale every layout value down once.
+    render_scale = 1.0
+    if fit_size:
+        render_scale = min(1.0, fit_size[0] / canvas_size[0], fit_size[1] / canvas_size[1])
+    if render_scale < 1.0:
+        def _scaled(value):
+            return (max(1, int(round(value[0] * render_scale))), max(1, int(round(value[1] * render_scale))))
+        canvas_size = _scaled(canvas_size)
+        target_size = _scaled(target_size)
+        frame_size = _scaled(frame_size)
+        if custom_position:
+            custom_position = (int(round(custom_position[0] * render_scale)), int(round(custom_position[1] * render_scale)))
     
     # Crop and Resize
     if crop:
@@ -325,6 +396,9 @@ def apply_frame(input_image: Image.Image, size_option: str = "size_256x256", sty
             
         # Use a cache key based on the current options.
         cache_key = (effective_size_option, style_option, border_option)
+        if render_scale < 1.0:
+            # Downscaled frame assets are cached separately per render size.
+            cache_key = cache_key + (frame_size,)
         
         # Attempt to retrieve the frame image from the global cache.
         if cache_key in FRAME_CACHE:
@@ -492,7 +566,20 @@ def apply_frame(input_image: Image.Image, size_option: str = "size_256x256", sty
     return resized_image
 
 
-def apply_format(input_image: Image.Image, format_option: str = "format_dds", format_suboption_dict: dict = {}, only_preview: bool = False):
+def get_blp_num_mips(format_suboption_dict: dict):
+    """Number of BLP mip levels requested by blp_mipmap; None means the full chain ("Auto")."""
+    if "blp_mipmap" in format_suboption_dict:
+        if format_suboption_dict["blp_mipmap"]=="Auto":
+            return None
+        return int(format_suboption_dict["blp_mipmap"])+1
+    return None
+
+def apply_format(input_image: Image.Image, format_option: str = "format_dds", format_suboption_dict: dict = {}, only_preview: bool = False, format_report: dict = None):
+    """
+    Encodes input_image into the requested output format and returns a BytesIO buffer.
+    If format_report is a dict, encoder decisions (e.g. the BLP quality picked under
+    a size budget) are stored in it for the caller.
+    """
 
     buffer = io.BytesIO()
 
@@ -513,6 +600,7 @@ def apply_format(input_image: Image.Image, format_option: str = "format_dds", fo
         else:
             compression = "DXT1"
 
+        from src.dds_dxt_encoder import export_dds_dxt
         try:
             export_dds_dxt(input_image,buffer,compression = compression, num_mips = num_mips)
         except Exception as e:
@@ -527,20 +615,25 @@ def apply_format(input_image: Image.Image, format_option: str = "format_dds", fo
             quality=int(format_suboption_dict["blp_compression"])
         else:
             quality=95
-        if "blp_mipmap" in format_suboption_dict:
-            if format_suboption_dict["blp_mipmap"]=="Auto":
-                num_mips=None
-            else:
-                num_mips=int(format_suboption_dict["blp_mipmap"])+1
-        else:
-            num_mips=None 
+        num_mips = get_blp_num_mips(format_suboption_dict)
         if "blp_progressive" in format_suboption_dict:
             best_compression=format_suboption_dict["blp_progressive"]
         else:
             best_compression=False
+        # Per-file size budget in KB; blp_compression becomes the upper quality bound.
+        size_budget = get_budget(format_suboption_dict, "blp_size_budget")
 
+        from src.blp1_JPEG_encoder import export_blp1_jpeg, export_blp1_jpeg_within_budget
         try:
-            if only_preview or (not best_compression):
+            if size_budget > 0:
+                max_size = int(size_budget * gv.BLP_BUDGET_UNIT_BYTES)
+                quality, size = export_blp1_jpeg_within_budget(input_image, buffer, max_size = max_size, max_quality = quality, min_quality = gv.BLP_MINCOMPRESSION, num_mips = num_mips,
+                                                              best_compression = best_compression and not only_preview)
+                if format_report is not None:
+                    format_report["blp_quality"] = quality
+                    format_report["blp_size"] = size
+                    format_report["blp_budget"] = max_size
+            elif only_preview or (not best_compression):
                 export_blp1_jpeg(input_image,buffer,quality = quality, num_mips = num_mips, progressive = False, optimize_coding = False, force_bgra = True)
             else:
                 # Try all 8 variants (combinations of progressive, optimize_coding, force_bgra)
@@ -593,6 +686,25 @@ def apply_format(input_image: Image.Image, format_option: str = "format_dds", fo
 
     return buffer
 
+def apply_format_preview(input_image: Image.Image, format_option: str = "format_dds", format_suboption_dict: dict = {}) -> Image.Image:
+    """
+    Returns input_image as it looks after encoding to format_option, for previews.
+
+    Lossless formats are returned unchanged. DDS and BLP are encoded with a single
+    mip level (the only one that is displayed) and decoded back, so codec artifacts
+    are shown at the resolution of input_image without building mip chains.
+    BLP with a size budget needs the real output size to pick its quality, so it
+    goes through the full encode.
+    """
+    if format_option not in ("format_dds", "format_blp"):
+        return input_image
+    preview_suboption_dict = dict(format_suboption_dict)
+    if not get_budget(preview_suboption_dict, "blp_size_budget") > 0:
+        preview_suboption_dict["dds_mipmap"] = "0"
+        preview_suboption_dict["blp_mipmap"] = "0"
+    buffer = apply_format(input_image, format_option, preview_suboption_dict, only_preview = True)
+    return bufferbytedata_to_pilimage(buffer, gv.OUTPUT_FILE_FORMATS[format_option])
+
 def bufferbytedata_to_pilimage(buffer, extension: str = None) -> Image.Image:
     """
     Converts a BytesIO buffer to a PIL Image. If standard loading fails, it saves
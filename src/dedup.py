@@ -0,0 +1,80 @@
+import hashlib
+import vars.global_var as gv
+from src.disk_cache import input_identity
+from src.preview_cache import LRUCache
+
+# Content-addressed deduplication of one generation run.
+# Inputs with identical bytes produce identical outputs for every option variant,
+# so only the first copy is rendered and encoded; the later copies reuse its encoded
+# files, which the output sink stores as copies, hardlinks or reflinks.
+
+# Content hashes by input_identity, so unchanged files are read only once per process.
+CONTENT_HASH_CACHE = LRUCache(gv.DEDUP_HASH_CACHE_MAXNUM)
+
+def input_content_hash(path: str) -> str:
+    key = input_identity(path)
+    digest = CONTENT_HASH_CACHE.get(key)
+    if digest is None:
+        hasher = hashlib.sha1()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                hasher.update(chunk)
+        digest = hasher.hexdigest()
+        CONTENT_HASH_CACHE.put(key, digest)
+    return digest
+
+class OutputDedup:
+    """
+    Maps every input of a run to the first input with the same bytes and keeps the
+    encoded outputs of those first copies until their last identical copy has used them.
+    Variants are identified by (size, style, border, format) options.
+    """
+    def __init__(self, paths: list):
+        self.source_of = {}  # input index -> index of its first identical input
+        first_index = {}
+        for index, path in enumerate(paths):
+            try:
+                digest = input_content_hash(path)
+            except OSError:
+                continue  # unreadable here; the generator reports it when loading
+            if digest in first_index:
+                self.source_of[index] = first_index[digest]
+            else:
+                first_index[digest] = index
+        self.copies = {}  # source index -> number of its identical copies
+        for source in self.source_of.values():
+            self.copies[source] = self.copies.get(source, 0) + 1
+        self.sources = set(self.copies)
+        self.outputs = {}  # (source index, variant) -> (output path, data, format report)
+        self.uses_left = {}  # (source index, variant) -> copies that have not taken the output yet
+        self.skipped_renders = 0
+        self.skipped_encodes = 0
+
+    def is_duplicate(self, index: int) -> bool:
+        return index in self.source_of
+
+    def keep(self, index: int, variant: tuple, output_path: str, data: bytes, format_report: dict):
+        """Remembers an output of index if a later identical input will need it."""
+        if index in self.sources:
+            self.outputs[(index, variant)] = (output_path, data, format_report)
+            self.uses_left[(index, variant)] = self.copies[index]
+
+    def source_output(self, index: int, variant: tuple):
+        """
+        (output path, data, format report) of the first identical input, or None.
+        Each copy takes each output once; it is dropped after the last copy took it.
+        """
+        if index not in self.source_of:
+            return None
+        key = (self.source_of[index], variant)
+        output = self.outputs.get(key)
+        if output is not None:
+            self.uses_left[key] -= 1
+            if not self.uses_left[key]:
+                del self.outputs[key]
+                del self.uses_left[key]
+        return output
+
+    def summary(self, num_inputs: int) -> tuple:
+        """(duplicate inputs, inputs, renders skipped, encodes skipped)"""
+        return (len(self.source_of), num_inputs, self.skipped_renders, self.skipped_encodes)
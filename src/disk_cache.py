@@ -0,0 +1,153 @@
+import io
+import os
+import json
+import hashlib
+import threading
+from PIL import Image
+import vars.global_var as gv
+from src.system import get_special_config_dir
+from src.converter import probe_image_file
+
+class DiskCache:
+    """
+    A size-capped folder of cache entries inside the user config folder.
+    Entries are written atomically (safe against concurrent writers and processes);
+    reads refresh their mtime, and once the folder grows beyond max_bytes the least
+    recently used entries are deleted down to gv.DISK_CACHE_EVICT_RATIO of it.
+    Files starting with "_" are bookkeeping and never evicted.
+    """
+    def __init__(self, dirname: str, max_bytes: int, cache_dir: str = None):
+        self.dirname = dirname
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir  # resolved lazily, creating the folder on first use
+        self.size = None  # total bytes on disk, counted on first write
+        self.lock = threading.Lock()
+
+    def get_dir(self) -> str:
+        if self.cache_dir is None:
+            self.cache_dir = os.path.join(get_special_config_dir(), self.dirname)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        return self.cache_dir
+
+    def entry_path(self, key, suffix: str) -> str:
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.get_dir(), digest + suffix)
+
+    def touch_entry(self, path: str):
+        """Marks an entry as recently used."""
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def read_entry(self, path: str):
+        """Bytes of an entry, or None if it does not exist."""
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        self.touch_entry(path)
+        return data
+
+    def write_entry(self, path: str, data: bytes):
+        """Writes an entry atomically and evicts if needed."""
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self.lock:
+            if self.size is None:
+                self.size = self.usage()[1]
+            else:
+                self.size += len(data)
+            if self.size > self.max_bytes:
+                self.size = self.evict(int(self.max_bytes * gv.DISK_CACHE_EVICT_RATIO))
+
+    def entries(self) -> list:
+        """(mtime, size, path) of every entry."""
+        entries = []
+        for entry in os.scandir(self.get_dir()):
+            if entry.is_file() and not entry.name.startswith("_"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def usage(self) -> tuple:
+        """(number of entries, total bytes)"""
+        entries = self.entries()
+        return len(entries), sum(size for _, size, _ in entries)
+
+    def evict(self, target_bytes: int) -> int:
+        """Deletes the least recently used entries until the cache is below target_bytes; returns the new size."""
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= target_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        return total
+
+    def clear(self):
+        with self.lock:
+            self.evict(0)
+            self.size = 0
+
+# Persistent cache of image probes and small thumbnails, kept between program runs.
+# Entries are named after a hash of input_identity(path), so a rewritten input file
+# simply misses. Each probe is a JSON file and each thumbnail a PNG file.
+PREVIEW_DISK_CACHE = DiskCache(gv.DISK_CACHE_DIRNAME, gv.DISK_CACHE_MAX_BYTES)
+
+def input_identity(path: str) -> tuple:
+    """(absolute path, mtime, size) of an input file; changes whenever the file is rewritten."""
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+def clear_disk_cache():
+    PREVIEW_DISK_CACHE.clear()
+
+def probe_image(path: str) -> dict:
+    """
+    Image metadata of path ({"width", "height", "mode", "has_alpha", "layers"}),
+    from the disk cache when the file is unchanged; the file is opened only on a miss.
+    """
+    identity = input_identity(path)
+    probe_path = PREVIEW_DISK_CACHE.entry_path(identity, ".json")
+    try:
+        with open(probe_path, "r", encoding="utf-8") as f:
+            probe = json.load(f)
+        PREVIEW_DISK_CACHE.touch_entry(probe_path)
+        return probe
+    except (OSError, ValueError):
+        pass
+    probe = probe_image_file(path)
+    try:
+        PREVIEW_DISK_CACHE.write_entry(probe_path, json.dumps(probe).encode("utf-8"))
+    except OSError:
+        pass
+    return probe
+
+def read_thumbnail(identity: tuple, size: tuple):
+    """Cached thumbnail of the given cell size, or None."""
+    thumbnail_path = PREVIEW_DISK_CACHE.entry_path(identity, f"_{size[0]}x{size[1]}.png")
+    try:
+        with Image.open(thumbnail_path) as img:
+            img.load()
+            thumbnail = img.copy()
+        PREVIEW_DISK_CACHE.touch_entry(thumbnail_path)
+        return thumbnail
+    except (OSError, ValueError):
+        return None
+
+def write_thumbnail(identity: tuple, size: tuple, image: Image.Image):
+    thumbnail_path = PREVIEW_DISK_CACHE.entry_path(identity, f"_{size[0]}x{size[1]}.png")
+    try:
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
+        PREVIEW_DISK_CACHE.write_entry(thumbnail_path, buffer.getvalue())
+    except OSError:
+        pass
@@ -0,0 +1,172 @@
+import os
+import json
+import time
+from dataclasses import dataclass, field, asdict
+from typing import Optional
+from src.localisation import get_local_text
+from src.log import log, LogOutputStream
+
+# Typed events of a generation run. iter_generate_images (src/generator.py) and
+# agenerate_images (src/async_generator.py) yield them instead of writing to a log, so
+# consumers pull them at their own pace and several runs can be interleaved:
+#   Planned        inputs, outputs to write and where they go
+#   Started        an input file is taken up
+#   OutputWritten  one output file, with its size and the time it took
+#   Notice         a warning on the way (log key and arguments)
+#   Error          the run fails; Finished follows
+#   Finished       always the last event: status, counts and the summaries of the run
+# Reporters turn them into output: LogReporter for the GUI log and gauge or the terminal
+# (LogOutputStream), JsonLinesReporter for one JSON object per line.
+
+@dataclass
+class GenerationEvent:
+    type = "event"
+    elapsed: float = field(default=0.0, kw_only=True)  # seconds since the start of the run
+
+    def to_dict(self) -> dict:
+        return {"type": self.type, **asdict(self)}
+
+@dataclass
+class Planned(GenerationEvent):
+    type = "planned"
+    inputs: int
+    total: int
+    first_input: str = ""
+    output_folder: Optional[str] = None
+    archive_path: Optional[str] = None
+    samedir: bool = False
+
+@dataclass
+class Started(GenerationEvent):
+    type = "started"
+    input: str
+    index: int
+
+@dataclass
+class OutputWritten(GenerationEvent):
+    type = "output_written"
+    input: str
+    output: str
+    variant: tuple  # (size, style, border, format)
+    nbytes: int
+    seconds: float  # rendering (unless reused), encoding and writing of this output
+    current: int
+    total: int
+    report: dict = field(default_factory=dict)  # encoder decisions (BLP budget)
+
+@dataclass
+class Notice(GenerationEvent):
+    type = "notice"
+    log_key: str
+    args: tuple = ()
+
+@dataclass
+class Error(GenerationEvent):
+    type = "error"
+    log_key: str
+    args: tuple = ()
+
+@dataclass
+class Finished(GenerationEvent):
+    type = "finished"
+    status: str  # "success", "aborted", "failed" or "no_input"
+    current: int = 0
+    total: int = 0
+    nbytes: int = 0
+    summary: list = field(default_factory=list)  # [(log key, args)] of the run summaries
+
+class RunClock:
+    """Stamps the events of one run with the seconds since its start."""
+    def __init__(self):
+        self.start = time.perf_counter()
+
+    def stamp(self, event: GenerationEvent) -> GenerationEvent:
+        event.elapsed = round(time.perf_counter() - self.start, 6)
+        return event
+
+class LogReporter:
+    """
+    Shows the events of a run through a LogOutputStream with the messages of the log:
+    the live gauge line, warnings and errors, the success or abort line and the summaries.
+    With a TerminalLogger as info_stream, the output location is printed at the end.
+    """
+    def __init__(self, log_stream: LogOutputStream, info_stream=None):
+        self.log = log_stream
+        self.info_stream = info_stream
+        self.planned = None
+        self.gauge_active = False
+
+    def clear_gauge(self):
+        if self.gauge_active:
+            self.log.clear_pos()
+            self.gauge_active = False
+
+    def handle(self, event: GenerationEvent):
+        if isinstance(event, OutputWritten):
+            self.log.update_live_log(log_key="output_generate_images_update",
+                                     message=os.path.basename(event.input),
+                                     current=event.current,
+                                     total=event.total,
+                                     nbytes=event.nbytes,
+            )
+            self.gauge_active = True
+        elif isinstance(event, (Notice, Error)):
+            self.clear_gauge()
+            self.log.msg(event.log_key, *event.args)
+        elif isinstance(event, Planned):
+            self.planned = event
+        elif isinstance(event, Finished):
+            self.finish(event)
+
+    def finish(self, event: Finished):
+        if event.status == "aborted":
+            self.log.update_live_log(log_key="output_generate_images_abort_by_user",
+                                     message="",
+                                     current=event.current,
+                                     total=event.total,
+            )
+            self.log.clear_pos()
+            self.gauge_active = False
+            return
+        if event.status != "success":
+            return
+        if self.planned.inputs == 1:
+            message = get_local_text("log_file_str").format(self.planned.first_input)
+        else:
+            message = get_local_text("log_files_str").format(str(self.planned.inputs))
+        self.log.update_live_log(log_key="output_generate_images_success",
+                                 message=message,
+                                 current=event.current,
+                                 total=event.total,
+        )
+        self.log.clear_pos()
+        self.gauge_active = False
+        for log_key, args in event.summary:
+            self.log.msg(log_key, *args)
+        if hasattr(self.info_stream, "is_cli"):
+            if self.planned.archive_path:
+                print(f"Processing completed. Output archive: {self.planned.archive_path}")
+            elif self.planned.samedir:
+                print("Processing completed. Output files saved in the same directories as input files.")
+            else:
+                print(f"Processing completed. Output folder: {self.planned.output_folder}")
+
+class JsonLinesReporter:
+    """
+    Writes every event as one JSON object per line to a text stream (--events-file).
+    Notices and errors also carry their localised message; run, if given, names the run
+    (the profile label of generate_profiles).
+    """
+    def __init__(self, stream, run: str = None):
+        self.stream = stream
+        self.run = run
+
+    def handle(self, event: GenerationEvent):
+        data = event.to_dict()
+        if isinstance(event, (Notice, Error)):
+            message = log(event.log_key, *event.args)
+            data["message"] = message[0] if isinstance(message, tuple) else message
+        if self.run is not None:
+            data["run"] = self.run
+        self.stream.write(json.dumps(data, ensure_ascii=False, default=str) + "\n")
+        self.stream.flush()
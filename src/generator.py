@@ -1,15 +1,20 @@
 import os
 import re
+import time
 from typing import Any, Optional
 import vars.global_var as gv
 import vars.var_for_init as iv
-from src.converter import load_pil_image
+from src.preview_cache import get_source_image
 from src.converter import apply_frame
 from src.converter import apply_format
-from src.converter import save_buffer_to_file
-from src.localisation import get_local_text
+from src.output_sink import FolderSink
+from src.map_budget import MapBudget
+from src.budget_options import get_budget, find_invalid_budgets
+from src.dedup import OutputDedup
+from src.shard import input_key
 from src.stored_var import CurrentSelection  
 from src.log import LogOutputStream
+from src.events import GenerationEvent, Planned, Started, OutputWritten, Notice, Error, Finished, RunClock, LogReporter
 from src.system import get_data_subdir
 
 def is_valid_filename(filename):
@@ -90,7 +95,7 @@ def build_output_path(original_path, output_folder,
                       size_option, style_option, border_option, format_option, 
                       output_suboption_dict,
                       true_style_options, true_format_options, true_border_options, used_output_paths,
-                      relative_subfolder=""):
+                      relative_subfolder="", create_folders: bool = True):
     """
     Constructs the output file path with the following behavior:
     
@@ -112,6 +117,8 @@ def build_output_path(original_path, output_folder,
        output_suboption_dict["outputset_merged"] is True, then parent and child folder
        names are merged (using an underscore) when there is only one child option.
     
+    With create_folders=False, the folders are left to the output sink.
+
     5. Before returning the final file path, if a file with that name already exists 
        (was already created during this run), a suffix _N is added
        (with N starting at 1) to the basename until a unique file name is found.
@@ -165,7 +172,7 @@ def build_output_path(original_path, output_folder,
             else:
                 folders.append(folder_name)
         final_folder = os.path.join(output_folder, *folders)
-        if not os.path.exists(final_folder):
+        if create_folders and not os.path.exists(final_folder):
             os.makedirs(final_folder)
     else:
         final_folder = output_folder
@@ -173,10 +180,10 @@ def build_output_path(original_path, output_folder,
     # Append the relative subfolder (replicating input folder structure) if provided.
     if relative_subfolder:
         final_folder = os.path.join(final_folder, relative_subfolder)
-        if not os.path.exists(final_folder):
+        if create_folders and not os.path.exists(final_folder):
             os.makedirs(final_folder)
     else:
-        if not os.path.exists(final_folder):
+        if create_folders and not os.path.exists(final_folder):
             os.makedirs(final_folder)
     
     # 5. Construct the file path and ensure uniqueness.
@@ -189,24 +196,100 @@ def build_output_path(original_path, output_folder,
     used_output_paths.add(unique_path)
     return unique_path
 
+class BlpBudget:
+    """
+    Tracks BLP size budgets during one generation run.
+    - blp_size_budget: KB per BLP file.
+    - blp_total_budget: KB for all BLP files of the run. Each file gets an equal share
+      of what is left, so bytes saved on small icons carry over to the following ones.
+    The qualities picked by the encoder and the achieved sizes are collected for the summary.
+    """
+    def __init__(self, format_suboption_dict: dict, num_blp_files: int):
+        unit = gv.BLP_BUDGET_UNIT_BYTES
+        self.file_budget = get_budget(format_suboption_dict, "blp_size_budget") * unit
+        self.total_budget = get_budget(format_suboption_dict, "blp_total_budget") * unit
+        self.remaining_budget = self.total_budget
+        self.files_left = num_blp_files
+        self.results = []  # (output_path, quality, size, budget)
+
+    def is_active(self) -> bool:
+        return self.file_budget > 0 or self.total_budget > 0
+
+    def suboptions_for_next_file(self, format_suboption_dict: dict) -> dict:
+        """Returns the format suboptions with blp_size_budget set to this file's share."""
+        if self.total_budget <= 0:
+            return format_suboption_dict
+        share = max(self.remaining_budget, 0) / max(self.files_left, 1)
+        if self.file_budget > 0:
+            share = min(share, self.file_budget)
+        # Never pass 0: that would switch the encoder back to the fixed quality.
+        share = max(share, 1)
+        return {**format_suboption_dict, "blp_size_budget": share / gv.BLP_BUDGET_UNIT_BYTES}
+
+    def record(self, output_path: str, format_report: dict) -> bool:
+        """Stores the encoder decision for one file. Returns True if the file exceeds its budget."""
+        if "blp_quality" not in format_report:
+            return False
+        size = format_report["blp_size"]
+        budget = format_report["blp_budget"]
+        self.remaining_budget -= size
+        self.files_left -= 1
+        self.results.append((output_path, format_report["blp_quality"], size, budget))
+        return size > budget
+
+    def summary(self) -> tuple:
+        """(files, min quality, max quality, average quality, written KB, files over budget)"""
+        qualities = [quality for _, quality, _, _ in self.results]
+        total_size = sum(size for _, _, size, _ in self.results)
+        over_budget = sum(1 for _, _, size, budget in self.results if size > budget)
+        average = round(sum(qualities) / len(qualities), 1)
+        return (len(self.results), min(qualities), max(qualities), average,
+                round(total_size / gv.BLP_BUDGET_UNIT_BYTES, 1), over_budget)
+
 # --- Main generator function ---
-def generate_images(input_data:CurrentSelection = {}, info_stream: Optional[Any] = None):
+def generate_images(input_data:CurrentSelection = {}, info_stream: Optional[Any] = None, output_sink: Optional[Any] = None,
+                    output_cache: Optional[Any] = None, shard: Optional[Any] = None, reporters: Optional[list] = None):
+    """
+    Runs iter_generate_images to the end and reports its events to info_stream
+    (GUI log window or TerminalLogger, see src/events.py LogReporter) and to reporters, if given.
+    """
+    reporters = [LogReporter(LogOutputStream(info_stream), info_stream), *(reporters or [])]
+    for event in iter_generate_images(input_data, output_sink, output_cache, shard):
+        dispatch_event(event, reporters, input_data)
+
+def dispatch_event(event: GenerationEvent, reporters: list, input_data: CurrentSelection):
+    """Hands an event to the reporters. CTRL+C while reporting stops the run as it does while rendering."""
+    try:
+        for reporter in reporters:
+            reporter.handle(event)
+    except KeyboardInterrupt:
+        input_data.stop_requested = True
+
+def iter_generate_images(input_data:CurrentSelection = {}, output_sink: Optional[Any] = None,
+                         output_cache: Optional[Any] = None, shard: Optional[Any] = None,
+                         frame_memo: Optional[dict] = None):
     """
     Generates images by applying frame and format transformations on each image
     from input_data.paths. The processing iterates over all true option variations.
+    The encoded files go to output_sink (see src/output_sink.py): loose files in the
+    output folder by default, or members of an archive opened and closed by the caller.
+    With an output_cache (see src/output_cache.py), outputs encoded by earlier runs
+    are reused instead of rendered and encoded again.
+    With a shard (see src/shard.py and src/spool.py), only the work units of that shard are generated.
 
-    This function works in two regimes:
-      - Command line: prints status messages to the console.
-      - GUI: updates the progress bar, status labels, and logs messages via the
-             functions provided in gui_generate_output.py.
+    Nothing is logged here: the run is a lazy iterator of the events of src/events.py,
+    ending with Finished, which generate_images hands to the log (GUI or terminal).
+    Several runs can proceed side by side (generate_profiles): they share frame_memo,
+    which keeps the rendered frames of the current input for the runs that ask for the same frame.
     """
-    log=LogOutputStream(info_stream)
+    clock = RunClock()
 
     #Gather actual data
     input_data.gather_paths()
     file_items=input_data.paths_rel
     if not(file_items):
-        log.msg("output_no_image_warning")
+        yield clock.stamp(Notice("output_no_image_warning"))
+        yield clock.stamp(Finished("no_input"))
         return
 
     # Retrieve the true-valued options and format suboptions.
@@ -219,40 +302,79 @@ def generate_images(input_data:CurrentSelection = {}, info_stream: Optional[Any]
     custom_background_name = input_data.get_value("CUSTOM_SECTION", "custom_background")
     if custom_background_name is None:
         custom_background_name = "None"
+    # Everything besides the input and the variant that reaches apply_frame.
+    frame_options_key = (tuple(sorted((key, str(value)) for key, value in extras_suboption_dict.items())),
+                         tuple(sorted((key, str(value)) for key, value in misc_suboption_dict.items())),
+                         custom_background_name)
+    sink = output_sink if output_sink is not None else FolderSink()
     # Check if output should be in the same directory as input files
-    output_samedir = output_suboption_dict.get("outputset_samedir", False)
+    # (not for archives: their members are laid out relative to the output folder).
+    output_samedir = output_suboption_dict.get("outputset_samedir", False) and not sink.is_archive
     
     # Try to set and validate the output folder. Process any errors accordingly.
     # Only set output_folder if outputset_samedir is disabled (will be set per-file if enabled)
     if not output_samedir:
         try:
-            output_folder = set_output_folder(output_suboption_dict)
+            output_folder = set_output_folder(output_suboption_dict, create_new_folder = not sink.is_archive)
         except Exception as e:
-            log.msg("output_folder_error",e)
+            yield clock.stamp(Error("output_folder_error", (e,)))
+            yield clock.stamp(Finished("failed"))
             return
     else:
         output_folder = None  # Will be set per-file when outputset_samedir is enabled
+    sink.begin_run(output_folder)
+    if shard is not None:
+        shard.begin_run(output_folder)
 
     num_input_images = len(file_items)
     num_total_images = num_input_images * input_data.calculate_number_of_variations()
-    if num_input_images>1:
+    if max(num_input_images, input_data.num_paths_total)>1:
         output_suboption_dict['output_basename']=None
 
-    #if gui_mode:
-    #    gui_log.GaugeInit(num_total_images)
+    num_blp_files = 0
+    if "format_blp" in true_format_options:
+        num_blp_files = num_input_images * len(true_size_options) * len(true_style_options) * len(true_border_options)
+    blp_budget = BlpBudget(format_suboption_dict, num_blp_files)
+    # The map budget covers the whole output set and supersedes the per-run BLP budget.
+    map_budget = MapBudget(format_suboption_dict)
+    # Inputs with identical bytes are rendered and encoded once.
+    dedup = OutputDedup([path for path, _ in file_items])
+    if output_cache is not None:
+        output_cache.begin_run()
+    if shard is not None:
+        # Copies of an input go to the shard of the input they duplicate, so they are still deduplicated.
+        shard_inputs = [input_key(*file_items[dedup.source_of.get(index, index)]) for index in range(num_input_images)]
+        num_total_images = len(true_format_options) * sum(
+            shard.owns(shard_inputs[index], (size_option, style_option, border_option))
+            for index in range(num_input_images)
+            for size_option in true_size_options
+            for style_option in true_style_options
+            for border_option in true_border_options)
+
     current_count = 0
+    total_bytes = 0
     used_output_paths = set()  # Track generated file paths to avoid duplicates.
+    yield clock.stamp(Planned(inputs=num_input_images,
+                              total=num_total_images,
+                              first_input=os.path.basename(file_items[0][0]),
+                              output_folder=output_folder,
+                              archive_path=sink.archive_path if sink.is_archive else None,
+                              samedir=output_samedir))
     
+    for option, value in find_invalid_budgets(format_suboption_dict):
+        yield clock.stamp(Notice("output_budget_invalid", (option, value)))
     # Check if background was requested but not found (warning only once per generation)
     if custom_background_name and custom_background_name != "None":
         from src.custom_backgrounds import get_background_path
         bg_path = get_background_path(custom_background_name)
         if not bg_path or not os.path.exists(bg_path):
-            log.msg("custom_background_not_found", custom_background_name)
+            yield clock.stamp(Notice("custom_background_not_found", (custom_background_name,)))
 
     # Iterate over each image path.
-    for (path, rel_path) in file_items:
+    for file_index, (path, rel_path) in enumerate(file_items):
         input_basename = os.path.basename(path)
+        is_duplicate = dedup.is_duplicate(file_index)
+        yield clock.stamp(Started(path, file_index))
         
         # If outputset_samedir is enabled, use the input file's directory as output folder
         # This works correctly for both:
@@ -272,74 +394,204 @@ def generate_images(input_data:CurrentSelection = {}, info_stream: Optional[Any]
             for style_option in true_style_options:
                 for border_option in true_border_options:
                     try:
-                        # Load the image.
-                        image = load_pil_image(path)
-                        # Apply the frame transformation with custom background
-                        image = apply_frame(image, size_option, style_option, border_option, extras_suboption_dict, misc_suboption_dict, custom_background_name)
+                        # Output paths of all formats are built for every unit, also for units
+                        # of other shards, so the _N suffixes are those of an unsharded run.
+                        output_paths = [build_output_path(
+                                            original_path=path,
+                                            output_folder=file_output_folder,
+                                            size_option=size_option,
+                                            style_option=style_option,
+                                            border_option=border_option,
+                                            format_option=format_option,
+                                            output_suboption_dict=output_suboption_dict,
+                                            true_style_options=true_style_options,
+                                            true_format_options=true_format_options,
+                                            true_border_options=true_border_options,
+                                            used_output_paths=used_output_paths,
+                                            relative_subfolder=file_relative_subfolder,
+                                            create_folders=False,
+                                        ) for format_option in true_format_options]
+                        if shard is not None:
+                            frame_variant = (size_option, style_option, border_option)
+                            owned = shard.owns(shard_inputs[file_index], frame_variant)
+                            shard_unit = shard.plan_unit(output_paths, owned, path, frame_variant)
+                            if not owned:
+                                continue
+                            output_paths = shard.unit_output_paths(shard_unit, output_paths)
+                        # Rendered on first use below: duplicates and cached variants need no frame.
+                        image = None
+                        if is_duplicate:
+                            # The outputs of the first identical input are reused below.
+                            dedup.skipped_renders += 1
                         # For each available format option, apply further processing.
-                        for format_option in true_format_options:
+                        for format_option, output_path in zip(true_format_options, output_paths):
                             try:
-                                output_path = build_output_path(
-                                    original_path=path,
-                                    output_folder=file_output_folder,
-                                    size_option=size_option,
-                                    style_option=style_option,
-                                    border_option=border_option,
-                                    format_option=format_option,
-                                    output_suboption_dict=output_suboption_dict,
-                                    true_style_options=true_style_options,
-                                    true_format_options=true_format_options,
-                                    true_border_options=true_border_options,
-                                    used_output_paths=used_output_paths,
-                                    relative_subfolder=file_relative_subfolder
-                                )
-                                final_buffer = apply_format(image, format_option, format_suboption_dict)
-                                # Save the final image to the computed output path.
-                                save_buffer_to_file(final_buffer,output_path)
+                                output_start = time.perf_counter()
+                                file_format_suboption_dict = format_suboption_dict
+                                format_report = {}
+                                written_bytes = 0
+                                variant = (size_option, style_option, border_option, format_option)
+                                source_output = dedup.source_output(file_index, variant)
+                                map_blp = map_budget.is_active() and format_option == "format_blp"
+                                if format_option == "format_blp" and blp_budget.is_active() and not map_budget.is_active():
+                                    file_format_suboption_dict = blp_budget.suboptions_for_next_file(format_suboption_dict)
+                                cache_key = None
+                                cached_output = None
+                                if output_cache is not None and not source_output and not map_blp:
+                                    cache_key = output_cache.output_key(path, variant, extras_suboption_dict, misc_suboption_dict,
+                                                                        custom_background_name, file_format_suboption_dict)
+                                    cached_output = output_cache.get(cache_key)
+                                if image is None and not source_output and cached_output is None:
+                                    frame_key = (path, size_option, style_option, border_option, frame_options_key)
+                                    if frame_memo is not None:
+                                        image = frame_memo.get(frame_key)
+                                    if image is None:
+                                        # Load the image (decoded once per input, shared across variations and jobs).
+                                        image = get_source_image(path)
+                                        # Apply the frame transformation with custom background
+                                        image = apply_frame(image, size_option, style_option, border_option, extras_suboption_dict, misc_suboption_dict, custom_background_name)
+                                        if frame_memo is not None:
+                                            frame_memo[frame_key] = image
+                                final_data = None
+                                if source_output:
+                                    source_path, source_data, source_report = source_output
+                                    format_report = dict(source_report)
+                                    dedup.skipped_encodes += 1
+                                    if map_blp:
+                                        map_budget.add_duplicate(source_path, output_path)
+                                    else:
+                                        sink.write_duplicate(output_path, source_path, source_data)
+                                        written_bytes = len(source_data)
+                                        if shard is not None:
+                                            shard.add_output(shard_unit, output_path, source_data)
+                                        if map_budget.is_active():
+                                            map_budget.add_fixed(written_bytes)
+                                elif map_blp:
+                                    # Encoded at all quality points now, written after the allocation.
+                                    map_budget.add_blp(output_path, image)
+                                else:
+                                    if cached_output is not None:
+                                        final_data, format_report = cached_output
+                                    else:
+                                        final_buffer = apply_format(image, format_option, file_format_suboption_dict, format_report = format_report)
+                                        final_data = final_buffer.getvalue()
+                                        if cache_key is not None:
+                                            output_cache.put(cache_key, final_data, format_report)
+                                    # Save the final image to the computed output path.
+                                    sink.write(output_path, final_data)
+                                    written_bytes = len(final_data)
+                                    if shard is not None:
+                                        shard.add_output(shard_unit, output_path, final_data)
+                                    if map_budget.is_active():
+                                        map_budget.add_fixed(written_bytes)
+                                if not source_output:
+                                    dedup.keep(file_index, variant, output_path, final_data, format_report)
+                                over_budget = blp_budget.record(output_path, format_report)
                                 current_count += 1
-                                log.update_live_log(log_key="output_generate_images_update",
-                                                    message=input_basename,
-                                                    current=current_count,
-                                                    total=num_total_images,                
-                                )
+                                total_bytes += written_bytes
+                                output_seconds = round(time.perf_counter() - output_start, 6)
                             except Exception as fe:
-                                log.clear_pos()
-                                log.msg("output_processing_format_error",input_basename,format_option,fe)
+                                yield clock.stamp(Error("output_processing_format_error", (input_basename, format_option, fe)))
+                                yield clock.stamp(Finished("failed", current_count, num_total_images, total_bytes))
                                 return
                             except KeyboardInterrupt:
                                 input_data.stop_requested = True
+                                continue
+                            yield clock.stamp(OutputWritten(input=path,
+                                                            output=output_path,
+                                                            variant=variant,
+                                                            nbytes=written_bytes,
+                                                            seconds=output_seconds,
+                                                            current=current_count,
+                                                            total=num_total_images,
+                                                            report=format_report))
+                            if over_budget:
+                                yield clock.stamp(Notice("output_blp_budget_exceeded",
+                                                         (os.path.basename(output_path),
+                                                          round(format_report["blp_budget"] / gv.BLP_BUDGET_UNIT_BYTES, 1),
+                                                          format_report["blp_quality"],
+                                                          round(format_report["blp_size"] / gv.BLP_BUDGET_UNIT_BYTES, 1))))
                     except Exception as e:
-                        log.clear_pos()
-                        log.msg("output_processing_option_error",input_basename,size_option,style_option,border_option,e)
+                        yield clock.stamp(Error("output_processing_option_error", (input_basename, size_option, style_option, border_option, e)))
+                        yield clock.stamp(Finished("failed", current_count, num_total_images, total_bytes))
                         return
                     except KeyboardInterrupt:
                         input_data.stop_requested = True
 
                     # Check if the GUI has signaled a stop (e.g., via the stop button).
                     if input_data.stop_requested:
-                        log.update_live_log(log_key="output_generate_images_abort_by_user",
-                                            message="",
-                                            current=current_count,
-                                            total=num_total_images,                
-                        )
-                        log.clear_pos()
+                        yield clock.stamp(Finished("aborted", current_count, num_total_images, total_bytes))
                         return
 
-    # Finalize the GUI (re-enable buttons, etc.) if applicable.
-    if num_input_images==1:
-        message=get_local_text("log_file_str").format(os.path.basename(file_items[0][0]))
-    else:
-        message= get_local_text("log_files_str").format(str(num_input_images))
-    log.update_live_log(log_key="output_generate_images_success",
-                        message=message,
-                        current=current_count,
-                        total=num_total_images,                
-    )
-    log.clear_pos()
-
-    # Finalize the CLI
-    if hasattr(info_stream,"is_cli"):
-        if output_samedir:
-            print("Processing completed. Output files saved in the same directories as input files.")
-        else:
-            print(f"Processing completed. Output folder: {output_folder}")
\ No newline at end of file
+    if map_budget.blp_items:
+        minimum_size = map_budget.minimum_size()
+        if minimum_size > map_budget.budget:
+            yield clock.stamp(Notice("output_map_budget_exceeded",
+                                     (round(minimum_size / gv.BLP_BUDGET_UNIT_BYTES, 1),
+                                      round(map_budget.budget / gv.BLP_BUDGET_UNIT_BYTES, 1))))
+        for output_paths, data in map_budget.solve():
+            try:
+                sink.write(output_paths[0], data)
+                for output_path in output_paths[1:]:
+                    sink.write_duplicate(output_path, output_paths[0], data)
+                total_bytes += len(data) * len(output_paths)
+            except Exception as fe:
+                yield clock.stamp(Error("output_processing_format_error", (os.path.basename(output_paths[0]), "format_blp", fe)))
+                yield clock.stamp(Finished("failed", current_count, num_total_images, total_bytes))
+                return
+
+    summary = []
+    if blp_budget.results:
+        summary.append(("output_blp_budget_summary", blp_budget.summary()))
+    if map_budget.blp_items:
+        summary.append(("output_map_budget_summary", map_budget.summary()))
+    if dedup.source_of:
+        summary.append(("output_dedup_summary", dedup.summary(num_input_images)))
+    if output_cache is not None:
+        cache_hits, cache_misses = output_cache.end_run()
+        if cache_hits or cache_misses:
+            summary.append(("output_cache_summary", (cache_hits, cache_hits + cache_misses)))
+    yield clock.stamp(Finished("success", current_count, num_total_images, total_bytes, summary))
+
+def generate_profiles(runs: list, info_stream: Optional[Any] = None, output_sink: Optional[Any] = None,
+                      output_cache: Optional[Any] = None, control: Optional[Any] = None,
+                      reporters: Optional[dict] = None):
+    """
+    Generates several profiles of the same inputs in one pass (see src/profiles.py).
+    runs: [(label, CurrentSelection)]. The runs advance one input at a time in turn, so each
+    input is decoded once for all of them and a frame asked for by several profiles is
+    rendered once. The progress of all runs is shown as one, prefixed with the profile label.
+    control: the selection the runs were built from, if any: its stop_requested (the stop
+    button of the GUI) stops every run, and it is set when a run is stopped.
+    reporters: {label: [reporter]} getting the events of a run besides the log.
+    """
+    import copy
+    from src.progress import CombinedProgress
+
+    combined = CombinedProgress(LogOutputStream(info_stream).progress, [label for label, _ in runs])
+    frame_memo = {}
+    active = []
+    for label, selection in runs:
+        log = LogOutputStream(info_stream)
+        log.progress = combined.run_progress(label)
+        run_reporters = [LogReporter(log, info_stream), *(reporters or {}).get(label, [])]
+        run_cache = copy.copy(output_cache) if output_cache is not None else None
+        events = iter_generate_images(selection, output_sink, run_cache, frame_memo=frame_memo)
+        active.append((selection, events, run_reporters))
+    while active:
+        # One round: every run up to the start of its next input.
+        for run in list(active):
+            selection, events, run_reporters = run
+            for event in events:
+                dispatch_event(event, run_reporters, selection)
+                if isinstance(event, Started):
+                    break
+            else:
+                active.remove(run)
+        frame_memo.clear()
+        stop = (control is not None and control.stop_requested) or any(selection.stop_requested for _, selection in runs)
+        if stop:
+            for _, selection in runs:
+                selection.stop_requested = True
+            if control is not None:
+                control.stop_requested = True
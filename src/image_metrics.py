@@ -0,0 +1,65 @@
+import numpy as np
+from PIL import Image
+
+# Full-reference image quality metrics used by the map size budget allocator.
+# Both metrics work on whole NumPy arrays; transparent pixels are premultiplied
+# to black first, so colour noise under zero alpha is not counted as an error.
+
+PIXEL_MAX = 255.0
+PSNR_IDENTICAL_DB = 100.0  # reported for identical images instead of infinity
+SSIM_WINDOW = 7
+SSIM_K1 = 0.01
+SSIM_K2 = 0.03
+
+def premultiplied_array(im: Image.Image) -> np.ndarray:
+    """Returns an H x W x 3 float64 array of the image RGB premultiplied by its alpha."""
+    arr = np.asarray(im.convert("RGBA"), dtype=np.float64)
+    return arr[..., :3] * (arr[..., 3:4] / PIXEL_MAX)
+
+def luma(rgb: np.ndarray) -> np.ndarray:
+    """ITU-R BT.601 luma of an H x W x 3 array."""
+    return rgb @ np.array([0.299, 0.587, 0.114])
+
+def psnr(reference: np.ndarray, distorted: np.ndarray) -> float:
+    """Peak signal-to-noise ratio in dB over all channels."""
+    mse = np.mean(np.square(reference - distorted))
+    if mse <= 0:
+        return PSNR_IDENTICAL_DB
+    return float(10.0 * np.log10(PIXEL_MAX * PIXEL_MAX / mse))
+
+def box_mean(arr: np.ndarray, window: int) -> np.ndarray:
+    """Mean over every window x window block (valid positions only), via a summed-area table."""
+    table = np.zeros((arr.shape[0] + 1, arr.shape[1] + 1))
+    table[1:, 1:] = arr.cumsum(axis=0).cumsum(axis=1)
+    sums = (table[window:, window:] - table[:-window, window:]
+            - table[window:, :-window] + table[:-window, :-window])
+    return sums / (window * window)
+
+def ssim(reference: np.ndarray, distorted: np.ndarray) -> float:
+    """
+    Mean structural similarity of the luma planes, computed with a uniform
+    SSIM_WINDOW window (shrunk for tiny images).
+    """
+    x = luma(reference)
+    y = luma(distorted)
+    window = max(1, min(SSIM_WINDOW, x.shape[0], x.shape[1]))
+    c1 = (SSIM_K1 * PIXEL_MAX) ** 2
+    c2 = (SSIM_K2 * PIXEL_MAX) ** 2
+
+    mean_x = box_mean(x, window)
+    mean_y = box_mean(y, window)
+    var_x = box_mean(x * x, window) - mean_x * mean_x
+    var_y = box_mean(y * y, window) - mean_y * mean_y
+    cov_xy = box_mean(x * y, window) - mean_x * mean_y
+
+    numerator = (2 * mean_x * mean_y + c1) * (2 * cov_xy + c2)
+    denominator = (mean_x * mean_x + mean_y * mean_y + c1) * (var_x + var_y + c2)
+    return float(np.mean(numerator / denominator))
+
+def compare_images(reference: Image.Image, distorted: Image.Image) -> dict:
+    """Returns {"PSNR": dB, "SSIM": index} of distorted against reference."""
+    ref = premultiplied_array(reference)
+    dist = premultiplied_array(distorted)
+    if ref.shape != dist.shape:
+        raise ValueError(f"Image sizes differ: {reference.size} and {distorted.size}")
+    return {"PSNR": psnr(ref, dist), "SSIM": ssim(ref, dist)}
@@ -0,0 +1,98 @@
+import os
+import csv
+import json
+import configparser
+
+# Job manifests for --jobs-file: one process runs many CLI jobs, each with its own
+# inputs and option overrides on top of the base configuration.
+#
+# JSON: a list of entries (or {"jobs": [...]}), for example
+#   [{"image": "a.png", "options": {"border_passive": true, "BLP": {"blp_compression": 60}}},
+#    {"directory": ["icons/hero"], "config": "hero.cfg"}]
+# CSV: a header row; the columns image, directory and config name the inputs, and every
+#   other column is an option override ("option" or "SECTION.option"), empty cells are skipped.
+#   image and directory cells take several paths separated by ";".
+# Relative paths are resolved against the folder of the jobs file.
+
+JOB_INPUT_KEYS = ("image", "directory", "config")
+JOB_PATH_SEPARATOR = ";"
+
+def split_paths(value, base_dir: str) -> list:
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(JOB_PATH_SEPARATOR)
+    paths = [str(path).strip() for path in value if str(path).strip()]
+    return [path if os.path.isabs(path) else os.path.join(base_dir, path) for path in paths]
+
+def option_value(value) -> str:
+    """Config files store booleans as True/False and everything else as text."""
+    if isinstance(value, bool):
+        return "True" if value else "False"
+    return str(value)
+
+def flatten_options(options: dict) -> list:
+    """[(section or None, option, value)] from flat options and {"SECTION": {...}} groups."""
+    flat = []
+    for key, value in (options or {}).items():
+        if isinstance(value, dict):
+            for option, option_val in value.items():
+                flat.append((key, option, option_value(option_val)))
+        elif "." in key:
+            section, option = key.split(".", 1)
+            flat.append((section, option, option_value(value)))
+        else:
+            flat.append((None, key, option_value(value)))
+    return flat
+
+def make_job(entry: dict, options: dict, base_dir: str, number: int) -> dict:
+    return {
+        "number": number,
+        "images": split_paths(entry.get("image") or entry.get("images"), base_dir),
+        "directories": split_paths(entry.get("directory") or entry.get("directories"), base_dir),
+        "config": split_paths(entry.get("config"), base_dir)[0] if entry.get("config") else None,
+        "options": flatten_options(options),
+    }
+
+def read_jobs_file(path: str) -> list[dict]:
+    """
+    Parses a JSON or CSV job manifest (by extension, JSON otherwise).
+    Returns:
+        list: per job {"number", "images", "directories", "config", "options"},
+              where options is a list of (section or None, option, value).
+    """
+    base_dir = os.path.dirname(os.path.abspath(path))
+    jobs = []
+    if os.path.splitext(path)[1].lower() == ".csv":
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            for number, row in enumerate(csv.DictReader(f), start=1):
+                options = {key.strip(): value.strip() for key, value in row.items()
+                           if key and key.strip() not in JOB_INPUT_KEYS and value and value.strip()}
+                jobs.append(make_job(row, options, base_dir, number))
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        entries = data.get("jobs", []) if isinstance(data, dict) else data
+        for number, entry in enumerate(entries, start=1):
+            jobs.append(make_job(entry, entry.get("options", {}), base_dir, number))
+    return jobs
+
+def build_override_config(config: configparser.ConfigParser, options: list) -> tuple:
+    """
+    Turns job overrides into a config for apply_subconfig_on_configuration.
+    An option given without a section is looked up in the sections of config.
+    Returns:
+        tuple: (override ConfigParser, list of "SECTION.option" names that config does not have)
+    """
+    override = configparser.ConfigParser()
+    unknown = []
+    for section, option, value in options:
+        if section is None:
+            section = next((s for s in config.sections() if config.has_option(s, option)), None)
+        if section is None or not config.has_option(section, option):
+            unknown.append(f"{section}.{option}" if section else option)
+            continue
+        if not override.has_section(section):
+            override.add_section(section)
+        override.set(section, option, value)
+    return override, unknown
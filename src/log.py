@@ -1,6 +1,6 @@
-import wx
 import vars.log_var as lv
 from src.localisation import get_local_text
+from src.progress import ProgressAggregator
 
 
 def log(log_key, *args):
@@ -28,6 +28,14 @@ def log(log_key, *args):
     else:
         return message
     
+def gui_call_after(func, *args, **kwargs):
+    """
+    wx.CallAfter with wx imported on first use: only the GUI has a log_ctrl,
+    so CLI runs never import wx.
+    """
+    import wx
+    wx.CallAfter(func, *args, **kwargs)
+
 class LogOutputStream:
     def __init__(self, stream: None):
         self.gui_mode = False
@@ -39,6 +47,8 @@ class LogOutputStream:
         if hasattr(stream,'is_cli'):
             self.cli_mode = self.stream.is_cli()
             self.cli_log = stream
+        # Live log updates reach the sinks rate-limited, with throughput and ETA.
+        self.progress = ProgressAggregator(self.dispatch_live_log)
 
     def msg(self,log_key, *args):
         if self.gui_mode:
@@ -46,20 +56,24 @@ class LogOutputStream:
         elif self.cli_mode:
             self.cli_log.log(log_key, *args)
 
-    def update_live_log(self, log_key, message, current, total):
+    def update_live_log(self, log_key, message, current, total, nbytes=0):
+         """nbytes: size of the output written since the previous update, for the MB/s figure."""
          message_new, msg_type=log(log_key,message)
+         self.progress.update(msg_type, message_new, current, total, nbytes)
+
+    def dispatch_live_log(self, msg_type, message, current, total):
          if self.gui_mode:
-            wx.CallAfter( self.gui_log.live_update_gauge,
+            gui_call_after( self.gui_log.live_update_gauge,
                          msg_type=msg_type,
-                         message=message_new,
+                         message=message,
                          current=current,
                          total = total,)
          elif self.cli_mode:
-            self.cli_log.live_update_gauge(msg_type, message_new, current, total)
+            self.cli_log.live_update_gauge(msg_type, message, current, total)
 
     def clear_pos(self):
         if self.gui_mode:
-            wx.CallAfter(self.gui_log.clear_pos)
+            gui_call_after(self.gui_log.clear_pos)
         elif self.cli_mode:
             self.cli_log.clear_pos()
 
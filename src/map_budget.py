@@ -0,0 +1,165 @@
+import heapq
+import vars.global_var as gv
+from src.blp_decoder import blp_to_pil
+from src.converter import get_blp_num_mips
+from src.budget_options import get_budget
+from src.image_metrics import premultiplied_array, psnr, ssim
+
+METRICS = {
+    "PSNR": psnr,
+    "SSIM": ssim,
+}
+
+def upper_hull(candidates: list[tuple]) -> list[int]:
+    """
+    Indices of the candidates (sorted by size, no dominated entries) that lie on the
+    upper concave hull of the (size, score) curve. Upgrades along the hull have
+    decreasing score gain per byte, which is what the greedy allocator relies on.
+    """
+    hull = []
+    for index, candidate in enumerate(candidates):
+        size, score = candidate[:2]
+        while len(hull) >= 2:
+            size_a, score_a = candidates[hull[-2]][:2]
+            size_b, score_b = candidates[hull[-1]][:2]
+            # Drop the middle point if it lies below the segment from a to the new point.
+            if (score_b - score_a) * (size - size_a) <= (score - score_a) * (size_b - size_a):
+                hull.pop()
+            else:
+                break
+        hull.append(index)
+    return hull
+
+def allocate_budget(candidate_lists: list[list[tuple]], budget: int) -> list[int]:
+    """
+    Picks one candidate per item so that the total size fits into budget while
+    the summed score is as high as possible (multiple-choice knapsack).
+
+    Each item starts at its smallest candidate. Upgrades along the items' upper hulls
+    are then applied in order of score gain per byte; an upgrade that no longer fits
+    closes that item. The remaining slack is finally spent on the best single jump
+    per item, hull or not.
+
+    Args:
+        candidate_lists: per item, a list of (size, score, ...) tuples sorted by size
+                         without dominated entries.
+    Returns:
+        list: chosen candidate index per item.
+    """
+    choice = [0] * len(candidate_lists)
+    used = sum(candidates[0][0] for candidates in candidate_lists)
+    hulls = [upper_hull(candidates) for candidates in candidate_lists]
+
+    heap = []
+    def push_upgrade(item: int, hull_pos: int):
+        if hull_pos + 1 < len(hulls[item]):
+            current = candidate_lists[item][hulls[item][hull_pos]]
+            upgrade = candidate_lists[item][hulls[item][hull_pos + 1]]
+            gain_per_byte = (upgrade[1] - current[1]) / max(upgrade[0] - current[0], 1)
+            heapq.heappush(heap, (-gain_per_byte, item, hull_pos))
+
+    for item in range(len(candidate_lists)):
+        push_upgrade(item, 0)
+    while heap:
+        _, item, hull_pos = heapq.heappop(heap)
+        current = candidate_lists[item][hulls[item][hull_pos]]
+        upgrade = candidate_lists[item][hulls[item][hull_pos + 1]]
+        if used + upgrade[0] - current[0] <= budget:
+            used += upgrade[0] - current[0]
+            choice[item] = hulls[item][hull_pos + 1]
+            push_upgrade(item, hull_pos + 1)
+
+    for item, candidates in enumerate(candidate_lists):
+        current = candidates[choice[item]]
+        for index in range(len(candidates) - 1, choice[item], -1):
+            if used + candidates[index][0] - current[0] <= budget:
+                used += candidates[index][0] - current[0]
+                choice[item] = index
+                break
+    return choice
+
+class MapBudget:
+    """
+    Fits all outputs of one generation run into map_size_budget (KB).
+
+    BLP outputs are the only ones with a size knob: each is encoded at the
+    MAP_BUDGET_QUALITY_POINTS (up to blp_compression), decoded back and scored with
+    blp_budget_metric against the framed source. Other formats are written as usual
+    and only take their share of the budget. Once every output is known,
+    allocate_budget picks one cached encode per BLP, so nothing is encoded twice.
+    """
+    def __init__(self, format_suboption_dict: dict):
+        unit = gv.BLP_BUDGET_UNIT_BYTES
+        self.budget = int(get_budget(format_suboption_dict, "map_size_budget") * unit)
+        self.file_budget = int(get_budget(format_suboption_dict, "blp_size_budget") * unit)
+        metric = format_suboption_dict.get("blp_budget_metric", gv.BLP_BUDGET_METRICS[0])
+        self.metric = metric if metric in METRICS else gv.BLP_BUDGET_METRICS[0]
+        max_quality = int(format_suboption_dict.get("blp_compression", gv.BLP_MAXCOMPRESSION))
+        self.qualities = sorted({q for q in gv.MAP_BUDGET_QUALITY_POINTS if q < max_quality} | {max_quality})
+        self.num_mips = get_blp_num_mips(format_suboption_dict)
+        self.best_compression = bool(format_suboption_dict.get("blp_progressive", False))
+        self.fixed_size = 0
+        self.blp_items = []  # ([output paths], [(size, score, quality, data), ...])
+        self.item_index = {}  # first output path -> index in blp_items
+        self.choice = []
+
+    def is_active(self) -> bool:
+        return self.budget > 0
+
+    def add_fixed(self, size: int):
+        """Accounts for an output that is written without a size knob (DDS, TGA, PNG)."""
+        self.fixed_size += size
+
+    def add_blp(self, output_path: str, image):
+        """Encodes and scores one BLP output at every quality point; writing is deferred."""
+        from src.blp1_JPEG_encoder import encode_blp1_jpeg_variants
+        reference = premultiplied_array(image)
+        measure = METRICS[self.metric]
+        candidates = []
+        for quality, data in encode_blp1_jpeg_variants(image, self.qualities, num_mips = self.num_mips,
+                                                            best_compression = self.best_compression).items():
+            score = measure(reference, premultiplied_array(blp_to_pil(data)))
+            candidates.append((len(data), score, quality, data))
+        candidates.sort(key=lambda candidate: (candidate[0], -candidate[1]))
+        if self.file_budget > 0:
+            # Per-file limit: keep what fits, but never drop the smallest encode.
+            candidates = candidates[:1] + [c for c in candidates[1:] if c[0] <= self.file_budget]
+        # Drop candidates that are larger but not better than a smaller one.
+        frontier = []
+        for candidate in candidates:
+            if not frontier or candidate[1] > frontier[-1][1]:
+                frontier.append(candidate)
+        self.item_index[output_path] = len(self.blp_items)
+        self.blp_items.append(([output_path], frontier))
+
+    def add_duplicate(self, source_path: str, output_path: str):
+        """
+        Adds an output identical to the BLP already added as source_path. It gets the
+        same encode, and its size and score count once more in the allocation.
+        """
+        self.blp_items[self.item_index[source_path]][0].append(output_path)
+
+    def minimum_size(self) -> int:
+        return self.fixed_size + sum(len(paths) * candidates[0][0] for paths, candidates in self.blp_items)
+
+    def solve(self) -> list[tuple[list, bytes]]:
+        """Runs the allocation and returns ([output paths], data) of every BLP encode."""
+        blp_budget = self.budget - self.fixed_size
+        # An encode shared by n identical outputs costs n times its size and scores n times.
+        weighted = [[(len(paths) * size, len(paths) * score) for size, score, _, _ in candidates]
+                    for paths, candidates in self.blp_items]
+        self.choice = allocate_budget(weighted, blp_budget)
+        return [(paths, candidates[index][3])
+                for (paths, candidates), index in zip(self.blp_items, self.choice)]
+
+    def summary(self) -> tuple:
+        """(used KB, budget KB, BLP files, min quality, max quality, average quality, metric, mean score)"""
+        chosen = [candidates[index] for (paths, candidates), index in zip(self.blp_items, self.choice)
+                  for _ in paths]
+        unit = gv.BLP_BUDGET_UNIT_BYTES
+        used = self.fixed_size + sum(candidate[0] for candidate in chosen)
+        qualities = [candidate[2] for candidate in chosen]
+        mean_score = sum(candidate[1] for candidate in chosen) / len(chosen)
+        return (round(used / unit, 1), round(self.budget / unit, 1), len(chosen),
+                min(qualities), max(qualities), round(sum(qualities) / len(qualities), 1),
+                self.metric, round(mean_score, 4 if self.metric == "SSIM" else 2))
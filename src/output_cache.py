@@ -0,0 +1,151 @@
+import os
+import json
+import threading
+import PIL
+import vars.global_var as gv
+import vars.var_for_init as iv
+from src.disk_cache import DiskCache
+from src.dedup import input_content_hash
+from src.system import get_data_subdir
+
+# Persistent cache of encoded outputs (--output-cache), shared by all runs, output
+# folders and profiles. An entry is the encoded file of one (input, variant), keyed by
+#   - the content hash of the input (renamed or copied inputs still hit),
+#   - every option that reaches apply_frame and apply_format for that format,
+#   - the content hashes of the frame and background assets,
+#   - the program, Pillow and gv.OUTPUT_CACHE_VERSION versions (encoder changes).
+# Entry file: the format report as one JSON line, then the encoded bytes.
+# BLP outputs under a map budget are chosen across the whole output set and are not cached.
+
+STATS_FILENAME = "_stats.json"  # lifetime counters; "_" files are never evicted
+
+def collect_absolute_paths(value, paths: set):
+    """Absolute "path" entries of the custom frame definitions (frames kept outside the data folder)."""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if key == "path" and isinstance(item, str) and os.path.isabs(item):
+                paths.add(item)
+            else:
+                collect_absolute_paths(item, paths)
+
+def asset_files() -> list:
+    """Every frame, custom frame and background file the renderer can read."""
+    files = set()
+    for subdir in ("frames", "custom_frames", "custom_backgrounds"):
+        for root, _, names in os.walk(get_data_subdir(subdir)):
+            files.update(os.path.abspath(os.path.join(root, name)) for name in names)
+    collect_absolute_paths(iv.CUSTOM_FRAMES_DICT, files)
+    return sorted(files)
+
+def assets_digest() -> str:
+    """Hash over the asset file contents (memoized per file by input_identity) and the custom frame definitions."""
+    parts = []
+    for path in asset_files():
+        try:
+            parts.append((os.path.basename(path), input_content_hash(path)))
+        except OSError:
+            parts.append((os.path.basename(path), None))
+    custom_frames = json.dumps(iv.CUSTOM_FRAMES_DICT, sort_keys=True, default=str)
+    return repr((parts, custom_frames))
+
+def format_suboptions_key(format_option: str, format_suboption_dict: dict) -> tuple:
+    """Only the suboptions of the output format itself (blp_* for format_blp, ...)."""
+    prefix = format_option.split("_", 1)[-1] + "_"
+    return tuple(sorted((key, str(value)) for key, value in format_suboption_dict.items() if key.startswith(prefix)))
+
+class OutputCache:
+    """
+    Encoded outputs by content and options, on top of a size-capped DiskCache.
+    begin_run must be called at the start of each generation run: it rehashes the
+    assets (they may change between the runs of --watch and --serve) and resets the
+    run counters, which end_run adds to the lifetime statistics.
+    """
+    def __init__(self, cache_dir: str = None, max_bytes: int = gv.OUTPUT_CACHE_MAX_BYTES):
+        self.disk_cache = DiskCache(gv.OUTPUT_CACHE_DIRNAME, max_bytes, cache_dir)
+        self.assets = None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def begin_run(self):
+        self.assets = assets_digest()
+        self.hits = 0
+        self.misses = 0
+
+    def output_key(self, path: str, variant: tuple, extras_suboption_dict: dict, misc_suboption_dict: dict,
+                   custom_background_name: str, format_suboption_dict: dict) -> tuple:
+        """variant is (size, style, border, format)."""
+        return (gv.OUTPUT_CACHE_VERSION, gv.PROGRAM_VERSION, PIL.__version__,
+                input_content_hash(path), variant,
+                tuple(sorted((key, str(value)) for key, value in extras_suboption_dict.items())),
+                tuple(sorted((key, str(value)) for key, value in misc_suboption_dict.items())),
+                custom_background_name,
+                format_suboptions_key(variant[3], format_suboption_dict),
+                self.assets)
+
+    def get(self, key: tuple):
+        """(encoded bytes, format report) of a cached output, or None."""
+        try:
+            entry = self.disk_cache.read_entry(self.disk_cache.entry_path(key, ".out"))
+        except OSError:
+            entry = None
+        result = None
+        if entry is not None:
+            report, separator, data = entry.partition(b"\n")
+            if separator:
+                try:
+                    result = (data, json.loads(report))
+                except ValueError:
+                    pass
+        with self.lock:
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return result
+
+    def put(self, key: tuple, data: bytes, format_report: dict):
+        try:
+            entry = json.dumps(format_report).encode("utf-8") + b"\n" + data
+            self.disk_cache.write_entry(self.disk_cache.entry_path(key, ".out"), entry)
+        except OSError:
+            pass  # the cache is only an accelerator
+
+    def stats_path(self) -> str:
+        return os.path.join(self.disk_cache.get_dir(), STATS_FILENAME)
+
+    def read_stats(self) -> dict:
+        try:
+            with open(self.stats_path(), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"hits": 0, "misses": 0}
+
+    def end_run(self) -> tuple:
+        """Adds the run counters to the lifetime statistics. Returns (hits, misses) of the run."""
+        if self.hits or self.misses:
+            stats = self.read_stats()
+            stats["hits"] = stats.get("hits", 0) + self.hits
+            stats["misses"] = stats.get("misses", 0) + self.misses
+            try:
+                tmp_path = f"{self.stats_path()}.{os.getpid()}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(stats, f)
+                os.replace(tmp_path, self.stats_path())
+            except OSError:
+                pass
+        return self.hits, self.misses
+
+    def stats(self) -> dict:
+        """Lifetime statistics: {"dir", "entries", "bytes", "max_bytes", "hits", "misses"}."""
+        entries, size = self.disk_cache.usage()
+        return {"dir": self.disk_cache.get_dir(), "entries": entries, "bytes": size,
+                "max_bytes": self.disk_cache.max_bytes, **self.read_stats()}
+
+    def clear(self):
+        """Deletes every entry and the statistics."""
+        self.disk_cache.clear()
+        try:
+            os.remove(self.stats_path())
+        except OSError:
+            pass
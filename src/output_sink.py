@@ -0,0 +1,184 @@
+import io
+import os
+import sys
+import time
+import tarfile
+import zipfile
+import threading
+
+# Output sinks: where the generator puts the encoded files.
+# FolderSink writes loose files (the default). The archive sinks stream every output
+# into one ZIP or tar file as a member named by its path relative to the run's output
+# folder, so the layout and the _N collision rules of build_output_path are kept
+# and no folders are created at all.
+# Outputs of duplicate inputs (src/dedup.py) go through write_duplicate, which may
+# store them as links to the first copy (link_mode, see gv.DEDUP_LINK_MODES).
+
+ZIP_COMPRESSIONS = {
+    "deflate": zipfile.ZIP_DEFLATED,
+    "stored": zipfile.ZIP_STORED,
+}
+
+FICLONE = 0x40049409  # Linux ioctl that makes dst share the data blocks of src (reflink)
+
+def reflink_file(source_path: str, output_path: str):
+    """Copy-on-write clone of source_path; raises OSError where the file system cannot do it."""
+    import fcntl
+    with open(source_path, "rb") as src, open(output_path, "wb") as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+class FolderSink:
+    """Writes each output to its path, creating every folder once per sink."""
+    is_archive = False
+
+    def __init__(self, link_mode: str = "copy"):
+        self.created_folders = set()
+        self.link_mode = link_mode
+
+    def begin_run(self, output_folder: str):
+        pass
+
+    def write(self, output_path: str, data: bytes):
+        self.make_folder(output_path)
+        try:
+            if os.lstat(output_path).st_nlink > 1:
+                # Hardlinked by an earlier run: writing in place would change the other names too.
+                os.remove(output_path)
+        except FileNotFoundError:
+            pass
+        with open(output_path, "wb") as f:
+            f.write(data)
+
+    def write_duplicate(self, output_path: str, source_path: str, data: bytes):
+        """
+        Stores an output identical to the already written source_path: as a hardlink or
+        reflink if link_mode asks for it and the file system allows it, else as a copy.
+        """
+        if self.link_mode == "hardlink":
+            try:
+                self.make_folder(output_path)
+                if os.path.lexists(output_path):
+                    os.remove(output_path)
+                os.link(source_path, output_path)
+                return
+            except OSError:
+                pass
+        elif self.link_mode == "reflink" and sys.platform.startswith("linux"):
+            try:
+                self.make_folder(output_path)
+                reflink_file(source_path, output_path)
+                return
+            except OSError:
+                pass
+        self.write(output_path, data)
+
+    def make_folder(self, output_path: str):
+        folder = os.path.dirname(output_path)
+        if folder not in self.created_folders:
+            os.makedirs(folder, exist_ok=True)
+            self.created_folders.add(folder)
+
+    def close(self):
+        pass
+
+class ArchiveSink:
+    """Base of the archive sinks: member naming relative to the output folder of the current run."""
+    is_archive = True
+
+    def __init__(self, archive_path: str, link_mode: str = "copy", fileobj = None):
+        self.archive_path = archive_path
+        self.link_mode = link_mode
+        self.root = None
+        self.names = set()
+        self.member_names = {}  # output path -> member name, for links between members
+        self.lock = threading.Lock()
+        if fileobj is None:
+            folder = os.path.dirname(os.path.abspath(archive_path))
+            os.makedirs(folder, exist_ok=True)
+
+    def begin_run(self, output_folder: str):
+        self.root = output_folder
+
+    def member_name(self, output_path: str) -> str:
+        """Relative, /-separated member name; a name used by an earlier run gets a _N suffix."""
+        name = os.path.relpath(output_path, self.root).replace(os.sep, "/")
+        base, extension = os.path.splitext(name)
+        unique_name = name
+        n = 1
+        while unique_name in self.names:
+            unique_name = f"{base}_{n}{extension}"
+            n += 1
+        self.names.add(unique_name)
+        self.member_names[output_path] = unique_name
+        return unique_name
+
+    def write(self, output_path: str, data: bytes):
+        with self.lock:
+            self.add_member(self.member_name(output_path), data)
+
+    def write_duplicate(self, output_path: str, source_path: str, data: bytes):
+        """Archives store duplicates as full members unless the format has links (see TarSink)."""
+        self.write(output_path, data)
+
+    def add_member(self, name: str, data: bytes):
+        raise NotImplementedError
+
+class ZipSink(ArchiveSink):
+    def __init__(self, archive_path: str, compression: str = "deflate", link_mode: str = "copy"):
+        super().__init__(archive_path, link_mode)
+        self.archive = zipfile.ZipFile(archive_path, "w", compression=ZIP_COMPRESSIONS.get(compression, zipfile.ZIP_DEFLATED))
+
+    def add_member(self, name: str, data: bytes):
+        info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+        info.compress_type = self.archive.compression
+        self.archive.writestr(info, data)
+
+    def close(self):
+        self.archive.close()
+
+class TarSink(ArchiveSink):
+    """
+    Tar stream (gzip-compressed for .tar.gz/.tgz); members are appended without seeking back.
+    With fileobj (e.g. stdout of --pipe) the stream is written there and archive_path only names it.
+    """
+    def __init__(self, archive_path: str, gzip: bool = False, link_mode: str = "copy", fileobj = None):
+        super().__init__(archive_path, link_mode, fileobj)
+        self.archive = tarfile.open(archive_path if fileobj is None else None, "w|gz" if gzip else "w|", fileobj=fileobj)
+
+    def write_duplicate(self, output_path: str, source_path: str, data: bytes):
+        """With link_mode "hardlink", a duplicate becomes a hardlink member without data."""
+        with self.lock:
+            source_name = self.member_names.get(source_path)
+            if self.link_mode != "hardlink" or source_name is None:
+                self.add_member(self.member_name(output_path), data)
+                return
+            info = tarfile.TarInfo(self.member_name(output_path))
+            info.type = tarfile.LNKTYPE
+            info.linkname = source_name
+            info.mtime = int(time.time())
+            self.archive.addfile(info)
+
+    def add_member(self, name: str, data: bytes):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        self.archive.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        self.archive.close()
+
+def create_output_sink(archive_path: str = None, compression: str = "deflate", link_mode: str = "copy"):
+    """
+    FolderSink without archive_path, otherwise the archive sink matching its extension
+    (.zip, .tar, .tar.gz, .tgz). Raises ValueError for other extensions.
+    """
+    if not archive_path:
+        return FolderSink(link_mode)
+    lower_path = archive_path.lower()
+    if lower_path.endswith(".zip"):
+        return ZipSink(archive_path, compression, link_mode)
+    if lower_path.endswith((".tar.gz", ".tgz")):
+        return TarSink(archive_path, gzip=True, link_mode=link_mode)
+    if lower_path.endswith(".tar"):
+        return TarSink(archive_path, link_mode=link_mode)
+    raise ValueError(f"Unsupported archive type '{archive_path}' (use .zip, .tar, .tar.gz or .tgz)")
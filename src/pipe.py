@@ -0,0 +1,156 @@
+import os
+import sys
+import hashlib
+import tarfile
+import posixpath
+import vars.global_var as gv
+from src.budget_options import get_budget, find_invalid_budgets
+
+# --pipe: stdin to stdout for shell pipelines, without temporary files.
+# Input: one encoded image, or a tar stream (also gzip-compressed) of images whose member
+# paths take the place of the input folder structure.
+# Output: the encoded file alone when a single image yields exactly one output, otherwise a
+# tar stream of all outputs named as build_output_path names them inside an output folder.
+# Rendering goes through src/api.py; everything but the output data is printed to stderr.
+
+TAR_MAGIC_OFFSET = 257
+TAR_MAGIC = b"ustar"
+GZIP_MAGIC = b"\x1f\x8b"
+HEAD_SIZE = 512  # one tar header block
+
+class PrefixedStream:
+    """Read-only stream that first returns the bytes already read to detect the input type."""
+    def __init__(self, prefix: bytes, stream):
+        self.prefix = prefix
+        self.stream = stream
+
+    def read(self, size: int = -1) -> bytes:
+        if not self.prefix:
+            return self.stream.read(size)
+        if size is None or size < 0:
+            data, self.prefix = self.prefix + self.stream.read(), b""
+            return data
+        data, self.prefix = self.prefix[:size], self.prefix[size:]
+        if len(data) < size:
+            data += self.stream.read(size - len(data))
+        return data
+
+def is_tar_stream(head: bytes) -> bool:
+    return head[:2] == GZIP_MAGIC or head[TAR_MAGIC_OFFSET:TAR_MAGIC_OFFSET + len(TAR_MAGIC)] == TAR_MAGIC
+
+def iter_tar_inputs(stream, extensions: set):
+    """Yields (member path, bytes) of the supported images of a tar stream, in stream order."""
+    with tarfile.open(fileobj=stream, mode="r|*") as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+            if os.path.splitext(member.name)[1][1:].lower() not in extensions:
+                print(f"Warning: '{member.name}' has an unsupported extension and is skipped.", file=sys.stderr)
+                continue
+            yield member.name, archive.extractfile(member).read()
+
+def build_output_names(name: str, options, output_suboption_dict: dict, used_output_paths: set) -> dict:
+    """{variant: output name} of the input name, built like the output paths of generate_images."""
+    from src.generator import build_output_path
+    relative_subfolder, basename = posixpath.split(posixpath.normpath(name.lstrip("/")))
+    names = {}
+    for size_option, style_option, border_option, format_option in options.variants():
+        output_path = build_output_path(
+            original_path=basename,
+            output_folder="",
+            size_option=size_option,
+            style_option=style_option,
+            border_option=border_option,
+            format_option=format_option,
+            output_suboption_dict=output_suboption_dict,
+            true_style_options=options.styles,
+            true_format_options=options.formats,
+            true_border_options=options.borders,
+            used_output_paths=used_output_paths,
+            relative_subfolder=relative_subfolder,
+            create_folders=False,
+        )
+        names[(size_option, style_option, border_option, format_option)] = output_path.replace(os.sep, "/")
+    return names
+
+def run_pipe(input_data, input_name: str, stdin, stdout, link_mode: str = "copy") -> int:
+    """
+    Reads the input from stdin and writes the outputs to stdout (binary streams).
+    input_data: the CurrentSelection of the configuration (without inputs).
+    input_name: file name of a single input image, for the output names.
+    Returns:
+        int: number of inputs that could not be processed
+    """
+    from src.api import RenderOptions, render
+    from src.output_sink import TarSink
+    from src.preview_cache import LRUCache
+
+    options = RenderOptions.from_selection(input_data)
+    options.validate()
+    format_suboption_dict = input_data.recieve_suboptions([gv.BLP_SETTINGS])
+    for option, value in find_invalid_budgets(format_suboption_dict):
+        print(f"Warning: Ignoring the invalid budget {option} = {value}.", file=sys.stderr)
+    if get_budget(format_suboption_dict, "blp_total_budget") or get_budget(format_suboption_dict, "map_size_budget"):
+        print("Warning: The total and map BLP size budgets are not applied in --pipe mode.", file=sys.stderr)
+    output_suboption_dict = input_data.recieve_suboptions([gv.OPTIONS_OUTPUT, gv.OPTIONS_BASENAME])
+    extensions_raw = input_data.get_value("OPTIONS_INPUT", "input_process_filetypes")
+    extensions = set(extensions_raw.split(","))
+
+    head = stdin.read(HEAD_SIZE)
+    if not head:
+        print("Error: No input on stdin.", file=sys.stderr)
+        return 1
+    if is_tar_stream(head):
+        inputs = iter_tar_inputs(PrefixedStream(head, stdin), extensions)
+        output_suboption_dict["output_basename"] = None
+    else:
+        data = head + stdin.read()
+        if len(list(options.variants())) == 1:
+            try:
+                stdout.write(next(iter(render(data, options).values())))
+            except Exception as e:
+                print(f"Error: Unable to process '{input_name}': {e}", file=sys.stderr)
+                return 1
+            stdout.flush()
+            return 0
+        inputs = iter([(input_name, data)])
+
+    failed = 0
+    used_output_paths = set()
+    written = {}  # content hash -> {variant: member name} of the first copy
+    recent_outputs = LRUCache(gv.RENDER_RESULT_CACHE_MAXNUM)  # content hash -> outputs, for copies
+    sink = TarSink("<stdout>", link_mode=link_mode, fileobj=stdout)
+    sink.begin_run(os.curdir)
+    try:
+        for name, data in inputs:
+            names = build_output_names(name, options, output_suboption_dict, used_output_paths)
+            key = hashlib.sha1(data).hexdigest()
+            if key in written:
+                # Identical input: stored again, or linked to the members of the first copy (see --dedup-links).
+                source_names = written[key]
+                outputs = None
+                if link_mode != "hardlink":
+                    # Copies need the bytes: kept for recent inputs, rendered again for older ones.
+                    outputs = recent_outputs.get(key) or render(data, options)
+                    recent_outputs.put(key, outputs)
+                for variant, output_name in names.items():
+                    sink.write_duplicate(output_name, source_names[variant], outputs[variant] if outputs else b"")
+                continue
+            try:
+                outputs = render(data, options)
+            except Exception as e:
+                print(f"Error: Unable to process '{name}': {e}", file=sys.stderr)
+                failed += 1
+                continue
+            for variant, output_data in outputs.items():
+                sink.write(names[variant], output_data)
+            written[key] = names
+            recent_outputs.put(key, outputs)
+            print(f"Processed '{name}': {len(outputs)} outputs", file=sys.stderr)
+    except tarfile.TarError as e:
+        print(f"Error: Unable to read the tar stream: {e}", file=sys.stderr)
+        failed += 1
+    finally:
+        sink.close()
+        stdout.flush()
+    return failed
@@ -0,0 +1,102 @@
+import math
+import threading
+from collections import OrderedDict
+import vars.global_var as gv
+from src.converter import load_pil_image, load_pil_thumbnail
+from src.disk_cache import input_identity, probe_image
+
+# Caches shared by the input and output preview panels.
+# Entries are keyed by input_identity(path), so an edited input file is picked up
+# again; cached Pillow images are shared and must not be modified by callers.
+
+class LRUCache:
+    """Thread-safe least-recently-used mapping with a fixed number of entries."""
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+# Decoded input images (few, they can be large).
+SOURCE_CACHE = LRUCache(gv.PREVIEW_CACHE_SOURCES_MAXNUM)
+# Rendered preview cells and input thumbnails (many, all small).
+CELL_CACHE = LRUCache(gv.PREVIEW_CACHE_CELLS_MAXNUM)
+
+def freeze_options(options: dict) -> tuple:
+    """Hashable, order-independent form of a suboption dict."""
+    if not options:
+        return ()
+    return tuple(sorted((key, str(value)) for key, value in options.items()))
+
+def preview_format_options(format_option: str, format_suboption_dict: dict) -> tuple:
+    """
+    The format suboptions that change how format_option looks in the preview,
+    i.e. the ones flagged in the "update_preview" entry of the format settings.
+    """
+    settings = {
+        "format_dds": gv.DDS_SETTINGS,
+        "format_blp": gv.BLP_SETTINGS,
+        "format_tga": gv.TGA_SETTINGS,
+        "format_png": gv.PNG_SETTINGS,
+    }.get(format_option)
+    if not settings:
+        return ()
+    update_preview = settings.get("update_preview", False)
+    relevant = {}
+    for option in settings.get("options", []):
+        if isinstance(update_preview, dict):
+            affects_preview = update_preview.get(option, False)
+        else:
+            affects_preview = update_preview
+        if affects_preview and option in format_suboption_dict:
+            relevant[option] = format_suboption_dict[option]
+    return freeze_options(relevant)
+
+def get_source_image(path: str, loader = load_pil_image):
+    """
+    Returns the decoded input image at path, from SOURCE_CACHE if the file is unchanged.
+    loader is called on a miss; a falsy result (failed load) is not cached.
+    """
+    key = input_identity(path)
+    image = SOURCE_CACHE.get(key)
+    if image is None:
+        image = loader(path)
+        if image:
+            # Decode now: lazily opened images hold a file handle and are not thread-safe.
+            image.load()
+            SOURCE_CACHE.put(key, image)
+    return image
+
+def get_reduced_source_image(path: str, cover_size: tuple):
+    """
+    Returns (image, original size) for cell-resolution rendering: the input decoded
+    at a reduced size that still covers cover_size (width, height) in both dimensions.
+    The original size comes from the probe, so the file is not decoded at full size.
+    """
+    probe = probe_image(path)
+    width, height = probe["width"], probe["height"]
+    scale = min(1.0, max(cover_size[0] / width, cover_size[1] / height))
+    reduced_size = (max(1, math.ceil(width * scale)), max(1, math.ceil(height * scale)))
+    key = (input_identity(path), reduced_size)
+    image = SOURCE_CACHE.get(key)
+    if image is None:
+        image = load_pil_thumbnail(path, reduced_size)
+        SOURCE_CACHE.put(key, image)
+    return image, (width, height)
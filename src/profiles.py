@@ -0,0 +1,90 @@
+import os
+import configparser
+import vars.global_var as gv
+import vars.var_for_init as iv
+import src.config_manager as config_manager
+from src.stored_var import CurrentSelection
+from src.custom_frames import init_CUSTOM_FRAMES_DICT, parse_ini_files_from_string
+
+# Multi-profile runs: one selection per profile from data/profiles (or any .cfg file),
+# each being the current options with the profile applied and writing into its own
+# subfolder of the output folder. generate_profiles (src/generator.py) processes them
+# in one pass over the inputs.
+
+PROFILE_PREFIX = "profile_"
+
+def list_profiles() -> list:
+    """Profile codes (e.g. "profile_classicsd") of the files in data/profiles."""
+    if not os.path.isdir(config_manager.PROFILE_DIR):
+        return []
+    return sorted(name[:-len(".cfg")] for name in os.listdir(config_manager.PROFILE_DIR)
+                  if name.startswith(PROFILE_PREFIX) and name.endswith(".cfg"))
+
+def resolve_profile_path(name: str) -> str:
+    """
+    Profile file of name: a path to a .cfg file, or a profile of data/profiles given as
+    "classicsd", "profile_classicsd" or "profile_classicsd.cfg". Raises ValueError if not found.
+    """
+    if os.path.isfile(name):
+        return name
+    code = name[:-len(".cfg")] if name.endswith(".cfg") else name
+    if not code.startswith(PROFILE_PREFIX):
+        code = PROFILE_PREFIX + code
+    path = os.path.join(config_manager.PROFILE_DIR, f"{code}.cfg")
+    if not os.path.isfile(path):
+        raise ValueError(f"Profile '{name}' not found (available: {', '.join(profile_label(p) for p in list_profiles())})")
+    return path
+
+def profile_label(name: str) -> str:
+    """Output subfolder of a profile: its file name without "profile_" and ".cfg"."""
+    label = os.path.splitext(os.path.basename(name))[0]
+    return label[len(PROFILE_PREFIX):] if label.startswith(PROFILE_PREFIX) else label
+
+def selection_to_config(selection: CurrentSelection) -> configparser.ConfigParser:
+    config = configparser.ConfigParser()
+    config.read_dict({section: {option: str(value) for option, value in options.items()}
+                      for section, options in selection.all_options.items()})
+    return config
+
+def build_profile_selections(base: CurrentSelection, profiles: list) -> list:
+    """
+    Returns [(label, CurrentSelection)] for the profiles, on top of the options and inputs of base.
+    A profile naming its own custom frames replaces the custom frame borders of base with them;
+    the frames of all profiles are loaded together, as the runs share iv.CUSTOM_FRAMES_DICT.
+    Raises ValueError for unknown profiles and for labels used twice.
+    """
+    base_config = selection_to_config(base)
+    base_output_folder = base.get_value(gv.OPTIONS_OUTPUT_PATH["section"], "output_folder") or ""
+    border_section = gv.OPTIONS_BORDER["section"]
+    base_frames = dict(iv.CUSTOM_FRAMES_DICT)
+    all_frames = dict(base_frames)
+    selections = []
+    for name in profiles:
+        path = resolve_profile_path(name)
+        label = profile_label(path)
+        if label in (used for used, _ in selections):
+            raise ValueError(f"Profile '{label}' is given twice")
+        config = configparser.ConfigParser()
+        config.read_dict(base_config)
+        profile_config = config_manager.init_configuration(path)
+        config_manager.apply_subconfig_on_configuration(profile_config, config)
+
+        selection = CurrentSelection(None)
+        selection.read_config_file(config)
+        if profile_config.has_option("CUSTOM_SECTION", "custom_frames"):
+            for frame_id in base_frames:
+                selection.remove_option(border_section, frame_id)
+            frame_list = profile_config.get("CUSTOM_SECTION", "custom_frames")
+            if frame_list and frame_list != gv.DEFAULT_OPTION_PLACEHOLDER:
+                frames = parse_ini_files_from_string(frame_list)
+                for frame_id in frames:
+                    selection.add_option(border_section, frame_id, True)
+                all_frames.update(frames)
+
+        selection.set_value(gv.OPTIONS_OUTPUT_PATH["section"], "output_folder", os.path.join(base_output_folder, label))
+        selection.set_value(gv.OPTIONS_OUTPUT["section"], "outputset_samedir", False)
+        selection.init_input_items(folders=base.paths_folders, images=base.paths_images)
+        selections.append((label, selection))
+    if all_frames:
+        init_CUSTOM_FRAMES_DICT(all_frames)
+    return selections
@@ -0,0 +1,111 @@
+import time
+import threading
+import vars.global_var as gv
+from src.localisation import get_local_text
+
+# Progress aggregation between the generator and the log sinks (GUI gauge, terminal line).
+# Updates are counted on every call but forwarded at most every gv.PROGRESS_UPDATE_INTERVAL_S,
+# together with the throughput and the estimated time left.
+
+PROGRESS_FINAL_TYPES = ("SUCCESS", "ABORT")
+
+def format_eta(seconds: float) -> str:
+    """H:MM:SS (or M:SS below an hour)."""
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
+
+class ProgressAggregator:
+    """
+    Collects progress of one run and decides when the sinks see it.
+    Thread-safe: any thread may call update; a dispatch callback is invoked
+    with (msg_type, message, current, total) outside of the lock.
+    """
+    def __init__(self, dispatch, interval: float = None):
+        self.dispatch = dispatch
+        self.interval = gv.PROGRESS_UPDATE_INTERVAL_S if interval is None else interval
+        self.lock = threading.Lock()
+        self.start_time = time.perf_counter()
+        self.last_dispatch_time = None
+        self.current = 0
+        self.total = 0
+        self.nbytes = 0
+
+    def throughput(self) -> tuple:
+        """(outputs per second, MB per second, seconds left or None)"""
+        elapsed = max(time.perf_counter() - self.start_time, 1e-9)
+        if not self.current:
+            return 0.0, 0.0, None
+        rate = self.current / elapsed
+        mb_rate = self.nbytes / elapsed / (1024 * 1024)
+        seconds_left = max(self.total - self.current, 0) / rate
+        return rate, mb_rate, seconds_left
+
+    def describe(self, message: str, msg_type: str) -> str:
+        """Appends throughput (and ETA while running) to a progress message."""
+        rate, mb_rate, seconds_left = self.throughput()
+        if seconds_left is None:
+            return message
+        if msg_type in PROGRESS_FINAL_TYPES:
+            stats = get_local_text("log_progress_rate").format(round(rate, 1), round(mb_rate, 2))
+        else:
+            stats = get_local_text("log_progress_rate_eta").format(round(rate, 1), round(mb_rate, 2), format_eta(seconds_left))
+        return f"{message} ({stats})"
+
+    def update(self, msg_type: str, message: str, current: int, total: int, nbytes: int = 0):
+        """
+        Records the progress of the run. The first update, the last one and
+        final messages (success, abort) are always forwarded; others only once the
+        interval since the previous dispatch has passed.
+        """
+        with self.lock:
+            now = time.perf_counter()
+            self.current = current
+            self.total = total
+            self.nbytes += nbytes
+            due = (
+                self.last_dispatch_time is None or
+                msg_type in PROGRESS_FINAL_TYPES or
+                self.current >= self.total or
+                now - self.last_dispatch_time >= self.interval
+            )
+            if not due:
+                return
+            self.last_dispatch_time = now
+            text = self.describe(message, msg_type)
+        self.dispatch(msg_type, text, current, total)
+
+class RunProgress:
+    """Progress of one of the runs of a CombinedProgress; takes the place of its ProgressAggregator."""
+    def __init__(self, combined, label: str):
+        self.combined = combined
+        self.label = label
+
+    def update(self, msg_type: str, message: str, current: int, total: int, nbytes: int = 0):
+        self.combined.update_run(self.label, msg_type, message, current, total, nbytes)
+
+class CombinedProgress:
+    """
+    Progress of runs that proceed side by side (the profiles of generate_profiles) as one run:
+    counts are summed and the message is prefixed with the run label. A success is only
+    forwarded as such once every run has succeeded; an abort is forwarded at once.
+    """
+    def __init__(self, aggregator: ProgressAggregator, labels: list):
+        self.aggregator = aggregator
+        self.lock = threading.Lock()
+        self.runs = {label: (0, 0, None) for label in labels}  # label -> (current, total, msg_type)
+
+    def run_progress(self, label: str) -> RunProgress:
+        return RunProgress(self, label)
+
+    def update_run(self, label: str, msg_type: str, message: str, current: int, total: int, nbytes: int = 0):
+        with self.lock:
+            self.runs[label] = (current, total, msg_type)
+            current = sum(run[0] for run in self.runs.values())
+            total = sum(run[1] for run in self.runs.values())
+            if msg_type == "SUCCESS" and any(run[2] != "SUCCESS" for run in self.runs.values()):
+                msg_type = "PROCESSING"
+        self.aggregator.update(msg_type, f"[{label}] {message}", current, total, nbytes)
@@ -1,3 +1,5 @@
+import io
+import sys
 import numpy as np
 from PIL import Image
 import external.pytoshop as pytoshop
@@ -12,15 +14,30 @@ def psd_path_to_pil(psd_path):
     try:
         # Open and read the PSD file
         with open(psd_path, 'rb') as f:
-            psd = pytoshop.read(f)
-            # Convert PSD to nested layers
-            psd_layers = nested_layers.psd_to_nested_layers(psd)
-            pil_image = merge_psd_layers_to_pil(psd_layers)
+            pil_image = psd_file_to_pil(f)
     except Exception as e:
         print(e)
         pil_image = Image.open(psd_path)
     return pil_image
 
+def psd_bytes_to_pil(data: bytes):
+    """psd_path_to_pil for the bytes of a PSD file (src/api.py, --pipe). Messages go to stderr, as stdout may carry output data."""
+    pil_image = None
+    try:
+        pil_image = psd_file_to_pil(io.BytesIO(data))
+    except Exception as e:
+        print(e, file=sys.stderr)
+        pil_image = Image.open(io.BytesIO(data))
+        pil_image.load()
+    return pil_image
+
+def psd_file_to_pil(f):
+    """Reads a PSD file object and merges its layers."""
+    psd = pytoshop.read(f)
+    # Convert PSD to nested layers
+    psd_layers = nested_layers.psd_to_nested_layers(psd)
+    return merge_psd_layers_to_pil(psd_layers)
+
 
 def merge_psd_layers_to_pil(layers):
     # Process each top-level layer
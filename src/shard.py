@@ -0,0 +1,173 @@
+import os
+import json
+import hashlib
+
+# --shard K/N: splits one generation over N processes or machines.
+# A work unit is one input with one (size, style, border) variant, i.e. one rendered
+# frame and all its formats. Units go to shards by a stable hash of the input's path
+# relative to its input folder, so every agent makes the same assignment without talking
+# to the others. Copies of an input (src/dedup.py) follow the input they duplicate.
+# Every shard still walks all units in the unsharded order and builds their output paths
+# (the collision pre-pass), so the _N suffixes match an unsharded run; it only renders
+# and writes its own units. Each shard writes a manifest of its outputs, and
+# --merge-shards validates the manifests of all N shards and combines them.
+
+MANIFEST_VERSION = 1
+
+def parse_shard(value: str) -> tuple:
+    """(K, N) from "K/N" with 1 <= K <= N. Raises ValueError otherwise."""
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard '{value}' (expected K/N, e.g. 1/4)")
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f"Invalid shard '{value}' (K must be between 1 and N)")
+    return index, count
+
+def input_key(path: str, rel_path: str) -> str:
+    """Path of an input relative to its input folder, with / separators."""
+    return "/".join(part for part in (rel_path.replace(os.sep, "/"), os.path.basename(path)) if part)
+
+def unit_shard(rel_input_path: str, variant: tuple, count: int) -> int:
+    """1-based shard of a work unit."""
+    key = "/".join([rel_input_path, *variant])
+    return int(hashlib.sha1(key.encode("utf-8")).hexdigest()[:8], 16) % count + 1
+
+class ShardPlan:
+    """
+    Assignment and output record of one shard of a generation run.
+    The generator calls begin_run, then owns and plan_unit for every unit in order,
+    unit_output_paths for the owned ones, and add_output for every file written.
+    """
+    def __init__(self, index: int, count: int):
+        self.index = index
+        self.count = count
+        self.output_root = None
+        self.plan_hash = hashlib.sha1()
+        self.num_units = 0
+        self.owned_units = []
+        self.files = []
+
+    def begin_run(self, output_root: str):
+        self.output_root = output_root
+        self.plan_hash = hashlib.sha1()
+        self.num_units = 0
+        self.owned_units = []
+        self.files = []
+
+    def owns(self, rel_input_path: str, variant: tuple) -> bool:
+        return unit_shard(rel_input_path, variant, self.count) == self.index
+
+    def plan_unit(self, output_paths: list, owned: bool, input_path: str = None, variant: tuple = None) -> int:
+        """
+        Adds a unit with its output paths to the plan shared by all shards; returns its number.
+        input_path and variant (size, style, border) are for plans that keep the units (src/spool.py).
+        """
+        unit = self.num_units
+        self.plan_hash.update(repr(self.relative_paths(output_paths)).encode("utf-8"))
+        self.num_units += 1
+        if owned:
+            self.owned_units.append(unit)
+        return unit
+
+    def unit_output_paths(self, unit: int, output_paths: list) -> list:
+        """Output paths of an owned unit; a shard writes to the paths it planned."""
+        return output_paths
+
+    def relative_paths(self, output_paths: list) -> list:
+        if self.output_root is None:
+            return [os.path.abspath(path) for path in output_paths]
+        return [os.path.relpath(path, self.output_root).replace(os.sep, "/") for path in output_paths]
+
+    def add_output(self, unit: int, output_path: str, data: bytes):
+        self.files.append({
+            "path": self.relative_paths([output_path])[0],
+            "unit": unit,
+            "bytes": len(data),
+            "sha1": hashlib.sha1(data).hexdigest(),
+        })
+
+    def default_manifest_path(self, archive_path: str = None) -> str:
+        name = f"shard-{self.index}-of-{self.count}.json"
+        if archive_path:
+            return f"{archive_path}.{name}"
+        return os.path.join(self.output_root or os.getcwd(), name)
+
+    def write_manifest(self, path: str):
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "shard": self.index,
+            "shards": self.count,
+            "plan": self.plan_hash.hexdigest(),
+            "units": self.num_units,
+            "owned_units": self.owned_units,
+            "output": self.output_root,
+            "files": self.files,
+        }
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1)
+
+def merge_manifests(manifest_paths: list) -> tuple:
+    """
+    Checks that the manifests are the N shards of one plan: the same shard count, plan
+    and number of units, every shard exactly once, every unit done by exactly one shard
+    and no output path written twice.
+    Returns:
+        tuple: (merged manifest, list of problems; the merge is valid only if it is empty)
+    """
+    manifests = []
+    problems = []
+    for path in manifest_paths:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                manifests.append((path, json.load(f)))
+        except (OSError, ValueError) as e:
+            problems.append(f"{path}: unreadable manifest ({e})")
+    if problems or not manifests:
+        return None, problems or ["No manifests given"]
+
+    first = manifests[0][1]
+    count = first.get("shards")
+    for path, manifest in manifests:
+        for key in ("version", "shards", "plan", "units"):
+            if manifest.get(key) != first.get(key):
+                problems.append(f"{path}: {key} {manifest.get(key)!r} differs from {first.get(key)!r} of {manifests[0][0]}")
+    shards = [manifest.get("shard") for _, manifest in manifests]
+    missing = sorted(set(range(1, (count or 0) + 1)) - set(shards))
+    repeated = sorted({shard for shard in shards if shards.count(shard) > 1})
+    if missing:
+        problems.append(f"Missing shards: {', '.join(map(str, missing))}")
+    if repeated:
+        problems.append(f"Shards given more than once: {', '.join(map(str, repeated))}")
+    if problems:
+        return None, problems
+
+    unit_owner = {}
+    path_owner = {}
+    files = []
+    for path, manifest in manifests:
+        shard = manifest.get("shard")
+        for unit in manifest.get("owned_units", []):
+            if unit in unit_owner and unit_owner[unit] != shard:
+                problems.append(f"Unit {unit} was done by shards {unit_owner[unit]} and {shard}")
+            unit_owner[unit] = shard
+        for entry in manifest.get("files", []):
+            if entry["path"] in path_owner:
+                problems.append(f"Output {entry['path']} was written by shards {path_owner[entry['path']]} and {shard}")
+            path_owner[entry["path"]] = shard
+            files.append({**entry, "shard": shard})
+    undone = (first.get("units") or 0) - len(unit_owner)
+    if undone > 0:
+        problems.append(f"{undone} units were done by no shard")
+
+    files.sort(key=lambda entry: (entry["unit"], entry["path"]))
+    merged = {
+        "version": first.get("version"),
+        "shards": count,
+        "plan": first.get("plan"),
+        "units": first.get("units"),
+        "files": files,
+    }
+    return merged, problems
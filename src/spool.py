@@ -0,0 +1,217 @@
+import io
+import os
+import json
+import time
+import socket
+import hashlib
+import contextlib
+import configparser
+import vars.global_var as gv
+from src.shard import ShardPlan
+
+# Spool queue on a shared folder: --spool queues a job as work-unit tickets and any
+# number of --worker processes (on any machine that mounts the folder) process them.
+# No service is involved; every state change is one atomic rename inside the folder:
+#   jobs/<job>.json           configuration of a queued job
+#   queue/<ticket>.json       waiting ticket: input, (size, style, border), planned output paths
+#   claimed/<ticket>@<worker> ticket being processed; its mtime is the start of the lease
+#   done/<ticket>.json        completion record with the written files
+#   failed/<ticket>.json      record of a ticket whose outputs could not all be written
+# A claim older than the lease timeout is renamed back into queue/ by the next worker
+# that looks, so tickets of crashed or disconnected workers are processed again.
+# Output paths (with their _N suffixes) are planned by the coordinator over the whole
+# job, so they are the same as in a single-process run. Input and output paths are
+# stored as the coordinator sees them: workers must mount the share at the same path.
+
+SPOOL_FOLDERS = ("jobs", "queue", "claimed", "done", "failed")
+
+def spool_folder(spool_dir: str, name: str) -> str:
+    return os.path.join(spool_dir, name)
+
+def write_json_atomic(path: str, data: dict):
+    """Readers on other machines never see a partly written file."""
+    folder, name = os.path.split(path)
+    tmp_path = os.path.join(folder, f".{name}.{socket.gethostname()}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=1)
+    os.replace(tmp_path, path)
+
+def read_json(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+class SpoolPlanner(ShardPlan):
+    """Plan of a coordinator: renders nothing, keeps every unit as a ticket."""
+    def __init__(self):
+        super().__init__(1, 1)
+        self.tickets = []
+
+    def owns(self, rel_input_path: str, variant: tuple) -> bool:
+        return False
+
+    def plan_unit(self, output_paths: list, owned: bool, input_path: str = None, variant: tuple = None) -> int:
+        unit = super().plan_unit(output_paths, owned)
+        self.tickets.append({
+            "unit": unit,
+            "image": os.path.abspath(input_path),
+            "variant": list(variant),
+            "outputs": [os.path.abspath(path) for path in output_paths],
+        })
+        return unit
+
+class TicketPlan(ShardPlan):
+    """Plan of a worker for one ticket: owns the ticket's variant and writes to its planned paths."""
+    def __init__(self, ticket: dict):
+        super().__init__(1, 1)
+        self.ticket = ticket
+
+    def owns(self, rel_input_path: str, variant: tuple) -> bool:
+        return list(variant) == self.ticket["variant"]
+
+    def unit_output_paths(self, unit: int, output_paths: list) -> list:
+        return list(self.ticket["outputs"])
+
+    def relative_paths(self, output_paths: list) -> list:
+        return [os.path.abspath(path) for path in output_paths]
+
+def queue_job(spool_dir: str, config: configparser.ConfigParser, input_data) -> tuple:
+    """
+    Plans the job of input_data (all its units and output paths) and queues one ticket per unit.
+    Returns:
+        tuple: (job id, number of tickets)
+    """
+    from src.generator import generate_images
+
+    for name in SPOOL_FOLDERS:
+        os.makedirs(spool_folder(spool_dir, name), exist_ok=True)
+    planner = SpoolPlanner()
+    generate_images(input_data, None, shard=planner)
+
+    buffer = io.StringIO()
+    config.write(buffer)
+    job_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{hashlib.sha1(buffer.getvalue().encode('utf-8')).hexdigest()[:8]}"
+    write_json_atomic(os.path.join(spool_folder(spool_dir, "jobs"), f"{job_id}.json"),
+                      {"job": job_id, "config": buffer.getvalue(), "units": len(planner.tickets)})
+    for ticket in planner.tickets:
+        ticket_id = f"{job_id}-{ticket['unit']:06d}"
+        write_json_atomic(os.path.join(spool_folder(spool_dir, "queue"), f"{ticket_id}.json"),
+                          {"ticket": ticket_id, "job": job_id, **ticket})
+    return job_id, len(planner.tickets)
+
+def requeue_stale_claims(spool_dir: str, lease_s: float) -> int:
+    """Moves claims older than the lease back into the queue; returns how many."""
+    requeued = 0
+    now = time.time()
+    claimed_dir = spool_folder(spool_dir, "claimed")
+    for entry in os.scandir(claimed_dir):
+        try:
+            if now - entry.stat().st_mtime <= lease_s:
+                continue
+            ticket_id = entry.name.split("@", 1)[0]
+            os.rename(entry.path, os.path.join(spool_folder(spool_dir, "queue"), f"{ticket_id}.json"))
+            requeued += 1
+        except OSError:
+            pass  # finished or requeued by someone else meanwhile
+    return requeued
+
+def claim_ticket(spool_dir: str, worker_id: str):
+    """Claims the oldest waiting ticket. Returns (claim path, ticket) or None if the queue is empty."""
+    queue_dir = spool_folder(spool_dir, "queue")
+    for name in sorted(name for name in os.listdir(queue_dir) if name.endswith(".json")):
+        ticket_id = name[:-len(".json")]
+        claim_path = os.path.join(spool_folder(spool_dir, "claimed"), f"{ticket_id}@{worker_id}")
+        queue_path = os.path.join(queue_dir, name)
+        try:
+            # The lease starts now: touched before the rename, which keeps the mtime, so no
+            # worker ever sees the claim with its enqueue time and requeues it as expired.
+            os.utime(queue_path)
+            os.rename(queue_path, claim_path)
+        except OSError:
+            continue  # another worker was faster
+        try:
+            return claim_path, read_json(claim_path)
+        except (OSError, ValueError):
+            continue
+    return None
+
+def release_claim(spool_dir: str, claim_path: str, ticket_id: str):
+    """Puts an unfinished ticket back into the queue (worker stopped with CTRL+C)."""
+    try:
+        os.rename(claim_path, os.path.join(spool_folder(spool_dir, "queue"), f"{ticket_id}.json"))
+    except OSError:
+        pass
+
+def process_ticket(ticket: dict, job: dict, sink, output_cache) -> tuple:
+    """
+    Generates the outputs of one ticket through the normal pipeline.
+    Returns:
+        tuple: (written files as in a shard manifest, captured terminal output)
+    """
+    from src.cli import build_cli_selection
+    from src.cli_logger import TerminalLogger
+    from src.generator import generate_images
+
+    config = configparser.ConfigParser()
+    config.read_string(job["config"])
+    plan = TicketPlan(ticket)
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        input_data = build_cli_selection(config, [ticket["image"]], [])
+        if input_data is not None:
+            generate_images(input_data, TerminalLogger(), output_sink=sink, output_cache=output_cache, shard=plan)
+    return plan.files, output.getvalue()
+
+def run_worker(spool_dir: str, lease_s: float = gv.SPOOL_LEASE_S, output_cache = None):
+    """
+    Processes tickets until the queue is empty and no other worker holds a claim
+    (their claims may still expire and come back). CTRL+C returns the current ticket.
+    """
+    from src.output_sink import FolderSink
+
+    for name in SPOOL_FOLDERS:
+        os.makedirs(spool_folder(spool_dir, name), exist_ok=True)
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    jobs = {}
+    sink = FolderSink()
+    processed = failed = 0
+    print(f"Worker {worker_id} processing {spool_dir}. *Press CTRL+C to stop.")
+    claim = None
+    try:
+        while True:
+            requeued = requeue_stale_claims(spool_dir, lease_s)
+            if requeued:
+                print(f"Requeued {requeued} expired claims.")
+            claim = claim_ticket(spool_dir, worker_id)
+            if claim is None:
+                if not os.listdir(spool_folder(spool_dir, "claimed")):
+                    break
+                time.sleep(gv.SPOOL_POLL_INTERVAL_S)
+                continue
+            claim_path, ticket = claim
+            start = time.time()
+            try:
+                if ticket["job"] not in jobs:
+                    jobs[ticket["job"]] = read_json(os.path.join(spool_folder(spool_dir, "jobs"), f"{ticket['job']}.json"))
+                files, output = process_ticket(ticket, jobs[ticket["job"]], sink, output_cache)
+            except (OSError, ValueError, configparser.Error) as e:
+                files, output = [], f"Error: Unable to read the job of the ticket: {e}"
+            record = {"ticket": ticket["ticket"], "worker": worker_id, "seconds": round(time.time() - start, 3), "files": files}
+            if len(files) == len(ticket["outputs"]):
+                write_json_atomic(os.path.join(spool_folder(spool_dir, "done"), f"{ticket['ticket']}.json"), record)
+                processed += 1
+                print(f"Done {ticket['ticket']}: {os.path.basename(ticket['image'])}, {len(files)} files ({record['seconds']} s)")
+            else:
+                record["output"] = output
+                write_json_atomic(os.path.join(spool_folder(spool_dir, "failed"), f"{ticket['ticket']}.json"), record)
+                failed += 1
+                print(f"Failed {ticket['ticket']}: {os.path.basename(ticket['image'])}")
+                print(output.rstrip())
+            try:
+                os.remove(claim_path)
+            except OSError:
+                pass  # expired and requeued meanwhile; the ticket will be redone
+            claim = None
+    except KeyboardInterrupt:
+        if claim is not None:
+            release_claim(spool_dir, claim[0], claim[1]["ticket"])
+    print(f"Worker {worker_id} finished: {processed} tickets done, {failed} failed.")
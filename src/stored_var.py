@@ -50,6 +50,9 @@ class CurrentSelection:
         self.all_options = {}
         # Additional controlers
         self.stop_requested = False
+        # Optional set of absolute input paths: gather_paths keeps only these (partial rebuilds).
+        self.paths_filter = None
+        self.num_paths_total = 0 # inputs gathered before paths_filter was applied
         
     def init_input_items(self, folders=None,images=None):
         self.clearinputs()
@@ -75,6 +78,12 @@ class CurrentSelection:
             # Add just the full file paths.
             paths.extend([full_path for full_path, _ in file_items])
             self.paths_rel.extend(file_items)
+        self.num_paths_total = len(paths)
+        if self.paths_filter is not None:
+            # Order and relative subfolders stay those of the full input set,
+            # so output names match the ones of a full run.
+            self.paths_rel = [item for item in self.paths_rel if os.path.abspath(item[0]) in self.paths_filter]
+            paths = [path for path, _ in self.paths_rel]
         self.paths = paths
 
     def clearinputs(self):
@@ -0,0 +1,184 @@
+import os
+import sys
+import time
+import select
+import ctypes
+import ctypes.util
+import vars.global_var as gv
+from src.budget_options import get_budget
+
+# --watch: regenerates the outputs of inputs that change on disk.
+# What changed is always decided by comparing scandir snapshots (mtime, size) of the
+# watched inputs. On Linux, inotify only wakes the loop up, so an idle watch costs
+# nothing; elsewhere the inputs are rescanned every gv.WATCH_POLL_INTERVAL_S.
+# Rebuilds wait until the inputs have been quiet for gv.WATCH_DEBOUNCE_S, because
+# editors often save in several steps (temporary file, rename, metadata).
+
+INOTIFY_MASK = (
+    0x00000002 |  # IN_MODIFY
+    0x00000004 |  # IN_ATTRIB
+    0x00000008 |  # IN_CLOSE_WRITE
+    0x00000040 |  # IN_MOVED_FROM
+    0x00000080 |  # IN_MOVED_TO
+    0x00000100 |  # IN_CREATE
+    0x00000200    # IN_DELETE
+)
+
+def scan_inputs(directories: list, images: list, extensions: set, recursive: bool) -> dict:
+    """Returns {absolute path: (mtime_ns, size)} of the watched input files."""
+    snapshot = {}
+    def scan_dir(folder):
+        try:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if recursive:
+                                scan_dir(entry.path)
+                        elif os.path.splitext(entry.name)[1][1:].lower() in extensions:
+                            stat = entry.stat()
+                            snapshot[os.path.abspath(entry.path)] = (stat.st_mtime_ns, stat.st_size)
+                    except OSError:
+                        pass
+        except OSError:
+            pass
+    for folder in directories:
+        scan_dir(folder)
+    for path in images:
+        try:
+            stat = os.stat(path)
+            snapshot[os.path.abspath(path)] = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            pass
+    return snapshot
+
+def changed_paths(old: dict, new: dict) -> set:
+    """Paths that are new or rewritten in the new snapshot (deleted ones need no rebuild)."""
+    return {path for path, state in new.items() if old.get(path) != state}
+
+class InotifyWaker:
+    """Blocks until something happens in the watched folders (Linux inotify through libc)."""
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watched = set()
+
+    def watch(self, folders):
+        """Adds folders not watched yet (new subfolders appear between rebuilds)."""
+        for folder in folders:
+            if folder not in self.watched:
+                if self.libc.inotify_add_watch(self.fd, os.fsencode(folder), INOTIFY_MASK) >= 0:
+                    self.watched.add(folder)
+
+    def wait(self, timeout: float = None) -> bool:
+        """True if events arrived within timeout; the pending events are discarded."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return False
+        try:
+            while os.read(self.fd, 65536):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+class PollWaker:
+    """Fallback without inotify: every wait is a fixed sleep followed by a rescan."""
+    def watch(self, folders):
+        pass
+
+    def wait(self, timeout: float = None) -> bool:
+        time.sleep(gv.WATCH_POLL_INTERVAL_S if timeout is None else min(timeout, gv.WATCH_POLL_INTERVAL_S))
+        return True
+
+    def close(self):
+        pass
+
+def create_waker():
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWaker()
+        except (OSError, AttributeError):
+            pass
+    return PollWaker()
+
+def watched_folders(directories: list, images: list, recursive: bool) -> set:
+    folders = {os.path.dirname(os.path.abspath(path)) for path in images}
+    for folder in directories:
+        folders.add(os.path.abspath(folder))
+        if recursive:
+            for root, dirs, _ in os.walk(folder):
+                folders.update(os.path.abspath(os.path.join(root, d)) for d in dirs)
+    return folders
+
+def expand_rebuild_set(changed: set, snapshot: dict) -> set:
+    """
+    Adds the inputs that share a file name with a changed one: their outputs can
+    collide and get _N suffixes in input order, so they are rebuilt together.
+    """
+    names = {os.path.splitext(os.path.basename(path))[0].lower() for path in changed}
+    return changed | {path for path in snapshot
+                      if os.path.splitext(os.path.basename(path))[0].lower() in names}
+
+def needs_full_rebuild(input_data) -> bool:
+    """A map or total BLP budget is spread over all outputs, so a partial rebuild would break it."""
+    blp = input_data.recieve_suboptions([gv.BLP_SETTINGS])
+    return bool(get_budget(blp, "map_size_budget") or get_budget(blp, "blp_total_budget"))
+
+def watch_inputs(input_data, run_generation):
+    """
+    Runs a full generation, then regenerates changed inputs until CTRL+C.
+    run_generation(input_data) performs one generation run.
+    """
+    input_options = input_data.recieve_suboptions([gv.OPTIONS_INPUT])
+    extensions = {ext.strip().lower() for ext in input_options.get("input_process_filetypes", "").split(",") if ext.strip()}
+    recursive = bool(input_options.get("input_process_subfolders", False))
+    directories = list(input_data.paths_folders)
+    images = list(input_data.paths_images)
+    full_rebuild = needs_full_rebuild(input_data)
+
+    waker = create_waker()
+    try:
+        run_generation(input_data)
+        if input_data.stop_requested:
+            return
+        # Snapshots are taken after each run, so outputs written next to the inputs
+        # (outputset_samedir) do not trigger another rebuild.
+        snapshot = scan_inputs(directories, images, extensions, recursive)
+        mode = "inotify" if isinstance(waker, InotifyWaker) else f"polling every {gv.WATCH_POLL_INTERVAL_S} s"
+        print(f"Watching {len(snapshot)} input files ({mode}). *Press CTRL+C to stop watching.")
+        while True:
+            waker.watch(watched_folders(directories, images, recursive))
+            waker.wait()
+            current = scan_inputs(directories, images, extensions, recursive)
+            if not changed_paths(snapshot, current) and current.keys() == snapshot.keys():
+                continue
+            # Debounce: rescan until nothing changed for WATCH_DEBOUNCE_S.
+            while True:
+                time.sleep(gv.WATCH_DEBOUNCE_S)
+                settled = scan_inputs(directories, images, extensions, recursive)
+                if settled == current:
+                    break
+                current = settled
+            changed = changed_paths(snapshot, current)
+            snapshot = current
+            if not changed:
+                continue
+            print(f"Changed: {', '.join(sorted(os.path.basename(path) for path in changed))}")
+            input_data.paths_filter = None if full_rebuild else expand_rebuild_set(changed, current)
+            input_data.stop_requested = False
+            run_generation(input_data)
+            input_data.paths_filter = None
+            if input_data.stop_requested:
+                return
+            snapshot = scan_inputs(directories, images, extensions, recursive)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        waker.close()
+        print("Stopped watching.")
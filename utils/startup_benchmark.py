@@ -0,0 +1,53 @@
+import os
+import sys
+import time
+import subprocess
+
+# Measures how long `main.py --cli` takes to start and checks which modules it imports.
+# The CLI must not import wx or the GUI package at all; the image codecs (pytoshop,
+# the compiled DDS/JPEG wrappers) are loaded on first use only.
+# Usage: python utils/startup_benchmark.py [max_seconds]
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+MAIN_SCRIPT = os.path.join(BASE_DIR, "main.py")
+RUNS = 7
+DEFAULT_MAX_SECONDS = 0.5
+FORBIDDEN_MODULES = ("wx", "gui", "external.pytoshop", "external.jpgwrapper", "external.imagecompress")
+
+def run_startup(extra_args):
+    """Wall time of one CLI start that stops right after argument checks."""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, MAIN_SCRIPT, "--cli", *extra_args], cwd=BASE_DIR, capture_output=True)
+    return time.perf_counter() - start
+
+def imported_modules(extra_args):
+    """Modules imported by a CLI start, from the -X importtime report."""
+    result = subprocess.run([sys.executable, "-X", "importtime", MAIN_SCRIPT, "--cli", *extra_args],
+                            cwd=BASE_DIR, capture_output=True, text=True)
+    modules = []
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            name = line.rsplit("|", 1)[1].strip()
+            if name != "imported package":
+                modules.append(name)
+    return modules
+
+def main():
+    max_seconds = float(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_MAX_SECONDS
+    failed = False
+    for label, extra_args in (("argument error", []), ("--help", ["--help"])):
+        timings = [run_startup(extra_args) for _ in range(RUNS)]
+        best = min(timings)
+        median = sorted(timings)[len(timings) // 2]
+        print(f"{label}: best {best * 1000:.0f} ms, median {median * 1000:.0f} ms (limit {max_seconds * 1000:.0f} ms)")
+        if best > max_seconds:
+            failed = True
+        forbidden = [m for m in imported_modules(extra_args)
+                     if any(m == f or m.startswith(f + ".") for f in FORBIDDEN_MODULES)]
+        if forbidden:
+            print(f"  imports modules the CLI must not load at startup: {', '.join(sorted(set(forbidden)))}")
+            failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
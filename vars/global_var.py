@@ -185,11 +185,19 @@ BLP_SETTINGS = {
         "blp_mipmap",
         "blp_progressive",
         "blp_compression",
+        "blp_size_budget",
+        "blp_total_budget",
+        "map_size_budget",
+        "blp_budget_metric",
     ],
     "update_preview" : { 
         "blp_mipmap" : False,
         "blp_progressive" : False,
         "blp_compression" : True,
+        "blp_size_budget" : True,
+        "blp_total_budget" : False,
+        "map_size_budget" : False,
+        "blp_budget_metric" : False,
     },
     "update_generate": False,
 }
@@ -225,7 +233,7 @@ OPTIONS_OUTPUT_PATH = {
     "update_generate": False,
 }
 HIDDEN_OPTIONS = []
-NON_CHECKBOX_OPTIONS = ["blp_mipmap","blp_compression","dds_type","input_process_filetypes"]
+NON_CHECKBOX_OPTIONS = ["blp_mipmap","blp_compression","blp_size_budget","blp_total_budget","map_size_budget","blp_budget_metric","dds_type","input_process_filetypes"]
 CONFIG_SECTIONS = {
      "format_dds" : "DDS",
      "format_blp" : "BLP",
@@ -237,6 +245,31 @@ DDS_MIPMAP_VALUES=["Auto","0","1","2","3","4","5","6","7","8"]
 BLP_MINCOMPRESSION=0
 BLP_MAXCOMPRESSION=100
 BLP_SLIDERDELAY_MS=200
+OUTPUT_ARCHIVE_COMPRESSIONS=["deflate","stored"] # --archive-compression choices for ZIP output archives
+DEDUP_LINK_MODES=["copy","hardlink","reflink"] # --dedup-links: how outputs of identical inputs are stored
+DEDUP_HASH_CACHE_MAXNUM=4096 # content hashes of input files kept per process
+RENDER_RESULT_CACHE_MAXNUM=16 # render_many and --pipe: encoded outputs of the latest inputs kept for their identical copies
+WATCH_POLL_INTERVAL_S=1.0 # --watch rescans the inputs this often where inotify is not available
+WATCH_DEBOUNCE_S=0.5 # --watch waits until the inputs are unchanged for this long before rebuilding
+SPOOL_LEASE_S=600 # --worker: a claimed ticket not finished within this time is queued again
+SPOOL_POLL_INTERVAL_S=2.0 # --worker: how often an idle worker looks for requeued tickets while others still work
+SERVE_SOCKET_FILENAME="serve.sock" # --serve / --client socket, in the user config folder
+SERVE_SOCKET_BACKLOG=16 # --client jobs that may wait while the server is busy
+GENERATION_MAX_CONCURRENCY=0 # stages run at once by the async generation (src/async_generator.py), 0 = number of CPUs
+PROGRESS_UPDATE_INTERVAL_S=0.1 # live progress (gauge, terminal line) is redrawn at most this often
+PREVIEW_DEBOUNCE_MS=50 # bursts of option changes within this delay trigger one output preview render
+PREVIEW_CACHE_SOURCES_MAXNUM=8 # decoded input images kept for the previews
+PREVIEW_CACHE_CELLS_MAXNUM=256 # rendered preview cells and input thumbnails kept for the previews
+PREVIEW_SOURCE_OVERSAMPLE=2 # cell-resolution previews decode inputs at this multiple of the cell size
+DISK_CACHE_DIRNAME="cache" # folder for image probes and thumbnails inside the user config folder
+DISK_CACHE_MAX_BYTES=32*1024*1024
+DISK_CACHE_EVICT_RATIO=0.8 # eviction trims the disk cache down to this share of DISK_CACHE_MAX_BYTES
+OUTPUT_CACHE_DIRNAME="output_cache" # --output-cache: folder for encoded outputs inside the user config folder
+OUTPUT_CACHE_MAX_BYTES=512*1024*1024
+OUTPUT_CACHE_VERSION=1 # bump when the renderer or an encoder changes its output, to invalidate old entries
+BLP_BUDGET_UNIT_BYTES=1024 # blp_size_budget, blp_total_budget and map_size_budget are given in KB, 0 disables them
+BLP_BUDGET_METRICS=["SSIM","PSNR"]
+MAP_BUDGET_QUALITY_POINTS=[10,25,40,55,70,80,90]
 BLP_MIPMAP_VALUES=["Auto","0","1","2","3","4","5","6","7","8"]
 INPUT_IMAGE_DEFAULT_TYPES = "png,jpg,jpeg,bmp,tga,dds,webp,blp,ico,psd"
 INPUT_IMAGES_MAXNUM=4
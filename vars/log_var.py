@@ -99,4 +99,32 @@ LOG_DATA={
         "Type": "ERROR",
         "local_message": "log_config_load_error",
     },
+    "output_budget_invalid" : { 
+        "Type": "WARNING",
+        "local_message": "log_output_budget_invalid",
+    },
+    "output_blp_budget_exceeded" : { 
+        "Type": "WARNING",
+        "local_message": "log_output_blp_budget_exceeded",
+    },
+    "output_blp_budget_summary" : { 
+        "Type": "INFO",
+        "local_message": "log_output_blp_budget_summary",
+    },
+    "output_map_budget_exceeded" : { 
+        "Type": "WARNING",
+        "local_message": "log_output_map_budget_exceeded",
+    },
+    "output_map_budget_summary" : { 
+        "Type": "INFO",
+        "local_message": "log_output_map_budget_summary",
+    },
+    "output_dedup_summary" : { 
+        "Type": "INFO",
+        "local_message": "log_output_dedup_summary",
+    },
+    "output_cache_summary" : { 
+        "Type": "INFO",
+        "local_message": "log_output_cache_summary",
+    },
 }